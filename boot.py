@@ -5,6 +5,14 @@
 # Import the `pyboard` library
 import pyb  # type:ignore
 
+# Complete a firmware update that was staged over BLE (see `src/ota.py`), even if it was cut off by a reset
+try:
+    from src.ota import apply_swap
+
+    apply_swap()
+except Exception as e:
+    print(f"Firmware Update Failed: {e}")
+
 # Enable USB serial and mass storage, then run `main.py`
 pyb.usb_mode("VCP+MSC")
 pyb.main("main.py")
@@ -3,16 +3,15 @@
 # It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
 
 # Import the necessary modules and classes
-import base64
 import json
 import os
 import shutil
 import zipfile
-from hashlib import sha256
 from typing import Annotated, Optional
 
 import typer
-from cryptography.fernet import Fernet, InvalidToken
+from cryptography.exceptions import InvalidTag
+from cryptography.fernet import InvalidToken
 
 from classes import Color
 
@@ -45,6 +44,7 @@ exclude_files = [
     ".gitignore",
     "requirements.txt",
     "classes.py",
+    ".sync_manifest.json",
     "ble_secrets.json" if excl_config else None,
 ]
 exclude_dirs = [
@@ -56,6 +56,10 @@ exclude_dirs = [
     "app",
     "assets",
     "build",
+    "tools",
+    "tests",
+    "logs",
+    "ota",
     "config" if excl_config else None,
 ]
 
@@ -138,7 +142,19 @@ def sync(
             help=f"The password to decrypt the firmware file (If it was encrypted, e.g. '{Color.colorize("password123", Color.CYAN)}')",
         ),
     ] = None,
+    verify: Annotated[
+        bool,
+        typer.Option(
+            ...,
+            "--verify",
+            "-v",
+            help="Hash the files on the drive instead of trusting its manifest, and check every copied file",
+        ),
+    ] = False,
 ):
+    from tools import bundle
+    from tools import sync as delta
+
     arduino_dir = rf"{disk}:"
 
     # Check if the drive exists
@@ -147,57 +163,38 @@ def sync(
         raise typer.Exit(code=1)
 
     try:
-        # Delete all files and directories in the Arduino drive
-        for root, dirs, files in os.walk(arduino_dir, topdown=False):
-            dirs[:] = [d for d in dirs if d not in exclude_dirs]
-
-            for name in files:
-                os.remove(os.path.join(root, name))
-            for name in dirs:
-                os.rmdir(os.path.join(root, name))
-
-        # Sync the firmware to the Arduino drive
+        # Sync the firmware to the Arduino drive: compare the file hashes with the manifest on the drive,
+        # then copy only the changed files and delete only the removed ones
         if not from_zip_path:
-            # Iterate through the current directory and copy the files to the Arduino drive
-            for root, dirs, files in os.walk(this_dir):
-                # Exclude the files and directories defined in the `exclude_files` and `exclude_dirs` lists
-                dirs[:] = [d for d in dirs if d not in exclude_dirs]
-                files[:] = [f for f in files if f not in exclude_files]
-
-                for dir in dirs:
-                    dir_path = os.path.join(root, dir)
-                    relative_path = os.path.relpath(dir_path, this_dir)
-                    shutil.copytree(dir_path, os.path.join(arduino_dir, relative_path))
-
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, this_dir)
-                    os.makedirs(
-                        os.path.dirname(os.path.join(arduino_dir, relative_path)),
-                        exist_ok=True,
-                    )
-                    shutil.copy(file_path, os.path.join(arduino_dir, relative_path))
+            # Sync from the current directory
+            source = delta.scan_directory(this_dir, exclude_files, exclude_dirs)
+            changes = delta.plan(source, arduino_dir, exclude_files, exclude_dirs, verify=verify)
+            summary = delta.apply(
+                lambda path: open(os.path.join(this_dir, path), "rb"),
+                arduino_dir,
+                changes,
+                exclude_dirs,
+                verify=verify,
+            )
         else:
-            # Extract the zip file to the Arduino drive
-            if password:
-                # Decrypt the zip file if the `password` is provided
-                with open(from_zip_path, "rb") as f:
-                    data = f.read()
-                hash_clipped_pwd = sha256(password.encode()).digest()[:32]
-                key = base64.urlsafe_b64encode(hash_clipped_pwd)
-                fernet = Fernet(key)
-                data = fernet.decrypt(data)
-                with open(from_zip_path, "wb") as f:
-                    f.write(data)
-
-            # Extract the zip file to the Arduino drive
-            with zipfile.ZipFile(from_zip_path, "r") as zipf:
-                zipf.extractall(arduino_dir)
-
-            # Encrypt the zip file again if the `password` is provided
-            if password:
-                with open(from_zip_path, "wb") as f:
-                    f.write(fernet.encrypt(data))
+            # Sync straight from the zip file, decrypting it on the fly if the `password` is provided
+            # (the zip file itself is never rewritten)
+            with bundle.open_firmware(from_zip_path, password) as f, zipfile.ZipFile(f) as zipf:
+                source = delta.scan_zip(zipf)
+                changes = delta.plan(source, arduino_dir, exclude_files, exclude_dirs, verify=verify)
+                summary = delta.apply(zipf.open, arduino_dir, changes, exclude_dirs, verify=verify)
+
+        # Print out the summary of the sync
+        typer.echo(
+            f"\n {Color.colorize(str(summary['copied']), Color.CYAN)} copied, "
+            f"{Color.colorize(str(summary['deleted']), Color.CYAN)} deleted, "
+            f"{Color.colorize(str(summary['unchanged']), Color.CYAN)} unchanged"
+            f"{' (verified)' if changes['verified'] else ''}"
+        )
+        typer.echo(
+            f" {summary['bytes_written']} of {summary['bytes_total']} bytes written "
+            f"({Color.colorize(str(summary['bytes_saved']), Color.GREEN)} bytes saved)"
+        )
 
         # Print out the success messages
         typer.echo("\nSync complete!\n")
@@ -210,7 +207,7 @@ def sync(
         typer.echo(f"\n{Color.colorize('ERROR', Color.RED)}: Invalid zip file! Maybe it's corrupted or encrypted...")
         typer.echo(f"{Color.colorize('INFO', Color.BLUE)}: If the file is encrypted, you can use the '{Color.colorize('--password', Color.CYAN)}' option to decrypt it\n")
         raise typer.Exit(code=1)
-    except InvalidToken:
+    except (InvalidToken, InvalidTag):
         typer.echo(f"\n{Color.colorize('ERROR', Color.RED)}: Invalid password! The file might be corrupted or the password is wrong\n")
         raise typer.Exit(code=1)
     except Exception as e:
@@ -243,6 +240,9 @@ def build(
         ),
     ] = False,
 ):
+    from tools import archive, bundle
+    from tools import sync as delta
+
     # Check if the password is at least 8 characters long
     if encrypt and len(encrypt) < 8:
         typer.echo(f"\n{Color.colorize('ERROR', Color.RED)}: Password must be at least 8 characters long!\n")
@@ -252,39 +252,34 @@ def build(
         # If `next_version` is true, increase the version.
         if next_version:
             __change_version__()
-        # Delete the build directory and create a new one
-        shutil.rmtree(os.path.join(this_dir, "build"), ignore_errors=True)
-        os.makedirs(os.path.join(this_dir, "build"), exist_ok=True)
-        with zipfile.ZipFile(
-            os.path.join(this_dir, "build", f"SSP_firmware_v{__get_version__()}.zip"),
-            "w",
-            compression=zipfile.ZIP_DEFLATED,
-            compresslevel=9,
-        ) as zipf:
-            # Iterate through the current directory and add the files to the zip file
-            for root, dirs, files in os.walk(this_dir):
-                # Exclude the files and directories defined in the `exclude_files` and `exclude_dirs` lists
-                dirs[:] = [d for d in dirs if d not in exclude_dirs]
-                files[:] = [f for f in files if f not in exclude_files]
-
-                for file in files:
-                    file_path = os.path.join(root, file)
-                    relative_path = os.path.relpath(file_path, this_dir)
-                    zipf.write(file_path, relative_path)
-
-        # Encrypt the firmware file if the `encrypt` option is provided
+        # Delete the previous firmware files, keeping the build cache
+        build_dir = os.path.join(this_dir, "build")
+        os.makedirs(build_dir, exist_ok=True)
+        for name in os.listdir(build_dir):
+            if name.startswith("SSP_firmware_v"):
+                os.remove(os.path.join(build_dir, name))
+
+        # Hash the included files in parallel and build the zip, reusing the cached artifact of an identical
+        # tree or the cached compressed blobs of the unchanged files. The file hashes are added as well,
+        # so `sync` can skip the unchanged files without reading them
+        source = delta.scan_directory(this_dir, exclude_files, exclude_dirs)
+        artifact, cached = archive.build(
+            this_dir,
+            source,
+            {delta.MANIFEST_NAME: json.dumps(source, sort_keys=True).encode()},
+            os.path.join(build_dir, ".cache"),
+            {"exclude_files": sorted(filter(None, exclude_files)), "exclude_dirs": sorted(filter(None, exclude_dirs))},
+        )
+
+        # Copy the zip file to the output, streaming it through the encryption if the `encrypt` option is provided
+        output = open(os.path.join(build_dir, f"SSP_firmware_v{__get_version__()}.zip"), "wb")
         if encrypt:
-            with open(os.path.join(this_dir, "build", f"SSP_firmware_v{__get_version__()}.zip"), "rb") as f:
-                data = f.read()
-            hash_clipped_pwd = sha256(encrypt.encode()).digest()[:32]
-            key = base64.urlsafe_b64encode(hash_clipped_pwd)
-            fernet = Fernet(key)
-            encrypted = fernet.encrypt(data)
-            with open(os.path.join(this_dir, "build", f"SSP_firmware_v{__get_version__()}.zip"), "wb") as f:
-                f.write(encrypted)
+            output = bundle.EncryptedWriter(output, encrypt)
+        with output, open(artifact, "rb") as f:
+            shutil.copyfileobj(f, output, 1 << 16)
 
         # Print out the success messages
-        typer.echo("\nBuild complete!")
+        typer.echo(f"\nBuild complete!{' (cached)' if cached else ''}")
         typer.echo(
             f"Output: {Color.colorize(os.path.join(this_dir, 'build', f"SSP_firmware_v{__get_version__()}.zip"), Color.PURPLE)}\n"
         )
@@ -300,7 +295,7 @@ def build(
         raise typer.Exit(code=1)
 
 # Main command to clean the build directory
-@app.command(help="Clean the build directory")
+@app.command(help="Clean the build directory (including the build cache)")
 def clean():
     try:
         # Delete the build directory and the `__pycache__` directory
@@ -312,6 +307,367 @@ def clean():
         typer.echo(f"\n{Color.colorize("ERROR", Color.RED)}: {e}\n")
         raise typer.Exit(code=1)
 
+# Main command to autotune the navigation parameters of the cleaning routine
+@app.command(help=f"Autotune the navigation parameters in simulated rooms (Output: '{Color.colorize('config/board_config.json', Color.PURPLE)}')")
+def tune(
+    rooms: Annotated[
+        int,
+        typer.Option(
+            ...,
+            "--rooms",
+            "-r",
+            help="The number of simulated room layouts to evaluate every parameter set in",
+        ),
+    ] = 8,
+    duration: Annotated[
+        float,
+        typer.Option(
+            ...,
+            "--duration",
+            "-d",
+            help="The simulated cleaning time per room (in seconds)",
+        ),
+    ] = 300.0,
+    workers: Annotated[
+        Optional[int],
+        typer.Option(
+            ...,
+            "--workers",
+            "-w",
+            show_default=False,
+            help="The number of worker processes (Defaults to the number of CPUs)",
+        ),
+    ] = None,
+    seed: Annotated[
+        int,
+        typer.Option(
+            ...,
+            "--seed",
+            "-s",
+            help="The seed of the first simulated room layout",
+        ),
+    ] = 0,
+    mode: Annotated[
+        str,
+        typer.Option(
+            ...,
+            "--mode",
+            "-m",
+            help=f"The cleaning mode to simulate ('{Color.colorize('reactive', Color.CYAN)}', '{Color.colorize('boustrophedon', Color.CYAN)}' or '{Color.colorize('edge', Color.CYAN)}')",
+        ),
+    ] = "reactive",
+    dry_run: Annotated[
+        Optional[bool],
+        typer.Option(
+            ...,
+            "--dry-run",
+            "-dr",
+            help="Print the best parameter set without writing it to the board config",
+        ),
+    ] = False,
+):
+    # Import the simulator lazily, as it depends on NumPy
+    import numpy as np
+
+    from tools import simulation
+
+    try:
+        # Simulate every parameter combination in every room and select the Pareto-best one
+        combos = simulation.parameter_grid()
+        typer.echo(f"\nSimulating {Color.colorize(str(len(combos)), Color.CYAN)} parameter sets in {Color.colorize(str(rooms), Color.CYAN)} rooms...")
+        stats = simulation.sweep(combos, list(range(seed, seed + rooms)), duration=duration, workers=workers, mode=mode)
+        best, front = simulation.select_best(stats)
+
+        # Print out the Pareto front, marking the selected parameter set
+        typer.echo(f"\nPareto front ({len(front)} of {len(combos)} parameter sets):")
+        for index in front[np.argsort(-stats["coverage"].mean(axis=1)[front])]:
+            marker = Color.colorize(">", Color.GREEN) if index == best else " "
+            values = ", ".join(f"{k}={v}" for k, v in combos[index].items())
+            typer.echo(
+                f" {marker} {values} | coverage: {stats['coverage'][index].mean():.1%}"
+                f" | rate: {stats['coverage_rate'][index].mean():.2f} m²/min"
+                f" | time: {stats['cleaning_time'][index].mean():.0f} s"
+                f" | redundancy: {stats['redundancy'][index].mean():.2f}"
+                f" | collisions: {stats['collisions'][index].mean():.2f}"
+                f" | stalls: {stats['stalls'][index].mean():.2f}"
+            )
+
+        # Write the selected parameter set into the board config
+        if not dry_run:
+            config_path = os.path.join(this_dir, "config", "board_config.json")
+            try:
+                with open(config_path, encoding="utf-8") as f:
+                    config = json.load(f)
+            except (FileNotFoundError, json.JSONDecodeError):
+                config = {}
+            config["navigation"] = combos[best]
+            with open(config_path, "w", encoding="utf-8") as f:
+                json.dump(config, f, indent=4)
+            typer.echo(f"\nTune complete! Output: {Color.colorize(config_path, Color.PURPLE)}\n")
+        else:
+            typer.echo(f"\n{Color.colorize('NOTE', Color.CYAN)}: Dry run, the board config was not changed\n")
+    except Exception as e:
+        # When an error occurs, print the error and exit
+        typer.echo(f"\n{Color.colorize("ERROR", Color.RED)}: {e}\n")
+        raise typer.Exit(code=1)
+
+# Main command to summarize a flight log pulled from the board
+@app.command(help="Summarize a flight log pulled from the board (e.g. 'logs/flight.bin')")
+def log(
+    path: Annotated[
+        str,
+        typer.Argument(
+            ...,
+            help="The path of the flight log",
+        ),
+    ],
+    csv: Annotated[
+        Optional[str],
+        typer.Option(
+            ...,
+            "--csv",
+            "-c",
+            show_default=False,
+            help="Export the sensor samples to this CSV file",
+        ),
+    ] = None,
+):
+    # Import the loader lazily, as it depends on NumPy
+    import numpy as np
+
+    from tools import flight_log
+
+    try:
+        # Memory-map the log and print out its summary
+        records = flight_log.load(path)
+        summary = flight_log.summary(records)
+        typer.echo(f"\nFlight log {Color.colorize(path, Color.PURPLE)}:")
+        for key, value in summary.items():
+            typer.echo(f" {key}: {Color.colorize(str(value), Color.CYAN)}")
+
+        # Export the sensor samples
+        if csv is not None:
+            samples = flight_log.sensors(records)
+            np.savetxt(
+                csv,
+                np.column_stack(list(samples.values())),
+                delimiter=",",
+                header=",".join(samples.keys()),
+                comments="",
+                fmt="%g",
+            )
+            typer.echo(f"\nExport complete! Output: {Color.colorize(csv, Color.PURPLE)}")
+        typer.echo()
+    except Exception as e:
+        # When an error occurs, print the error and exit
+        typer.echo(f"\n{Color.colorize("ERROR", Color.RED)}: {e}\n")
+        raise typer.Exit(code=1)
+
+# Main command to benchmark pipelined commands with the host client
+@app.command(name="bench-client", help="Benchmark sequential and pipelined commands with the host client")
+def bench_client(
+    count: Annotated[
+        int,
+        typer.Option(
+            ...,
+            "--count",
+            "-c",
+            help="The number of commands per run",
+        ),
+    ] = 200,
+    in_flight: Annotated[
+        int,
+        typer.Option(
+            ...,
+            "--in-flight",
+            "-i",
+            help="The maximum number of unanswered commands when pipelining",
+        ),
+    ] = 8,
+    address: Annotated[
+        Optional[str],
+        typer.Option(
+            ...,
+            "--address",
+            "-a",
+            show_default=False,
+            help="The BLE address of the robot (Defaults to a local stand-in of the command handler)",
+        ),
+    ] = None,
+    latency: Annotated[
+        float,
+        typer.Option(
+            ...,
+            "--latency",
+            "-l",
+            help="The one-way latency of the local stand-in (in seconds)",
+        ),
+    ] = 0.005,
+):
+    # Import the client lazily, as the BLE transport depends on `bleak`
+    import asyncio
+
+    from tools import client
+
+    try:
+        if address is None:
+            transport = client.LoopbackTransport(client.StandInRobot(latency=latency))
+        else:
+            transport = client.BleTransport(address)
+        results = asyncio.run(client.benchmark(transport, count=count, max_in_flight=in_flight))
+
+        # Print out the throughput and latency of both runs
+        typer.echo(f"\nBenchmark ({Color.colorize(str(count), Color.CYAN)} commands, {'robot ' + address if address else 'local stand-in'}):")
+        for name, result in results.items():
+            typer.echo(
+                f" {name}: {Color.colorize(f'{result['requests_per_second']:.1f}', Color.CYAN)} requests/s"
+                f" | latency mean: {result['mean']:.1f} ms | p50: {result['p50']:.1f} ms | max: {result['max']:.1f} ms"
+            )
+        typer.echo()
+    except Exception as e:
+        # When an error occurs, print the error and exit
+        typer.echo(f"\n{Color.colorize("ERROR", Color.RED)}: {e}\n")
+        raise typer.Exit(code=1)
+
+# Main command to update the firmware over BLE
+@app.command(help="Update the firmware over BLE with a bundle from the build command")
+def ota(
+    path: Annotated[
+        str,
+        typer.Argument(
+            ...,
+            help=f"The firmware bundle to send (e.g. '{Color.colorize("build/SSP_firmware_v1.0.0.zip", Color.PURPLE)}')",
+        ),
+    ],
+    password: Annotated[
+        Optional[str],
+        typer.Option(
+            ...,
+            "--password",
+            "-p",
+            show_default=False,
+            help="The password to decrypt the bundle with before sending it (If it was encrypted)",
+        ),
+    ] = None,
+    address: Annotated[
+        Optional[str],
+        typer.Option(
+            ...,
+            "--address",
+            "-a",
+            show_default=False,
+            help="The BLE address of the robot (Defaults to a local stand-in of the command handler)",
+        ),
+    ] = None,
+    window: Annotated[
+        Optional[int],
+        typer.Option(
+            ...,
+            "--window",
+            "-w",
+            show_default=False,
+            help="The number of frames in flight (Defaults to the robot's window)",
+        ),
+    ] = None,
+    loss: Annotated[
+        float,
+        typer.Option(
+            ...,
+            "--loss",
+            "-l",
+            help="The fraction of data frames the local stand-in loses",
+        ),
+    ] = 0.0,
+):
+    # Import the client lazily, as the BLE transport depends on `bleak`
+    import asyncio
+
+    from tools import bundle, client
+    from tools import ota as sender
+
+    async def __send__(transport, data):
+        async with client.RobotClient(transport) as robot:
+            return await sender.send_firmware(robot, data, window=window)
+
+    try:
+        # Read the bundle (decrypting it on the host, the robot only checks its hash)
+        with bundle.open_firmware(path, password) as f:
+            data = f.read()
+        if address is None:
+            stand_in = client.StandInRobot(loss=loss)
+            transport = client.LoopbackTransport(stand_in)
+        else:
+            transport = client.BleTransport(address)
+        result = asyncio.run(__send__(transport, data))
+
+        # Print out the throughput of the update
+        typer.echo(f"\nUpdate complete! ({'robot ' + address if address else 'local stand-in, staged in ' + stand_in.firmware_dir})")
+        typer.echo(
+            f" {result['bytes']} bytes in {result['seconds']:.2f} s: {Color.colorize(f'{result['kb_per_second']:.1f}', Color.CYAN)} KB/s"
+            f" | {result['frames']} frames, {result['resends']} resends, {result['timeouts']} timeouts"
+            f"{f' | resumed from {result['resumed_from']}' if result['resumed_from'] else ''}"
+        )
+        typer.echo(f" {result['files']} files staged, the robot swaps them in after its reset\n")
+    except Exception as e:
+        # When an error occurs, print the error and exit
+        typer.echo(f"\n{Color.colorize("ERROR", Color.RED)}: {e}\n")
+        raise typer.Exit(code=1)
+
+# Main command to benchmark the firmware encryption
+@app.command(name="bench-crypto", help="Benchmark the chunked firmware encryption on a large bundle")
+def bench_crypto(
+    size: Annotated[
+        int,
+        typer.Option(
+            ...,
+            "--size",
+            "-s",
+            help="The size of the bundle (in MB)",
+        ),
+    ] = 64,
+):
+    from tools import bundle
+
+    try:
+        results = bundle.benchmark(size_mb=size)
+
+        # Print out the throughput of the chunked and the single-token encryption
+        typer.echo(f"\nEncryption benchmark ({Color.colorize(f'{size} MB', Color.CYAN)}):")
+        typer.echo(f" chunked: encrypt {Color.colorize(f'{results['encrypt']:.0f}', Color.CYAN)} MB/s | decrypt {Color.colorize(f'{results['decrypt']:.0f}', Color.CYAN)} MB/s | overhead {results['overhead']:.3%}")
+        typer.echo(f" legacy (single token): encrypt {results['legacy_encrypt']:.0f} MB/s | decrypt {results['legacy_decrypt']:.0f} MB/s\n")
+    except Exception as e:
+        # When an error occurs, print the error and exit
+        typer.echo(f"\n{Color.colorize("ERROR", Color.RED)}: {e}\n")
+        raise typer.Exit(code=1)
+
+# Main command to benchmark the sensor math on the host
+@app.command(name="bench-math", help="Check the fixed-point sensor math and benchmark it on the host (the robot answers 'bench_sensor_math' with its own numbers)")
+def bench_math(
+    samples: Annotated[
+        int,
+        typer.Option(
+            ...,
+            "--samples",
+            "-s",
+            help="The number of samples per path",
+        ),
+    ] = 20000,
+):
+    from src import fastmath
+
+    try:
+        results = fastmath.benchmark(samples)
+
+        # Print out the samples per second of every path and the heading error of the fixed-point path
+        typer.echo("\nSensor math (host, without the code emitters):")
+        for path in ("heading_float", "heading_fixed", "echo_bytecode", "echo_fixed"):
+            typer.echo(f" {path}: {Color.colorize(str(results[path]), Color.CYAN)} samples/s")
+        typer.echo(f" max heading error: {results['max_error_cdeg'] / 100:.2f}°\n")
+    except Exception as e:
+        # When an error occurs, print the error and exit
+        typer.echo(f"\n{Color.colorize("ERROR", Color.RED)}: {e}\n")
+        raise typer.Exit(code=1)
+
 # Main command to print out the firmware version
 @app.command(help="Print the current firmware version and exit")
 def version():
@@ -7,15 +7,20 @@ import asyncio
 
 from src.cleaning_robot import CleaningRobot
 from src.connections import ConnectionManager
+from src.logger import Logger
 
-# Create instances of the `ConnectionManager` and `CleaningRobot` classes
+# Create the `ConnectionManager` instance first, so the robot advertises before the hardware is up
 connection_manager = ConnectionManager()
-robot = CleaningRobot()
+logger = Logger()
 
 
 # Define the main function
 async def main():
-    # Run the robot's main loop
+    # Bring up the robot once advertising has started, then run its main loop
+    await asyncio.sleep(0)
+    robot = CleaningRobot()
+    await robot.initialize()
+    logger.info(f"Boot: advertising after {connection_manager.advertising_ms} ms, {robot.boot_report}")
     while True:
         # If the start/stop button is pressed, start or stop the cleaning routine
         if robot.startstop_button.is_pressed:
@@ -35,8 +40,9 @@ async def main():
         await asyncio.sleep(0.01)
 
 
-# Run the main function and the connection manager in parallel
+# Start advertising, then run the main function in parallel, and drain the log in the background
 loop = asyncio.get_event_loop()
-loop.create_task(main())
 loop.create_task(connection_manager.initialize())
+loop.create_task(main())
+loop.create_task(logger.run())
 loop.run_forever()
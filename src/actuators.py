@@ -3,7 +3,7 @@
 # It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
 
 # Import the necessary libraries
-from machine import Pin  # type: ignore
+from machine import Pin, disable_irq, enable_irq  # type: ignore
 from pyb import Timer  # type: ignore
 
 from src.config import BoardConfigManager
@@ -32,6 +32,7 @@ class Motor:
             pin=ena_pin,
         )
         # Set the initial speed and stop the motor
+        self.__direction__ = 0
         self.stop()
         self.speed = initial_speed
 
@@ -44,20 +45,149 @@ class Motor:
     @speed.setter
     def speed(self, speed: int):
         # Set the speed of the motor
-        self.__speed__ = 100 if speed > 100 else (0 if speed < 0 else speed)
-        self.__enable_pin__.pulse_width_percent(self.__speed__)
+        self.__write_duty__(100 if speed > 100 else (0 if speed < 0 else speed))
+
+    # Define the `direction` property (1: forward, -1: backwards, 0: stopped)
+    @property
+    def direction(self):
+        return self.__direction__
+
+    # Define the `__write_duty__` method
+    def __write_duty__(self, duty: int):
+        # Write the (already clamped) `duty` to the enable pin
+        self.__speed__ = duty
+        self.__enable_pin__.pulse_width_percent(duty)
+
+    # Define the `__write_direction__` method
+    def __write_direction__(self, direction: int):
+        # Write the `direction` to the two direction pins
+        self.__pin1__.value(direction < 0)
+        self.__pin2__.value(direction > 0)
+        self.__direction__ = direction
 
     # Define the `forward` method
     def forward(self):
-        self.__pin1__.off()
-        self.__pin2__.on()
+        self.__write_direction__(1)
 
     # Define the `backwards` method
     def backwards(self):
-        self.__pin1__.on()
-        self.__pin2__.off()
+        self.__write_direction__(-1)
 
     # Define the `stop` method
     def stop(self):
-        self.__pin1__.off()
-        self.__pin2__.off()
+        self.__write_direction__(0)
+
+
+# Define the `DifferentialDrive` class
+class DifferentialDrive:
+    # Define the `__init__` method
+    def __init__(self, motor_left: Motor, motor_right: Motor):
+        # Drive the two motors together, caching their direction and duty
+        self.__motor_left__ = motor_left
+        self.__motor_right__ = motor_right
+        self.__updates__ = 0
+        self.__skipped__ = 0
+        self.__writes__ = 0
+        self.__naive_writes__ = 0
+        self.__listeners__ = []
+        self.__inhibited__ = False
+
+    # Define the `subscribe` method
+    def subscribe(self, callback):
+        # Call `callback(left_direction, right_direction, left_speed, right_speed)` after every applied update
+        self.__listeners__.append(callback)
+
+    # Define the `inhibited` property
+    @property
+    def inhibited(self):
+        return self.__inhibited__
+
+    # Define the `emergency_stop` method
+    def emergency_stop(self):
+        # Cut the duty of both motors and hold it at 0 until `release` is called.
+        # This is safe to call from an interrupt handler (it neither allocates nor notifies the listeners)
+        self.__inhibited__ = True
+        self.__motor_left__.__write_duty__(0)
+        self.__motor_right__.__write_duty__(0)
+
+    # Define the `release` method
+    def release(self):
+        # Allow non-zero duties again (the duties stay at 0 until the next update sets them)
+        self.__inhibited__ = False
+
+    # Define the `stats` property
+    @property
+    def stats(self):
+        # Return the number of updates, skipped no-op updates and GPIO/PWM writes, compared to
+        # the writes needed without caching (4 direction pins per command, 2 duties per speed change)
+        return {
+            "updates": self.__updates__,
+            "skipped": self.__skipped__,
+            "writes": self.__writes__,
+            "naive_writes": self.__naive_writes__,
+        }
+
+    # Define the `apply` method
+    def apply(
+        self,
+        left_direction: int,
+        right_direction: int,
+        left_speed: int | None = None,
+        right_speed: int | None = None,
+    ):
+        # Apply the direction (and optionally the duty) of both motors as one update
+        left = self.__motor_left__
+        right = self.__motor_right__
+        # Without caching, every command writes the 4 direction pins, and both duties whenever a speed is given
+        self.__naive_writes__ += 4 if left_speed is None and right_speed is None else 6
+        if left_speed is None:
+            left_speed = left.speed
+        else:
+            left_speed = 100 if left_speed > 100 else (0 if left_speed < 0 else left_speed)
+        if right_speed is None:
+            right_speed = right.speed
+        else:
+            right_speed = 100 if right_speed > 100 else (0 if right_speed < 0 else right_speed)
+        self.__updates__ += 1
+        if self.__inhibited__:
+            left_speed = right_speed = 0
+
+        # Skip the update if nothing changes
+        left_turns = left_direction != left.direction
+        right_turns = right_direction != right.direction
+        if not (left_turns or right_turns or left_speed != left.speed or right_speed != right.speed):
+            self.__skipped__ += 1
+            return
+
+        # Update both motors with interrupts disabled, cutting the duty of the motors that change
+        # direction first (break before make), so neither wheel briefly runs in a stale direction
+        writes = 0
+        state = disable_irq()
+        try:
+            # Check the latch again with interrupts disabled: the timer interrupt may have cut the motors
+            # since the check above, and writing the old duty back would undo the emergency stop
+            if self.__inhibited__:
+                left_speed = right_speed = 0
+            if left_turns and left.speed:
+                left.__write_duty__(0)
+                writes += 1
+            if right_turns and right.speed:
+                right.__write_duty__(0)
+                writes += 1
+            if left_turns:
+                left.__write_direction__(left_direction)
+                writes += 2
+            if right_turns:
+                right.__write_direction__(right_direction)
+                writes += 2
+            if left_speed != left.speed:
+                left.__write_duty__(left_speed)
+                writes += 1
+            if right_speed != right.speed:
+                right.__write_duty__(right_speed)
+                writes += 1
+        finally:
+            enable_irq(state)
+        self.__writes__ += writes
+        for callback in self.__listeners__:
+            callback(left_direction, right_direction, left_speed, right_speed)
@@ -0,0 +1,163 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import asyncio
+import time
+
+from machine import I2C  # type: ignore
+from micropython import const  # type:ignore
+
+from src.logger import Logger
+
+
+# Define the `I2CBus` class
+class I2CBus:
+    # Define the class constants: the attempts per transaction, the first backoff (doubled on every retry)
+    # and the largest register gap bridged when merging reads into one burst
+    RETRIES = const(3)
+    BACKOFF_MS = const(1)
+    MAX_GAP = const(2)
+
+    # Define the `__init__` method
+    def __init__(self, bus_id: int, freq: int = 400000):
+        # Share the I2C bus `bus_id` between the drivers on it: async transactions are serialised through
+        # a lock, sync transactions never yield, so neither can interleave with another transaction
+        self.__bus_id__ = bus_id
+        self.__freq__ = freq
+        self.__i2c__ = I2C(bus_id, freq=freq)
+        self.__lock__ = asyncio.Lock()
+        self.__logger__ = Logger()
+        # Per device: transactions, bytes, errors, retries, total and worst latency (in us)
+        self.__stats__ = {}
+        self.__recoveries__ = 0
+
+    # Define the `stats` property
+    @property
+    def stats(self):
+        devices = {}
+        for address, (transactions, count, errors, retries, total_us, worst_us) in self.__stats__.items():
+            devices[f"0x{address:02X}"] = {
+                "transactions": transactions,
+                "bytes": count,
+                "errors": errors,
+                "retries": retries,
+                "mean_us": total_us // transactions if transactions else 0,
+                "worst_us": worst_us,
+            }
+        return {"recoveries": self.__recoveries__, "devices": devices}
+
+    # Define the `__transfer__` method
+    def __transfer__(self, address: int, reg: int, buffer, read: bool):
+        # Run one register transaction, returning the error instead of raising it
+        try:
+            if read:
+                self.__i2c__.readfrom_mem_into(address, reg, buffer)
+            else:
+                self.__i2c__.writeto_mem(address, reg, buffer)
+            return None
+        except OSError as e:
+            return e
+
+    # Define the `__recover__` method
+    def __recover__(self, address: int, error: OSError):
+        # Re-initialise the peripheral, which resets the controller after a NACK or timeout (a slave holding
+        # SDA low is not clocked out by this)
+        self.__recoveries__ += 1
+        self.__logger__.warning(f"I2C BUS {self.__bus_id__} RECOVERY (0x{address:02X}): {error}")
+        self.__i2c__ = I2C(self.__bus_id__, freq=self.__freq__)
+
+    # Define the `__record__` method
+    def __record__(self, address: int, count: int, start: int, retries: int, failed: bool):
+        stats = self.__stats__.get(address)
+        if stats is None:
+            stats = self.__stats__[address] = [0, 0, 0, 0, 0, 0]
+        elapsed = time.ticks_diff(time.ticks_us(), start)  # type: ignore
+        stats[0] += 1
+        stats[1] += count
+        stats[2] += failed
+        stats[3] += retries
+        stats[4] += elapsed
+        if elapsed > stats[5]:
+            stats[5] = elapsed
+
+    # Define the `__run__` method
+    def __run__(self, address: int, reg: int, buffer, read: bool):
+        # Run a transaction, retrying with a doubling backoff and a bus recovery after every NACK or timeout
+        start = time.ticks_us()  # type: ignore
+        backoff = self.BACKOFF_MS
+        for attempt in range(self.RETRIES):
+            error = self.__transfer__(address, reg, buffer, read)
+            if error is None:
+                self.__record__(address, len(buffer), start, attempt, False)
+                return
+            if attempt == self.RETRIES - 1:
+                break
+            self.__recover__(address, error)
+            time.sleep_ms(backoff)  # type: ignore
+            backoff *= 2
+        self.__record__(address, 0, start, self.RETRIES - 1, True)
+        raise OSError(f"I2C device 0x{address:02X} failed at register 0x{reg:02X}: {error}")
+
+    # Define the `__run_async__` method
+    async def __run_async__(self, address: int, reg: int, buffer, read: bool):
+        # Run a transaction like `__run__`, holding the bus lock and yielding to other tasks while backing off
+        async with self.__lock__:
+            start = time.ticks_us()  # type: ignore
+            backoff = self.BACKOFF_MS
+            for attempt in range(self.RETRIES):
+                error = self.__transfer__(address, reg, buffer, read)
+                if error is None:
+                    self.__record__(address, len(buffer), start, attempt, False)
+                    return
+                if attempt == self.RETRIES - 1:
+                    break
+                self.__recover__(address, error)
+                await asyncio.sleep_ms(backoff)  # type: ignore
+                backoff *= 2
+            self.__record__(address, 0, start, self.RETRIES - 1, True)
+            raise OSError(f"I2C device 0x{address:02X} failed at register 0x{reg:02X}: {error}")
+
+    # Define the `read_into` method
+    def read_into(self, address: int, reg: int, buffer):
+        # Read `len(buffer)` bytes starting at register `reg` into the `buffer` (without yielding)
+        self.__run__(address, reg, buffer, True)
+
+    # Define the `write` method
+    def write(self, address: int, reg: int, data):
+        # Write the `data` starting at register `reg` (without yielding)
+        self.__run__(address, reg, data, False)
+
+    # Define the `read_into_async` method
+    async def read_into_async(self, address: int, reg: int, buffer):
+        await self.__run_async__(address, reg, buffer, True)
+
+    # Define the `write_async` method
+    async def write_async(self, address: int, reg: int, data):
+        await self.__run_async__(address, reg, data, False)
+
+    # Define the `read_many` method
+    async def read_many(self, address: int, requests: list, max_gap: int = MAX_GAP):
+        # Read the (register, length) `requests` of one device, merging registers that are adjacent
+        # (or at most `max_gap` apart) into one burst transaction. Returns a memoryview per request
+        order = sorted(range(len(requests)), key=lambda index: requests[index][0])
+        results = [None] * len(requests)
+        index = 0
+        while index < len(order):
+            # Grow the burst while the next request starts close enough to its end
+            first = requests[order[index]][0]
+            end = first + requests[order[index]][1]
+            last = index
+            while last + 1 < len(order) and requests[order[last + 1]][0] <= end + max_gap:
+                reg, length = requests[order[last + 1]]
+                end = max(end, reg + length)
+                last += 1
+            buffer = bytearray(end - first)
+            await self.read_into_async(address, first, buffer)
+            view = memoryview(buffer)
+            for position in range(index, last + 1):
+                reg, length = requests[order[position]]
+                results[order[position]] = view[reg - first : reg - first + length]
+            index = last + 1
+        return results
@@ -4,14 +4,26 @@
 
 # Import the necessary libraries
 import asyncio
+import math
+import time
 
-from machine import I2C, Pin  # type: ignore
+from machine import Pin  # type: ignore
 from micropython import const  # type:ignore
 
-from src.actuators import Motor
-from src.config import BoardConfigManager, Singleton
+from src.actuators import DifferentialDrive, Motor
+from src.bus import I2CBus
+from src.config import BoardConfigManager, LazyDevice, ParameterStore, Singleton
 from src.gpio import Button
-from src.sensors import Magnetometer, UltrasonicSensor
+from src.localization import PoseEstimator
+from src.logger import Logger
+from src.mapping import OccupancyGrid
+from src.memory import MemoryMonitor
+from src.planning import BoustrophedonPlanner
+from src.recorder import FlightRecorder
+from src.safety import SafetyMonitor
+from src.sensors import Gyroscope, HeadingFilter, Magnetometer, UltrasonicSensor
+from src.stall import StallDetector, StallError
+from src.status import StatusSnapshot
 
 
 # Define the `CleaningRobot` class
@@ -23,22 +35,90 @@ class CleaningRobot:
     FRONT_DISTANCE = const(400)
     SIDE_DISTANCE = const(200)
     TURN_DISTANCE = const(450)
+    BRUSH_WIDTH = const(260)
+    LANE_OVERLAP = const(20)
+    FRONT_RANGE = const(1500)
+    SIDE_RANGE = const(1000)
+    MODES = ("reactive", "boustrophedon", "edge")
+    # Define the wall following of the edge mode: the distance kept to the wall (in mm), the readings
+    # beyond reach that confirm an outside corner, the largest proportional steering (as a fraction of the
+    # drive speed, bounding the angle towards the wall) and the smoothing of the range rate
+    EDGE_DISTANCE = const(100)
+    EDGE_LOST_READINGS = const(3)
+    EDGE_MAX_STEER = 0.15
+    EDGE_D_FILTER = 0.6
+    # Define the stall recovery manoeuvre: back off, then pivot away (in ms)
+    STALL_BACK_OFF_MS = const(400)
+    STALL_PIVOT_MS = const(300)
+    # Define the sampling policy: (period in ms, pulse count) of the front and side sensors per motion state,
+    # where `None` samples nothing. While driving, the policy moves from `cruising` to `approaching`
+    # as the front range falls from twice the front distance to the front distance
+    SAMPLING = {
+        "cruising": {"front": (0, 2), "side": (300, 1)},
+        "approaching": {"front": (0, 4), "side": (100, 3)},
+        "deciding": {"front": (0, 5), "side": (0, 5)},
+        "following": {"front": (0, 1), "side": (0, 2)},
+        "turning": None,
+        "idle": None,
+    }
 
     # Define the `__init__` method
     def __init__(self):
-        # Define the `Motor` instances
+        # Load the navigation parameters (e.g. tuned with `build.py tune`), falling back to the class constants
         self.__board_config_manager__ = BoardConfigManager()
+        self.__logger__ = Logger()
+        self.__navigation__ = ParameterStore(
+            "navigation",
+            {
+                "drive_speed": self.DRIVE_SPEED,
+                "turn_speed": self.TURN_SPEED,
+                "front_distance": self.FRONT_DISTANCE,
+                "side_distance": self.SIDE_DISTANCE,
+                "turn_distance": self.TURN_DISTANCE,
+                "edge_distance": self.EDGE_DISTANCE,
+                "edge_kp": 0.2,
+                "edge_kd": 0.1,
+            },
+            limits={
+                "drive_speed": (0, 100),
+                "turn_speed": (0, 100),
+                "front_distance": (20, 5000),
+                "side_distance": (20, 5000),
+                "turn_distance": (20, 5000),
+                "edge_distance": (50, 500),
+                "edge_kp": (0.0, 2.0),
+                "edge_kd": (0.0, 2.0),
+            },
+        )
+        # Define the `Motor` instances
         self.__motor_left__ = Motor(
             pin1="D6",
             pin2="D7",
             enable_pin="D3",
-            initial_speed=self.DRIVE_SPEED,
+            initial_speed=self.__navigation__["drive_speed"],
         )
         self.__motor_right__ = Motor(
             pin1="D5",
             pin2="D4",
             enable_pin="D2",
-            initial_speed=self.DRIVE_SPEED,
+            initial_speed=self.__navigation__["drive_speed"],
+        )
+        self.__drive__ = DifferentialDrive(self.__motor_left__, self.__motor_right__)
+        # Define the `StatusSnapshot` instance, updated whenever the reported state changes
+        self.__status__ = StatusSnapshot(
+            {
+                "is_cleaning": False,
+                "firmware_version": self.__board_config_manager__.get("firmware_version", "UNKNOWN"),
+                "brush_set": {"brush": "both", "value": [False, False]},
+                "speed_set": self.__navigation__["drive_speed"],
+                "mode": self.mode,
+            }
+        )
+        self.__drive__.subscribe(
+            lambda left_direction, right_direction, left_speed, right_speed: self.__status__.set(
+                "speed_set",
+                round((left_speed + right_speed) / 2),
+            )
         )
         self.__motor_main_brush__ = Pin(
             self.__board_config_manager__.pin_map["D24"],
@@ -61,21 +141,98 @@ class CleaningRobot:
             trigger_pin="D12",
             echo_pin="D13",
         )
-        # Define the `Magnetometer` instance
-        self.__magnetometer__ = Magnetometer(
-            I2C(2, freq=400000),
-            config={
-                "declination": {
-                    "degrees": 3,
-                    "minutes": 37,
+        # Keep the latest reading of every sensor for the sampling policy
+        self.__motion_state__ = "idle"
+        self.__distance__ = {"left": -1, "front": -1, "right": -1}
+        self.__sampled__ = {"left": 0, "front": 0, "right": 0}
+        self.__samples__ = {"left": 0, "front": 0, "right": 0}
+        self.__loop_stats__ = [0, 0]
+        self.__edge_stats__ = {}
+        self.__fresh__ = {}
+        # Gate the echo timeouts to the ranges the routine cares about
+        # (the response times are measured in the background by `initialize`)
+        self.__apply_sensor_ranges__()
+        # Define the `Magnetometer` instance, brought up on first use or by `initialize`
+        # (its config write also rewrites the board config file, so it stays out of the constructor)
+        self.__boot_timing__ = {}
+        self.__ready_ms__ = None
+        # Define the shared `I2CBus` instance (every driver on the bus goes through it)
+        self.__i2c_bus__ = I2CBus(2, freq=400000)
+        self.__magnetometer__ = LazyDevice(
+            "magnetometer",
+            lambda: Magnetometer(
+                self.__i2c_bus__,
+                config={
+                    "declination": {
+                        "degrees": 3,
+                        "minutes": 37,
+                    },
                 },
-            },
+            ),
+            self.__boot_timing__,
+        )
+        # Define the `Gyroscope` instance (an MPU-6050-class IMU on the same bus) and the `HeadingFilter`
+        # fusing it with the magnetometer, which is the heading source of the turns and the pose estimator
+        self.__gyroscope__ = LazyDevice(
+            "gyroscope",
+            lambda: Gyroscope(self.__i2c_bus__),
+            self.__boot_timing__,
         )
+        self.__heading__ = HeadingFilter(self.__magnetometer__, self.__gyroscope__)
         # Define the `Button` instance
         self.__startstop_button__ = Button(
             pin="D22",
             pull=Pin.PULL_DOWN,
         )
+        # Define the `PoseEstimator` instance (its task is started with the first cleaning routine)
+        self.__pose_estimator__ = PoseEstimator(
+            self.__motor_left__,
+            self.__motor_right__,
+            self.__heading__,
+        )
+        self.__pose_task__ = None
+        # Define the `OccupancyGrid` instance
+        self.__map__ = OccupancyGrid()
+        # Define the `BoustrophedonPlanner` instance with lanes spaced to the brush width
+        self.__planner__ = BoustrophedonPlanner(
+            self.__map__,
+            self.BRUSH_WIDTH - self.LANE_OVERLAP,
+        )
+        # Define the `FlightRecorder` instance, recording every applied motor command
+        # (its flush task is started with the first cleaning routine)
+        self.__recorder__ = FlightRecorder()
+        self.__recorder_task__ = None
+        self.__drive__.subscribe(self.__recorder__.motors)
+        # Define the `SafetyMonitor` instance, cutting the motors from a timer interrupt
+        # (it only acts while armed by a cleaning routine)
+        self.__safety__ = SafetyMonitor(
+            self.__drive__,
+            self.__motor_left__,
+            self.__motor_right__,
+            self.__ultrasonic_sensor_front__,
+        )
+        self.__safety__.start()
+        # Define the `MemoryMonitor` instance, measuring the heap use of the control loops
+        # (in strict mode, the collector only runs at lane boundaries and idle points during a routine)
+        self.__memory__ = MemoryMonitor()
+        self.__lane_section__ = self.__memory__.section("lane")
+        self.__turn_section__ = self.__memory__.section("turn")
+        # Define the `StallDetector` instance, comparing the commanded motion with the front range and the heading
+        # (a wedged robot or a jammed wheel triggers a bounded recovery manoeuvre instead of pushing on)
+        self.__stall_params__ = ParameterStore(
+            "stall",
+            StallDetector.DEFAULTS,
+            limits={
+                "window_ms": (500, 10000),
+                "progress": (1, 100),
+                "min_travel": (20, 2000),
+                "min_turn": (1, 90),
+                "attempts": (0, 10),
+            },
+        )
+        self.__stall__ = StallDetector(self.__stall_params__.get_params())
+        # No motion script is running yet
+        self.__script_task__ = None
         # Set the `is_cleaning` attribute to `False`
         self.__is_cleaning__ = False
         self.stop()
@@ -90,6 +247,79 @@ class CleaningRobot:
     def magnetometer(self):
         return self.__magnetometer__
 
+    # Define the `heading` property
+    @property
+    def heading(self):
+        return self.__heading__
+
+    # Define the `pose_estimator` property
+    @property
+    def pose_estimator(self):
+        return self.__pose_estimator__
+
+    # Define the `map` property
+    @property
+    def map(self):
+        return self.__map__
+
+    # Define the `planner` property
+    @property
+    def planner(self):
+        return self.__planner__
+
+    # Define the `status` property
+    @property
+    def status(self):
+        return self.__status__
+
+    # Define the `safety` property
+    @property
+    def safety(self):
+        return self.__safety__
+
+    # Define the `get_stall_stats` method
+    def get_stall_stats(self):
+        # Return the stalls detected since the routine started and the time spent recovering from them
+        return self.__stall__.stats
+
+    # Define the `get_stall_params` method
+    def get_stall_params(self):
+        return self.__stall_params__.get_params()
+
+    # Define the `set_stall_param` method
+    def set_stall_param(self, name: str, value: int):
+        # Update a stall detection parameter, the detector picks it up with the next routine
+        return self.__stall_params__.set_param(name, value)
+
+    # Define the `memory` property
+    @property
+    def memory(self):
+        return self.__memory__
+
+    # Define the `i2c_bus` property
+    @property
+    def i2c_bus(self):
+        return self.__i2c_bus__
+
+    # Define the `recorder` property
+    @property
+    def recorder(self):
+        return self.__recorder__
+
+    # Define the `mode` property
+    @property
+    def mode(self):
+        return self.__board_config_manager__.get("cleaning_mode", "reactive")
+
+    # Define the `mode` setter
+    @mode.setter
+    def mode(self, mode: str):
+        # Set the cleaning mode used by the next cleaning routine
+        if mode not in self.MODES:
+            raise ValueError("Invalid cleaning mode")
+        self.__board_config_manager__.set("cleaning_mode", mode)
+        self.__status__.set("mode", mode)
+
     # Define the `is_cleaning` property
     @property
     def is_cleaning(self):
@@ -99,19 +329,155 @@ class CleaningRobot:
 
         return self.__is_cleaning__ and not self.__routine_task__.done()
 
+    # Define the `is_scripting` property
+    @property
+    def is_scripting(self):
+        # Check if a motion script task is running
+        return self.__script_task__ is not None and not self.__script_task__.done()
+
     # When deleting the object, stop the motors and set the magnetometer to inactive
     def __del__(self):
         self.stop_routine()
-        self.__magnetometer__.config = {"mode": "standby"}
+        if self.__magnetometer__.ready:
+            self.__magnetometer__.get().config = {"mode": "standby"}
+
+    # Define the `initialize` method
+    async def initialize(self):
+        # Bring up the peripherals that need time as concurrent tasks, timing each of them
+        async def __characterize__():
+            # Measure the ultrasonic sensors one after another, so their pulses do not interfere
+            for name, sensor in self.__ultrasonic_sensors__().items():
+                start = time.ticks_ms()  # type: ignore
+                timing = await sensor.characterize(samples=3)
+                self.__boot_timing__[f"ultrasonic_{name}"] = time.ticks_diff(time.ticks_ms(), start)  # type: ignore
+                self.__logger__.info(f"US Sensor {name}: {timing}")
+
+        async def __magnetometer__():
+            # Bring up the magnetometer while the ultrasonic sensors wait for their echoes to die out
+            # (it is created on first use anyway, should the routine start before this task runs)
+            await asyncio.sleep_ms(0)  # type: ignore
+            self.__magnetometer__.get()
+            # Then measure the gyro bias while the robot still stands still
+            bias = await self.__heading__.start()
+            self.__logger__.info(f"Heading: fused={self.__heading__.fused} bias={bias}")
+
+        await asyncio.gather(__characterize__(), __magnetometer__())
+        self.__ready_ms__ = time.ticks_ms()  # type: ignore
+
+    # Define the `boot_report` property
+    @property
+    def boot_report(self):
+        # Return the time from reset until the bring-up finished (in ms, `None` while still running)
+        # and the init time (in ms) of every device brought up so far
+        return {
+            "ready_ms": self.__ready_ms__,
+            "devices": dict(self.__boot_timing__),
+        }
+
+    # Define the `get_params` method
+    def get_params(self):
+        return self.__navigation__.get_params()
+
+    # Define the `set_param` method
+    def set_param(self, name: str, value: int):
+        # Update a navigation parameter, the routine picks it up at the next lane boundary
+        value = self.__navigation__.set_param(name, value)
+        self.__apply_sensor_ranges__()
+        return value
+
+    # Define the `__ultrasonic_sensors__` method
+    def __ultrasonic_sensors__(self):
+        return {
+            "left": self.__ultrasonic_sensor_left__,
+            "front": self.__ultrasonic_sensor_front__,
+            "right": self.__ultrasonic_sensor_right__,
+        }
+
+    # Define the `__apply_sensor_ranges__` method
+    def __apply_sensor_ranges__(self):
+        # Derive the range of interest of every sensor from the navigation distances
+        navigation = self.__navigation__
+        side_range = max(
+            self.SIDE_RANGE,
+            2 * max(navigation["side_distance"], navigation["turn_distance"]),
+        )
+        self.__sensor_ranges__ = {
+            "left": side_range,
+            "front": max(self.FRONT_RANGE, 2 * navigation["front_distance"]),
+            "right": side_range,
+        }
+        for name, sensor in self.__ultrasonic_sensors__().items():
+            sensor.max_range_mm = self.__sensor_ranges__[name]
+
+    # Define the `get_sensor_timing` method
+    def get_sensor_timing(self):
+        return {name: sensor.timing for name, sensor in self.__ultrasonic_sensors__().items()}
 
     # Define the `get_distance` method
     def get_distance(self):
+        # Take a full reading of every sensor
+        self.__sample__("deciding")
+        return dict(self.__distance__)
+
+    # Define the `motion_state` property
+    @property
+    def motion_state(self):
+        return self.__motion_state__
+
+    # Define the `get_sampling_stats` method
+    def get_sampling_stats(self):
+        # Return the motion state, the pulses sent per sensor and the mean control loop rate while driving
+        loops, elapsed_ms = self.__loop_stats__
         return {
-            "left": self.__ultrasonic_sensor_left__.get_distance_mm(),
-            "front": self.__ultrasonic_sensor_front__.get_distance_mm(),
-            "right": self.__ultrasonic_sensor_right__.get_distance_mm(),
+            "state": self.__motion_state__,
+            "pulses": dict(self.__samples__),
+            "loop_hz": round(loops * 1000 / elapsed_ms, 1) if elapsed_ms else 0,
         }
 
+    # Define the `__sample__` method
+    def __sample__(self, state: str, front_distance: int = 0):
+        # Sample the sensors that are due in the motion `state` and return the fresh readings
+        # (in a dictionary reused by the next call), keeping the latest reading of every sensor in `self.__distance__`
+        self.__motion_state__ = state
+        fresh = self.__fresh__
+        fresh.clear()
+        policy = self.SAMPLING[state]
+        if policy is None:
+            return fresh
+        front_policy = policy["front"]
+        side_policy = policy["side"]
+        if state == "cruising":
+            # Raise the rates linearly as the front range nears the front distance
+            front = self.__distance__["front"]
+            closeness = (2 * front_distance - front) / front_distance if front_distance else 0
+            if closeness > 0:
+                closeness = min(closeness, 1)
+                self.__motion_state__ = "approaching"
+                near = self.SAMPLING["approaching"]
+                front_policy = (0, round(front_policy[1] + (near["front"][1] - front_policy[1]) * closeness))
+                side_policy = (
+                    round(side_policy[0] + (near["side"][0] - side_policy[0]) * closeness),
+                    round(side_policy[1] + (near["side"][1] - side_policy[1]) * closeness),
+                )
+        now = time.ticks_ms()  # type: ignore
+        for name, sensor in self.__ultrasonic_sensors__().items():
+            period, pulses = front_policy if name == "front" else side_policy
+            if time.ticks_diff(now, self.__sampled__[name]) >= period:  # type: ignore
+                fresh[name] = self.__distance__[name] = sensor.get_distance_mm(pulses)
+                self.__sampled__[name] = now
+                self.__samples__[name] += pulses
+        return fresh
+
+    # Define the `__track__` method
+    def __track__(self, distance: dict, fresh: dict | None = None):
+        # Update the map with the `fresh` readings (all of `distance` if not given) at the current pose,
+        # record the latest readings and return the pose
+        x, y, theta = self.__pose_estimator__.pose
+        self.__recorder__.sensors(distance, theta, self.__magnetometer__.raw)
+        self.__map__.update(x, y, theta, distance if fresh is None else fresh, self.__sensor_ranges__)
+        self.__map__.mark_covered(x, y, self.BRUSH_WIDTH // 2)
+        return x, y, theta
+
     # Define the `get_speed` method
     def __get_speed__(self, as_dict: bool = True):
         if as_dict:
@@ -125,12 +491,24 @@ class CleaningRobot:
     def toggle_brush(self, brush: str, value: bool):
         if brush == "main":
             self.__motor_main_brush__.value(value)
-            return self.__motor_main_brush__.value()
+            result = self.__motor_main_brush__.value()
         elif brush == "side":
             self.__motor_side_brush__.value(value)
-            return self.__motor_side_brush__.value()
+            result = self.__motor_side_brush__.value()
         else:
             raise ValueError("Invalid brush type")
+        # Update the brush states in the status snapshot
+        self.__status__.set(
+            "brush_set",
+            {
+                "brush": "both",
+                "value": [
+                    bool(self.__motor_main_brush__.value()),
+                    bool(self.__motor_side_brush__.value()),
+                ],
+            },
+        )
+        return result
 
     @property
     def main_brush(self):
@@ -140,6 +518,11 @@ class CleaningRobot:
     def side_brush(self):
         return self.__motor_side_brush__
 
+    # Define the `drive` property
+    @property
+    def drive(self):
+        return self.__drive__
+
     # Define the `set_speed` method
     def set_speed(self, speed: dict | int):
         if isinstance(speed, int):
@@ -147,43 +530,40 @@ class CleaningRobot:
                 "left": speed,
                 "right": speed,
             }
-        self.__motor_left__.speed = speed["left"]
-        self.__motor_right__.speed = speed["right"]
+        self.__drive__.apply(
+            self.__motor_left__.direction,
+            self.__motor_right__.direction,
+            speed["left"],
+            speed["right"],
+        )
 
     # Define the `forward` method
     def forward(self):
-        self.__motor_left__.forward()
-        self.__motor_right__.forward()
+        self.__drive__.apply(1, 1)
 
     # Define the `backwards` method
     def backwards(self):
-        self.__motor_left__.backwards()
-        self.__motor_right__.backwards()
+        self.__drive__.apply(-1, -1)
 
     # Define the `stop` method
     def stop(self):
-        self.__motor_left__.stop()
-        self.__motor_right__.stop()
+        self.__drive__.apply(0, 0)
 
     # Define the `turn_left` method
     def turn_left(self):
-        self.__motor_left__.backwards()
-        self.__motor_right__.forward()
+        self.__drive__.apply(-1, 1)
 
     # Define the `smooth_turn_left` method
     def __smooth_turn_left__(self):
-        self.__motor_left__.stop()
-        self.__motor_right__.forward()
+        self.__drive__.apply(0, 1)
 
     # Define the `turn_right` method
     def turn_right(self):
-        self.__motor_left__.forward()
-        self.__motor_right__.backwards()
+        self.__drive__.apply(1, -1)
 
     # Define the `smooth_turn_right` method
     def __smooth_turn_right__(self):
-        self.__motor_left__.forward()
-        self.__motor_right__.stop()
+        self.__drive__.apply(1, 0)
 
     # Define the `turn` method
     async def __turn__(
@@ -192,36 +572,179 @@ class CleaningRobot:
         speed: int | None = None,
         smooth: bool = False,
     ):
-        # Get current magnetometer heading
-        heading = self.__magnetometer__.read()["heading"]
+        # Get current heading (fused with the gyro, if there is one)
+        heading = self.__heading__.read()["heading"]
         # Calculate target heading
-        target_heading = self.magnetometer.__correct_heading__(heading + degrees)
+        target_heading = self.__heading__.__correct_heading__(heading + degrees)
+        self.__recorder__.state(FlightRecorder.STATE_TURN, int(degrees), int(heading * 10))
+        self.__sample__("turning")
         # Set speed
         if speed is not None:
             self.set_speed(speed)
         # Turn left or right depending on degrees
         if degrees < 0:
-            if smooth:
-                self.__smooth_turn_left__()
-            else:
-                self.turn_left()
+            turn = self.__smooth_turn_left__ if smooth else self.turn_left
         else:
-            if smooth:
-                self.__smooth_turn_right__()
-            else:
-                self.turn_right()
-        # Loop until target heading is reached
-        while self.is_cleaning:
-            # Get current magnetometer heading
-            heading = self.__magnetometer__.read()["heading"]
-            # Calculate difference between target heading and current heading
-            diff = target_heading - heading
+            turn = self.__smooth_turn_right__ if smooth else self.turn_right
+        turn()
+        # Loop until target heading is reached (or a safety fault cut the motors)
+        section = self.__turn_section__
+        period_ms = self.__heading__.period_ms
+        while (self.is_cleaning or self.is_scripting) and not self.__safety__.fault:
+            section.enter()
+            # Get current heading
+            heading = self.__heading__.read()["heading"]
+            # Calculate difference between target heading and current heading (wrapped to -180..180)
+            diff = (target_heading - heading + 180) % 360 - 180
+            section.leave()
             # If difference is less than 3 degrees, break the loop
             if abs(diff) < 3:
                 break
-            # Wait 10 milliseconds
-            await asyncio.sleep(0.01)
+            if self.is_cleaning:
+                kind = self.__check_stall__(heading)
+                if kind:
+                    # The heading does not follow the wheels: back off, pivot free and resume the turn
+                    # on the spot (a smooth turn sweeps the robot back into the obstacle)
+                    await self.__recover_stall__(kind, self.__motor_left__.speed)
+                    turn = self.turn_left if degrees < 0 else self.turn_right
+                    turn()
+            # Wait for the next heading update (5 ms with the gyro, 10 ms with the magnetometer alone)
+            await asyncio.sleep_ms(period_ms)  # type: ignore
+
+        self.stop()
+
+    # Define the `__turn_to__` method
+    async def __turn_to__(self, heading: float, speed: int | None = None):
+        # Turn the shortest way towards the absolute `heading`
+        diff = (heading - self.__heading__.read()["heading"] + 180) % 360 - 180
+        if abs(diff) >= 3:
+            await self.__turn__(diff, speed=speed)
+
+    # Define the `calibrate_odometry` method
+    async def calibrate_odometry(self, distance: int = 500, duties: tuple = (30, 50, 70)):
+        # Fit the PWM-to-velocity model of the pose estimator by driving `distance` mm towards
+        # an obstacle at every duty, measured with the front ultrasonic sensor
+        # (run it through `start_calibration`, so the safety monitor is armed and `stop` can interrupt it)
+        if self.is_cleaning:
+            raise RuntimeError("Cannot calibrate while cleaning")
+        front_sensor = self.__ultrasonic_sensor_front__
+        safety = self.__safety__
+        samples = []
+        for duty in duties:
+            start = front_sensor.get_distance_mm()
+            if start < 0 or start == UltrasonicSensor.BEYOND_RANGE:
+                raise ValueError("No obstacle in range in front of the robot to calibrate against")
+            if start - distance < self.__navigation__["side_distance"]:
+                raise ValueError("Not enough room in front of the robot to calibrate")
+            # Drive forward until the front distance decreased by `distance` (or a timeout of 10 seconds)
+            self.set_speed(duty)
+            self.forward()
+            start_ticks = time.ticks_us()  # type: ignore
+            front = start
+            while front > start - distance and not safety.fault:
+                if time.ticks_diff(time.ticks_us(), start_ticks) > 10000000:  # type: ignore
+                    break
+                await asyncio.sleep_ms(5)  # type: ignore
+                reading = front_sensor.get_distance_mm()
+                # Skip the failed readings (no echo) and the glitches beyond the range, which would end
+                # the run early with a bogus velocity
+                if 0 <= reading < UltrasonicSensor.BEYOND_RANGE:
+                    front = reading
+            elapsed = time.ticks_diff(time.ticks_us(), start_ticks)  # type: ignore
+            self.stop()
+            if safety.fault:
+                raise RuntimeError("The safety monitor stopped the calibration")
+            samples.append((duty, (start - front) * 1000000 / elapsed))
+            # Drive back to the start for the next duty
+            await asyncio.sleep(0.5)
+            self.backwards()
+            await asyncio.sleep_ms(elapsed // 1000)  # type: ignore
+            self.stop()
+            await asyncio.sleep(0.5)
+        self.set_speed(self.__navigation__["drive_speed"])
+        return self.__pose_estimator__.fit(samples)
+
+    # Define the `start_calibration` method
+    def start_calibration(self, distance: int = 500, done=None):
+        # Run `calibrate_odometry` as a task in the place of a motion script (so `stop_script` cancels it),
+        # awaiting `done(model, error)` once it finished (`error` is `None` on success)
+        if self.is_cleaning or self.is_scripting:
+            raise RuntimeError("The robot is busy")
+        self.__safety__.acknowledge()
+        self.__safety__.arm()
+        self.__script_task__ = asyncio.create_task(self.__run_calibration__(distance, done))
+
+    # Define the `__run_calibration__` method
+    async def __run_calibration__(self, distance: int, done):
+        model = error = None
+        try:
+            model = await self.calibrate_odometry(distance)
+        except Exception as e:
+            error = str(e)
+        finally:
+            # Leave the robot stopped, whether the calibration finished, failed or was cancelled
+            self.stop()
+            self.set_speed(self.__navigation__["drive_speed"])
+            self.__safety__.disarm()
+            self.__safety__.acknowledge()
+        if done is not None:
+            await done(model, error)
+
+    # Define the `__drive_for__` method
+    async def __drive_for__(self, direction: int, duration_ms: int, speed: int | None = None):
+        # Drive forward (1) or backwards (-1) for `duration_ms` and return whether the segment
+        # was completed (`False` if the safety monitor cut the motors)
+        if speed is not None:
+            self.set_speed(speed)
+        front_distance = self.__navigation__["front_distance"]
+        safety = self.__safety__
+        start = time.ticks_ms()  # type: ignore
+        while time.ticks_diff(time.ticks_ms(), start) < duration_ms and not safety.fault:  # type: ignore
+            # Keep the front reading fresh for the safety monitor while driving forward
+            if direction > 0:
+                self.__sample__("cruising", front_distance)
+            self.__drive__.apply(direction, direction)
+            await asyncio.sleep_ms(10)  # type: ignore
+        self.stop()
+        self.__motion_state__ = "idle"
+        if safety.fault:
+            safety.acknowledge()
+            self.set_speed(speed if speed is not None else self.__navigation__["drive_speed"])
+            return False
+        return True
+
+    # Define the `start_script` method
+    def start_script(self, script, notify=None, done=None):
+        # Run the `MotionScript` as a task, awaiting `notify(index, count)` before every step
+        # and `done(error)` once it finished (`error` is `None` on success)
+        if self.is_cleaning or self.is_scripting:
+            raise RuntimeError("The robot is busy")
+        self.__safety__.acknowledge()
+        self.__safety__.arm()
+        self.__script_task__ = asyncio.create_task(self.__run_script__(script, notify, done))
 
+    # Define the `__run_script__` method
+    async def __run_script__(self, script, notify, done):
+        error = None
+        try:
+            await script.run(self, notify)
+        except Exception as e:
+            error = str(e)
+        finally:
+            # Leave the robot stopped, whether the script finished, failed or was cancelled
+            self.stop()
+            self.__safety__.disarm()
+            self.__safety__.acknowledge()
+            self.__motion_state__ = "idle"
+        if done is not None:
+            await done(error)
+
+    # Define the `stop_script` method
+    def stop_script(self):
+        # Cancel the running motion script
+        if not self.is_scripting:
+            return
+        self.__script_task__.cancel()
         self.stop()
 
     # Define the `stop_routine` method
@@ -230,11 +753,22 @@ class CleaningRobot:
         if not self.is_cleaning:
             return
 
-        # Set the `is_cleaning` attribute to `False` and cancel the routine task
-        self.__is_cleaning__ = False
+        # Cancel the routine task and leave the robot stopped
         self.__routine_task__.cancel()
+        self.__end_routine__()
+
+    # Define the `__end_routine__` method
+    def __end_routine__(self):
+        # Set the `is_cleaning` attribute to `False`
+        self.__is_cleaning__ = False
+        self.__status__.set("is_cleaning", False)
+        self.__recorder__.state(FlightRecorder.STATE_STOP)
+        # Disarm the safety monitor and clear a fault the routine did not get to acknowledge
+        self.__safety__.disarm()
+        self.__safety__.acknowledge()
         # Stop the robot and deactivate the brushes
         self.stop()
+        self.__motion_state__ = "idle"
         self.toggle_brush("main", False)
         self.toggle_brush("side", False)
 
@@ -244,44 +778,436 @@ class CleaningRobot:
         if self.is_cleaning:
             return
 
+        # Start with an empty map at the origin and make sure the pose is being estimated
+        self.__map__.reset()
+        self.__pose_estimator__.reset()
+        if self.__pose_task__ is None:
+            self.__pose_task__ = asyncio.create_task(self.__pose_estimator__.run())
+        if self.__recorder_task__ is None:
+            self.__recorder_task__ = asyncio.create_task(
+                self.__recorder__.run(lambda: not self.is_cleaning)
+            )
+        self.__recorder__.state(FlightRecorder.STATE_START, self.MODES.index(self.mode))
+        self.__safety__.acknowledge()
+        self.__safety__.arm()
+        # Count the stalls of this routine with the current parameters
+        self.__stall__.configure(self.__stall_params__.get_params())
+        self.__stall__.clear()
+        # In strict mode, hold off the automatic garbage collection (until the heap runs low) while the routine runs
+        self.__memory__.hold()
         # Set the `is_cleaning` attribute to `True` and start the routine
         self.__is_cleaning__ = True
+        self.__status__.set("is_cleaning", True)
         self.__routine_task__ = asyncio.create_task(self.__routine__())
 
     # Define the `__routine__` method
     async def __routine__(self):
-        # Activate the brushes and loop while the robot is cleaning
-        self.toggle_brush("main", True)
-        self.toggle_brush("side", True)
+        # Activate the brushes and run the routine of the selected cleaning mode
+        try:
+            self.toggle_brush("main", True)
+            self.toggle_brush("side", True)
+            if self.mode == "boustrophedon":
+                await self.__boustrophedon_routine__()
+                return
+            if self.mode == "edge":
+                await self.__edge_routine__()
+                return
+
+            last_direction = "left"
+            navigation = self.__navigation__
+            while self.is_cleaning:
+                # Snapshot the navigation parameters once per lane (updates apply at the next lane)
+                params = navigation.get_params()
+                # Drive to the front until the front distance is reached
+                distance, _ = await self.__drive_lane__(
+                    params["drive_speed"],
+                    params["front_distance"],
+                )
+                await self.__handle_fault__(params)
+                # Turn left or right depending on the last direction and update the last direction
+                last_direction = await self.__reactive_turn__(
+                    distance,
+                    last_direction,
+                    params,
+                )
+                # The robot stands still after the turn, so write a full block of the flight log
+                # and collect the garbage (in strict mode) now
+                self.__recorder__.flush_if_due()
+                self.__memory__.boundary()
+                # Wait 10 milliseconds
+                await asyncio.sleep(0.01)
+        except Exception as e:
+            # Give up on the routine after a stall (`StallError`) or any failure (e.g. a `MemoryError`), leaving
+            # the motors and brushes off (a task cannot cancel itself, so end it in place)
+            self.__logger__.error(f"ROUTINE ABANDONED: {e}")
+            self.__end_routine__()
+        finally:
+            # The routine is over (done, cancelled or failed), so let the collector run on its own again
+            self.__status__.set("is_cleaning", False)
+            self.__memory__.release()
+
+    # Define the `__boustrophedon_routine__` method
+    async def __boustrophedon_routine__(self):
+        # Sweep the room in parallel lanes planned on the map, falling back to the reactive
+        # behaviour whenever the sensors disagree with the plan
+        planner = self.__planner__
+        pose_estimator = self.__pose_estimator__
+        navigation = self.__navigation__
+        recorder = self.__recorder__
         last_direction = "left"
+        # Survey the surroundings, then align the lanes with the grid axis closest to the current heading
+        await self.__survey__(navigation["drive_speed"])
+        planner.reset(*pose_estimator.pose)
+        await self.__turn_to__(planner.axis, navigation["drive_speed"])
         while self.is_cleaning:
-            # Get the distance
-            distance = self.get_distance()
+            # Snapshot the navigation parameters once per lane (updates apply at the next lane)
+            params = navigation.get_params()
+            drive_speed = params["drive_speed"]
+            front_distance = params["front_distance"]
 
-            # Set the speed to self.DRIVE_SPEED (in %) and drive to the front until distance is less than 30cm
-            self.set_speed(self.DRIVE_SPEED)
-            while distance["front"] > self.FRONT_DISTANCE:
-                distance = self.get_distance()
-                self.forward()
-                await asyncio.sleep(0.01)
+            # Sweep the current lane until the front distance is reached
+            planner.begin_lane(*pose_estimator.pose)
+            distance, _ = await self.__drive_lane__(drive_speed, front_distance)
+            self.stop()
+            await self.__handle_fault__(params)
+            planner.end_lane()
+            # The robot stands still at the lane boundary, so write a full block of the flight log
+            # and collect the garbage (in strict mode) now
+            recorder.flush_if_due()
+            self.__memory__.boundary()
 
-            # Turn left or right depending on the last direction and update the last direction
-            if last_direction == "left" and distance["right"] >= self.SIDE_DISTANCE:
-                smooth = distance["right"] > self.TURN_DISTANCE
-                await self.__turn__(
-                    180,
-                    smooth=smooth,
-                    speed=self.TURN_SPEED if smooth else self.DRIVE_SPEED,
-                )
-                last_direction = "right"
-            elif last_direction == "right" and distance["left"] >= self.SIDE_DISTANCE:
-                smooth = distance["left"] > self.TURN_DISTANCE
-                await self.__turn__(
-                    -180,
-                    smooth=smooth,
-                    speed=self.TURN_SPEED if smooth else self.DRIVE_SPEED,
+            # Ask the planner for the way to the next lane, the room is done when there is none
+            x, y, _ = pose_estimator.pose
+            step = planner.next_step(x, y)
+            if step is None:
+                break
+            if step["kind"] == "shift":
+                recorder.state(FlightRecorder.STATE_SHIFT, step["lane"], step["turn"])
+                # U-turn onto the neighbouring lane: turn 90°, shift by the lane spacing and turn 90° again
+                await self.__turn__(step["turn"], speed=drive_speed)
+                distance = self.get_distance()
+                if distance["front"] < step["distance"] + params["side_distance"]:
+                    # The sensors disagree with the map, so turn back and bounce like the reactive mode
+                    planner.skip(step)
+                    recorder.state(FlightRecorder.STATE_FALLBACK, step["lane"])
+                    await self.__turn__(-step["turn"], speed=drive_speed)
+                    last_direction = await self.__reactive_turn__(
+                        self.get_distance(),
+                        last_direction,
+                        params,
+                    )
+                    continue
+                await self.__drive_lane__(drive_speed, front_distance, step["distance"])
+                self.stop()
+                await self.__handle_fault__(params)
+                await self.__turn__(step["turn"], speed=drive_speed)
+            else:
+                # Transit to the closest end of the next lane segment and face along it
+                recorder.state(FlightRecorder.STATE_TRANSIT, step["lane"], int(step["distance"]))
+                await self.__turn_to__(step["bearing"], drive_speed)
+                distance, travelled = await self.__drive_lane__(
+                    drive_speed,
+                    front_distance,
+                    step["distance"],
                 )
-                last_direction = "left"
+                self.stop()
+                await self.__handle_fault__(params)
+                if travelled < step["distance"] - self.BRUSH_WIDTH:
+                    # An obstacle the map does not know about blocked the way, so bounce like the reactive mode
+                    planner.skip(step)
+                    recorder.state(FlightRecorder.STATE_FALLBACK, step["lane"])
+                    last_direction = await self.__reactive_turn__(
+                        distance,
+                        last_direction,
+                        params,
+                    )
+                    continue
+                await self.__turn_to__(step["heading"], drive_speed)
+
+        # Every lane is done, so stop the robot and the brushes
+        recorder.state(FlightRecorder.STATE_DONE)
+        self.__end_routine__()
+
+    # Define the `__edge_routine__` method
+    async def __edge_routine__(self):
+        # Clean along the walls in one continuous pass: drive up to the wall ahead, turn so that it is on the side
+        # with less room and follow it around the room
+        params = self.__navigation__.get_params()
+        speed = params["drive_speed"]
+        distance, _ = await self.__drive_lane__(speed, params["edge_distance"] + self.BRUSH_WIDTH // 2)
+        self.stop()
+        await self.__handle_fault__(params)
+        side = "right" if distance["left"] >= distance["right"] else "left"
+        await self.__turn__(-90 if side == "right" else 90, speed=speed)
+        await self.__follow_perimeter__(side, params)
+
+        # The perimeter is done, so stop the robot and the brushes
+        self.__recorder__.state(FlightRecorder.STATE_DONE)
+        self.__end_routine__()
+
+    # Define the `__follow_perimeter__` method
+    async def __follow_perimeter__(self, side: str, params: dict):
+        # Keep the wall on `side` at the edge distance with a PD controller on the side range, turning away at
+        # inside corners (the front range falls to the corner distance) and around outside corners (the wall stays
+        # out of reach for a few readings). The pass ends back at its start after a full turn, or a quarter turn
+        # later should the pose drift keep it from closing
+        sample = self.__sample__
+        latest = self.__distance__
+        track = self.__track__
+        apply = self.__drive__.apply
+        sqrt = math.sqrt
+        safety = self.__safety__
+        recorder = self.__recorder__
+        section = self.__lane_section__
+        speed = params["drive_speed"]
+        edge_distance = params["edge_distance"]
+        kp = params["edge_kp"]
+        kd = params["edge_kd"]
+        sign = 1 if side == "right" else -1
+        corner = edge_distance + self.BRUSH_WIDTH // 2
+        clearance = edge_distance + self.BRUSH_WIDTH
+        max_steer = speed * self.EDGE_MAX_STEER
+        stats = self.__edge_stats__ = {
+            "side": side,
+            "perimeter_mm": 0,
+            "duration_ms": 0,
+            "inside_corners": 0,
+            "outside_corners": 0,
+            "closed": False,
+        }
+
+        recorder.state(FlightRecorder.STATE_EDGE, sign, edge_distance)
+        sample("following")
+        start_x, start_y, last_theta = track(latest)
+        last_x, last_y = start_x, start_y
+        start_ticks = last_ticks = time.ticks_ms()  # type: ignore
+        perimeter = turned = derivative = 0.0
+        last_error = None
+        lost = 0
+        heading = self.__heading__.latest
+        check_stall = self.__check_stall__
+        self.set_speed(speed)
+        try:
+            while self.is_cleaning:
+                if safety.fault:
+                    # Back off, the front range then turns the robot like an inside corner
+                    await self.__handle_fault__(params)
+                    last_error = None
+                section.enter()
+                fresh = sample("following")
+                # Measure the perimeter and the net turn along the pose
+                x, y, theta = track(latest, fresh)
+                perimeter += sqrt((x - last_x) ** 2 + (y - last_y) ** 2)
+                turned += (theta - last_theta + 180) % 360 - 180
+                last_x, last_y, last_theta = x, y, theta
+                section.leave()
+                if abs(turned) >= 330 and perimeter > 4 * self.BRUSH_WIDTH and sqrt((x - start_x) ** 2 + (y - start_y) ** 2) < self.BRUSH_WIDTH:
+                    stats["closed"] = True
+                    break
+                if abs(turned) >= 450:
+                    break
+                kind = check_stall(heading["heading"])
+                if kind:
+                    # Wedged against the wall (or a jammed wheel): back off, pivot free and pick the wall up again
+                    await self.__recover_stall__(kind, speed)
+                    last_error = None
+                    lost = 0
+                    continue
+
+                if latest["front"] <= corner:
+                    # Inside corner: turn away from the wall onto the next one
+                    self.stop()
+                    stats["inside_corners"] += 1
+                    recorder.state(FlightRecorder.STATE_CORNER, 1, stats["inside_corners"])
+                    await self.__turn__(-90 * sign, speed=speed)
+                    last_error = None
+                    continue
+                lost = lost + 1 if latest[side] > clearance else 0
+                if lost >= self.EDGE_LOST_READINGS:
+                    # Outside corner: pass the end of the wall, turn around it and drive along its next face
+                    lost = 0
+                    stats["outside_corners"] += 1
+                    recorder.state(FlightRecorder.STATE_CORNER, 2, stats["outside_corners"])
+                    await self.__drive_lane__(speed, corner, clearance)
+                    self.stop()
+                    await self.__turn__(90 * sign, speed=speed)
+                    await self.__drive_lane__(speed, corner, clearance)
+                    self.__sample__("following")
+                    last_error = None
+                    continue
+                if not lost:
+                    # Steer towards the edge distance, the proportional part bounded, so the robot does not
+                    # head into the wall, and the smoothed range rate damping the approach
+                    now = time.ticks_ms()  # type: ignore
+                    error = latest[side] - edge_distance
+                    if last_error is None:
+                        derivative = 0.0
+                    else:
+                        rate = (error - last_error) * 1000 / max(1, time.ticks_diff(now, last_ticks))  # type: ignore
+                        derivative += self.EDGE_D_FILTER * (rate - derivative)
+                    last_error = error
+                    last_ticks = now
+                    steer = max(-max_steer, min(max_steer, kp * error))
+                    correction = max(-speed, min(speed, steer + kd * derivative))
+                    apply(1, 1, round(speed + sign * correction), round(speed - sign * correction))
+                # Otherwise keep the course until the wall is confirmed lost
+                await asyncio.sleep_ms(10)  # type: ignore
+        finally:
+            stats["perimeter_mm"] = int(perimeter)
+            stats["duration_ms"] = time.ticks_diff(time.ticks_ms(), start_ticks)  # type: ignore
+            self.__logger__.info(f"Perimeter: {stats}")
+
+    # Define the `get_edge_stats` method
+    def get_edge_stats(self):
+        # Return the side, length (in mm), duration (in ms) and corners of the last perimeter pass,
+        # and whether it closed at its start
+        return dict(self.__edge_stats__)
+
+    # Define the `__survey__` method
+    async def __survey__(self, speed: int):
+        # Seed the map by turning on the spot in quarter turns and taking a reading in every direction
+        self.__recorder__.state(FlightRecorder.STATE_SURVEY)
+        for _ in range(4):
+            self.__track__(self.get_distance())
+            await self.__turn__(90, speed=speed)
+
+    # Define the `__drive_lane__` method
+    async def __drive_lane__(
+        self,
+        speed: int,
+        front_distance: int,
+        max_distance: float | None = None,
+    ):
+        # Drive forward until the front distance is reached (or `max_distance` mm were driven)
+        # and return the last distance reading and the driven distance
+        sample = self.__sample__
+        latest = self.__distance__
+        forward = self.forward
+        track = self.__track__
+        sleep = asyncio.sleep
+        sqrt = math.sqrt
+        limit = max_distance if max_distance is not None else float("inf")
+        travelled = 0.0
+
+        self.__recorder__.state(
+            FlightRecorder.STATE_LANE,
+            speed,
+            front_distance,
+            int(min(limit, 32767)),
+        )
+        sample("deciding")
+        start_x, start_y, _ = track(latest)
+        self.set_speed(speed)
+        safety = self.__safety__
+        section = self.__lane_section__
+        heading = self.__heading__.latest
+        check_stall = self.__check_stall__
+        loops = 0
+        start_ticks = time.ticks_ms()  # type: ignore
+        while latest["front"] > front_distance and travelled < limit and not safety.fault:
+            section.enter()
+            # Sample the sensors that are due, depending on how close the front obstacle is
+            fresh = sample("cruising", front_distance)
+            forward()
+            # Update the map at the current pose and measure the distance driven from the start of the lane
+            x, y, _ = track(latest, fresh)
+            travelled = sqrt((x - start_x) ** 2 + (y - start_y) ** 2)
+            loops += 1
+            section.leave()
+            kind = check_stall(heading["heading"])
+            if kind:
+                # The front range does not follow the wheels: back off, pivot free and drive on
+                await self.__recover_stall__(kind, speed)
+            await sleep(0.01)
+        self.__loop_stats__[0] += loops
+        self.__loop_stats__[1] += time.ticks_diff(time.ticks_ms(), start_ticks)  # type: ignore
+
+        # Take a full reading of every sensor for the turn decision
+        sample("deciding")
+        return dict(latest), travelled
+
+    # Define the `__handle_fault__` method
+    async def __handle_fault__(self, params: dict):
+        # Acknowledge a fault latched by the safety monitor: log and record it, back off
+        # from the obstacle and restore the drive speed
+        safety = self.__safety__
+        if not safety.fault:
+            return
+        stats = safety.stats
+        self.__logger__.warning(
+            f"SAFETY STOP: fault {stats['fault']} after {stats['latency_us']} us"
+        )
+        self.__recorder__.state(FlightRecorder.STATE_FAULT, stats["fault"], stats["latency_us"] // 1000)
+        self.stop()
+        fault = safety.acknowledge()
+        self.set_speed(params["drive_speed"])
+        if fault == SafetyMonitor.FAULT_OBSTACLE:
+            self.backwards()
+            await asyncio.sleep(0.3)
+            self.stop()
+
+    # Define the `__check_stall__` method
+    def __check_stall__(self, heading: float) -> int:
+        # Feed the stall detector with the commanded motion, the front range and the `heading`,
+        # returning the kind of stall it detects (`StallDetector.NONE` while the robot moves freely)
+        pose = self.__pose_estimator__
+        v_left = pose.wheel_velocity(self.__motor_left__)
+        v_right = pose.wheel_velocity(self.__motor_right__)
+        return self.__stall__.update(
+            time.ticks_ms(),  # type: ignore
+            self.__distance__["front"],
+            heading,
+            (v_left + v_right) / 2,
+            math.degrees((v_left - v_right) / pose.WHEEL_BASE),
+        )
+
+    # Define the `__recover_stall__` method
+    async def __recover_stall__(self, kind: int, speed: int):
+        # Back off and pivot away (alternating the side, so a retry does not rotate into the same wedge),
+        # then restore the `speed` for the caller to retry its motion. Raise a `StallError` once the robot
+        # stays stuck after the allowed attempts
+        stall = self.__stall__
+        attempt = stall.consecutive
+        self.__logger__.warning(
+            f"STALL: {'drive' if kind == StallDetector.DRIVE else 'turn'} (attempt {attempt} of {stall.attempts})"
+        )
+        self.__recorder__.state(FlightRecorder.STATE_STUCK, kind, attempt)
+        self.stop()
+        if attempt > stall.attempts:
+            stall.recovered(0, False)
+            raise StallError(f"Still stuck after {stall.attempts} recovery attempts")
+        start = time.ticks_ms()  # type: ignore
+        self.set_speed(self.__navigation__["drive_speed"])
+        self.backwards()
+        await asyncio.sleep_ms(self.STALL_BACK_OFF_MS)  # type: ignore
+        if attempt % 2:
+            self.turn_left()
+        else:
+            self.turn_right()
+        await asyncio.sleep_ms(self.STALL_PIVOT_MS)  # type: ignore
+        self.stop()
+        self.set_speed(speed)
+        stall.reset()
+        stall.recovered(time.ticks_diff(time.ticks_ms(), start), True)  # type: ignore
 
-            # Wait 10 milliseconds
-            await asyncio.sleep(0.01)
+    # Define the `__reactive_turn__` method
+    async def __reactive_turn__(self, distance: dict, last_direction: str, params: dict):
+        # Turn 180° away from the last direction if there is enough room on that side
+        # (smoothly if there is plenty of room) and return the new last direction
+        if last_direction == "left" and distance["right"] >= params["side_distance"]:
+            smooth = distance["right"] > params["turn_distance"]
+            await self.__turn__(
+                180,
+                smooth=smooth,
+                speed=params["turn_speed"] if smooth else params["drive_speed"],
+            )
+            return "right"
+        elif last_direction == "right" and distance["left"] >= params["side_distance"]:
+            smooth = distance["left"] > params["turn_distance"]
+            await self.__turn__(
+                -180,
+                smooth=smooth,
+                speed=params["turn_speed"] if smooth else params["drive_speed"],
+            )
+            return "left"
+        return last_direction
@@ -5,6 +5,7 @@
 # Import the necessary libraries
 import json
 import os
+import time
 
 
 # Define the `Singleton` decorator
@@ -286,3 +287,71 @@ class BoardConfigManager:
                 "channel": None,
             },
         }
+
+
+# Define the `ParameterStore` class
+class ParameterStore:
+    # Define the `__init__` method
+    def __init__(self, key: str, defaults: dict, limits: dict | None = None):
+        # Load the parameters stored under `key` in the board config, falling back to the `defaults`
+        self.__key__ = key
+        self.__limits__ = limits or {}
+        self.__board_config_manager__ = BoardConfigManager()
+        stored = self.__board_config_manager__.get(key, {})
+        self.__params__ = {
+            name: stored.get(name, default) for name, default in defaults.items()
+        }
+
+    # Define the `__getitem__` method
+    def __getitem__(self, name: str):
+        return self.__params__[name]
+
+    # Define the `get_params` method
+    def get_params(self) -> dict:
+        # Return a copy of the current parameters
+        return dict(self.__params__)
+
+    # Define the `set_param` method
+    def set_param(self, name: str, value):
+        # Validate the `value` against the type of the current value and the limits of the parameter
+        if name not in self.__params__:
+            raise KeyError(f"Unknown parameter: {name}")
+        value = type(self.__params__[name])(value)
+        if name in self.__limits__:
+            minimum, maximum = self.__limits__[name]
+            if value < minimum or value > maximum:
+                raise ValueError(f"{name} must be between {minimum} and {maximum}")
+
+        # Update the parameter and save the parameters to the board config
+        self.__params__[name] = value
+        self.__board_config_manager__.set(self.__key__, self.get_params())
+        return value
+
+
+# Define the `LazyDevice` class
+class LazyDevice:
+    # Define the `__init__` method
+    def __init__(self, name: str, factory, timings: dict):
+        # Create the device with `factory()` on first use and record its init time (in ms) in `timings`
+        self.__name__ = name
+        self.__factory__ = factory
+        self.__timings__ = timings
+        self.__device__ = None
+
+    # Define the `ready` property
+    @property
+    def ready(self):
+        return self.__device__ is not None
+
+    # Define the `get` method
+    def get(self):
+        # Return the device, creating it if needed
+        if self.__device__ is None:
+            start = time.ticks_ms()  # type: ignore
+            self.__device__ = self.__factory__()
+            self.__timings__[self.__name__] = time.ticks_diff(time.ticks_ms(), start)  # type: ignore
+        return self.__device__
+
+    # Forward the attribute access to the device
+    def __getattr__(self, name: str):
+        return getattr(self.get(), name)
@@ -5,14 +5,21 @@
 
 # Import the necessary libraries
 import asyncio
+import binascii
 import json
+import time
 
 import aioble  # type:ignore
 import bluetooth  # type:ignore
+import machine  # type:ignore
 from micropython import const  # type:ignore
 
 from src.cleaning_robot import CleaningRobot
+from src import fastmath
 from src.config import BoardConfigManager, Singleton
+from src.logger import Logger
+from src.ota import FirmwareUpdate
+from src.scripting import MotionScript, is_speed
 
 
 # Define the `ConnectionManager` class
@@ -45,9 +52,24 @@ class ConnectionManager:
         aioble.register_services(microcontroller_service)
         aioble.core.ble.gatts_set_buffer(self.__data_char__._value_handle, 512)
 
-        # Initialize the `BoardConfigManager` and the `CleaningRobot` instances
+        # Initialize the `BoardConfigManager` and `Logger` instances
+        # (the `CleaningRobot` is resolved on first use, so advertising does not wait for the hardware bring-up)
         self.__board_config_manager__ = BoardConfigManager()
-        self.__robot__ = CleaningRobot()
+        self.__logger__ = Logger()
+        self.__advertising_ms__ = None
+        # Define the `FirmwareUpdate` instance, staging bundles sent over the characteristic
+        self.__ota__ = FirmwareUpdate()
+
+    # Define the `robot` property
+    @property
+    def robot(self):
+        return CleaningRobot()
+
+    # Define the `advertising_ms` property
+    @property
+    def advertising_ms(self):
+        # Return the time from reset to the first advertisement (in ms), `None` if not advertising yet
+        return self.__advertising_ms__
 
     # Define the `initialize` method
     async def initialize(self):
@@ -58,93 +80,193 @@ class ConnectionManager:
         )
 
     # Define the `write` method
-    async def write(self, data: dict):
-        # Write the `data` to the characteristic
+    async def write(self, data: dict, request_id=None):
+        # Write the `data` to the characteristic, echoing the `request_id` of the command it answers
+        if request_id is not None:
+            data["id"] = request_id
+        await self.write_raw(json.dumps(data).encode("utf-8"))
+
+    # Define the `write_raw` method
+    async def write_raw(self, payload: bytes, request_id=None):
+        # Write the already encoded `payload` (a JSON object) to the characteristic,
+        # splicing the `request_id` into it if given
+        if request_id is not None:
+            payload = payload[:-1] + b', "id": ' + json.dumps(request_id).encode("utf-8") + b"}"
         try:
             await self.__data_char__.write(
-                json.dumps(data).encode("utf-8"),
+                payload,
                 send_update=True,
             )
         except Exception as e:
             # Print the error if the type is not `TypeError`
             if type(e) is not TypeError:
-                print(f"Error Writing: {e}")
+                self.__logger__.error(f"Error Writing: {e}")
+
+    # Define the `write_chunked` method
+    async def write_chunked(self, key: str, data: dict, chunk_size: int = 360, request_id=None):
+        # Split the JSON-encoded `data` into chunks that fit into the characteristic buffer
+        payload = json.dumps(data)
+        count = (len(payload) + chunk_size - 1) // chunk_size
+        for index in range(count):
+            await self.write(
+                {
+                    key: {
+                        "index": index,
+                        "count": count,
+                        "data": payload[index * chunk_size : (index + 1) * chunk_size],
+                    }
+                },
+                request_id,
+            )
+
+    # Define the `__run_batch__` method
+    def __run_batch__(self, ops: list):
+        # Validate every operation first, then apply them all without yielding to the event loop,
+        # so no other command or task can run in between
+        robot = self.robot
+        actions = {
+            "move_forward": lambda op: robot.forward(),
+            "move_backward": lambda op: robot.backwards(),
+            "turn_left": lambda op: robot.turn_left(),
+            "turn_right": lambda op: robot.turn_right(),
+            "stop": lambda op: robot.stop(),
+            "set_speed": lambda op: robot.set_speed(op["speed"]),
+            "set_brush": lambda op: robot.toggle_brush(op["brush"], op["value"]),
+        }
+        required = {"set_speed": ("speed",), "set_brush": ("brush", "value")}
+        if robot.is_cleaning or robot.is_scripting:
+            raise RuntimeError("The robot is busy")
+        for index, op in enumerate(ops):
+            if op.get("command") not in actions:
+                raise ValueError(f"Operation {index}: '{op.get('command')}' cannot be batched")
+            for field in required.get(op["command"], ()):
+                if field not in op:
+                    raise ValueError(f"Operation {index}: '{op['command']}' needs '{field}'")
+            if op["command"] == "set_brush" and op["brush"] not in ("main", "side"):
+                raise ValueError(f"Operation {index}: invalid brush '{op['brush']}'")
+            if op["command"] == "set_speed" and not is_speed(op["speed"]):
+                raise ValueError(f"Operation {index}: the speed must be a duty or have a 'left' and a 'right' duty")
+        for op in ops:
+            actions[op["command"]](op)
+        return len(ops)
 
     # Define the `__handle_commands__` method
     async def __handle_commands__(self, data: str):
+        # Commands may carry an optional "id" that is echoed in every response to them
+        request_id = None
+        command_name = None
+        replied = False
+
+        # Define the `__reply__` coroutine
+        async def __reply__(data: dict):
+            nonlocal replied
+            replied = True
+            await self.write(data, request_id)
+
+        # Define the `__reply_chunked__` coroutine
+        async def __reply_chunked__(key: str, data: dict):
+            nonlocal replied
+            replied = True
+            await self.write_chunked(key, data, request_id=request_id)
+
         # Define the `__send_status__` coroutine
         async def __send_status__():
-            # Send the current status info to the client
-            status_data = {
-                "is_cleaning": self.__robot__.is_cleaning,
-                "firmware_version": self.__board_config_manager__.get(
-                    "firmware_version", "UNKNOWN"
-                ),
-                "brush_set": {
-                    "brush": "both",
-                    "value": [
-                        bool(self.__robot__.main_brush.value()),
-                        bool(self.__robot__.side_brush.value()),
-                    ],
-                },
-                "speed_set": self.__robot__.__get_speed__(as_dict=False),
-            }
-            await self.write(status_data)
+            # Send the full status snapshot to the client (encoded only once per status version)
+            nonlocal replied
+            replied = True
+            await self.write_raw(self.robot.status.encoded(), request_id)
 
-        # Handle the commands
+        # Handle the commands, measuring the heap allocated by parsing them
         try:
+            section = self.robot.memory.section("commands")
+            section.enter()
             command = json.loads(data)
+            section.leave()
+            request_id = command.get("id")
+            command_name = command["command"]
             if command["command"] == "request_initial_info":
                 await __send_status__()
+            elif command["command"] == "batch":
+                try:
+                    count = self.__run_batch__(command["ops"])
+                except (ValueError, RuntimeError) as e:
+                    await __reply__({"batch_error": str(e)})
+                    return
+                await __reply__({"batch_done": count})
+            elif command["command"] == "run_script":
+                # Run the motion script as a task, notifying the client about its progress
+                async def __notify__(index, count):
+                    await __reply__({"script_progress": {"step": index, "count": count}})
+
+                async def __done__(error):
+                    await __reply__({"script_done": {"error": error}})
+
+                try:
+                    self.robot.start_script(MotionScript(command["script"]), __notify__, __done__)
+                except (ValueError, RuntimeError) as e:
+                    await __reply__({"script_error": str(e)})
+                    return
+                self.__logger__.info(f"Running Script: {len(command['script'])} steps")
+                # Answer the request now, the progress and the result follow as notifications with its id
+                await __reply__({"script_started": {"steps": len(command["script"])}})
+            elif command["command"] == "stop_script":
+                self.robot.stop_script()
+                await __reply__({"script_stopped": True})
+            elif command["command"] == "get_status_delta":
+                # Send only the status fields that changed since the client's version
+                await __reply__(
+                    {"status_delta": self.robot.status.changes_since(command.get("since", -1))}
+                )
             elif command["command"] == "start_cleaning":
-                self.__robot__.start_routine()
+                self.robot.start_routine()
                 await __send_status__()
             elif command["command"] == "stop_cleaning":
-                self.__robot__.stop_routine()
+                self.robot.stop_routine()
                 await __send_status__()
             elif command["command"] == "move_forward":
-                if self.__robot__.is_cleaning:
+                if self.robot.is_cleaning:
                     return
-                self.__robot__.forward()
-                print("Moving Forward")
+                self.robot.forward()
+                self.__logger__.debug("Moving Forward")
             elif command["command"] == "move_backward":
-                if self.__robot__.is_cleaning:
+                if self.robot.is_cleaning:
                     return
-                self.__robot__.backwards()
-                print("Moving Backward")
+                self.robot.backwards()
+                self.__logger__.debug("Moving Backward")
             elif command["command"] == "turn_left":
-                if self.__robot__.is_cleaning:
+                if self.robot.is_cleaning:
                     return
-                self.__robot__.turn_left()
-                print("Turning Left")
+                self.robot.turn_left()
+                self.__logger__.debug("Turning Left")
             elif command["command"] == "turn_right":
-                if self.__robot__.is_cleaning:
+                if self.robot.is_cleaning:
                     return
-                self.__robot__.turn_right()
-                print("Turning Right")
+                self.robot.turn_right()
+                self.__logger__.debug("Turning Right")
             elif command["command"] == "stop":
-                if self.__robot__.is_cleaning:
+                if self.robot.is_cleaning:
                     return
-                self.__robot__.stop()
-                print("Stopped")
-                await self.write({"stopped": True})
+                self.robot.stop_script()
+                self.robot.stop()
+                self.__logger__.debug("Stopped")
+                await __reply__({"stopped": True})
             elif command["command"] == "set_speed":
-                if self.__robot__.is_cleaning:
+                if self.robot.is_cleaning:
                     return
-                self.__robot__.set_speed(command["speed"])
-                print(f"Set Speed: {command['speed']}")
-                await self.write({"speed_set": command["speed"]})
+                self.robot.set_speed(command["speed"])
+                self.__logger__.info(f"Set Speed: {command['speed']}")
+                await __reply__({"speed_set": command["speed"]})
             elif command["command"] == "set_brush":
-                if self.__robot__.is_cleaning:
+                if self.robot.is_cleaning:
                     return
                 result = bool(
-                    self.__robot__.toggle_brush(
+                    self.robot.toggle_brush(
                         command["brush"],
                         command["value"],
                     )
                 )
-                print(f"Set Brush: {command['brush']} to {result}")
-                await self.write(
+                self.__logger__.info(f"Set Brush: {command['brush']} to {result}")
+                await __reply__(
                     {
                         "brush_set": {
                             "brush": command["brush"],
@@ -152,15 +274,182 @@ class ConnectionManager:
                         }
                     }
                 )
+            elif command["command"] == "get_params":
+                await __reply__({"params": self.robot.get_params()})
+            elif command["command"] == "set_param":
+                value = self.robot.set_param(command["name"], command["value"])
+                self.__logger__.info(f"Set Param: {command['name']} to {value}")
+                await __reply__(
+                    {
+                        "param_set": {
+                            "name": command["name"],
+                            "value": value,
+                        }
+                    }
+                )
+            elif command["command"] == "set_mode":
+                if self.robot.is_cleaning:
+                    return
+                self.robot.mode = command["mode"]
+                self.__logger__.info(f"Set Mode: {command['mode']}")
+                await __reply__({"mode_set": command["mode"]})
+            elif command["command"] == "get_plan":
+                await __reply__({"plan": self.robot.planner.progress()})
+            elif command["command"] == "get_pose":
+                x, y, theta = self.robot.pose_estimator.pose
+                await __reply__({"pose": [round(x), round(y), round(theta, 1)]})
+            elif command["command"] == "calibrate_odometry":
+                # Run the calibration as a task, so the listener keeps handling commands (e.g. `stop`)
+                async def __calibrated__(model, error):
+                    if error is not None:
+                        await __reply__({"odometry_error": error})
+                        return
+                    self.__logger__.info(f"Calibrated Odometry: {model}")
+                    await __reply__({"odometry_calibrated": model})
+
+                try:
+                    self.robot.start_calibration(command.get("distance", 500), __calibrated__)
+                except RuntimeError as e:
+                    await __reply__({"odometry_error": str(e)})
+                    return
+                await __reply__({"odometry_calibration_started": True})
+            elif command["command"] == "get_drive_stats":
+                await __reply__({"drive_stats": self.robot.drive.stats})
+            elif command["command"] == "get_map":
+                # Send the run-length encoded map as base64 in multiple chunks
+                grid = self.robot.map.export()
+                for name in ("cells", "covered"):
+                    grid[name] = binascii.b2a_base64(grid[name]).decode("utf-8").strip()
+                await __reply_chunked__("map", grid)
+            elif command["command"] == "flush_recorder":
+                # Write the pending flight log records to flash (only while the robot is not cleaning)
+                recorder = self.robot.recorder
+                if not self.robot.is_cleaning:
+                    recorder.flush()
+                await __reply__({"recorder": recorder.stats})
+            elif command["command"] == "get_sensor_timing":
+                await __reply__({"sensor_timing": self.robot.get_sensor_timing()})
+            elif command["command"] == "get_sampling":
+                await __reply__({"sampling": self.robot.get_sampling_stats()})
+            elif command["command"] == "ota_begin":
+                # Start (or resume) receiving a firmware bundle, the data frames follow without responses
+                if self.robot.is_cleaning or self.robot.is_scripting:
+                    await __reply__({"ota_error": "The robot is busy"})
+                    return
+                ready = self.__ota__.begin(command["size"], command["sha256"], command.get("window"))
+                self.__logger__.info(f"Firmware Update: {command['size']} bytes from offset {ready['offset']}")
+                await __reply__({"ota_ready": ready})
+            elif command["command"] == "ota_finish":
+                # Verify and stage the bundle, then reset to swap it in (see `boot.py`)
+                try:
+                    names = self.__ota__.finish()
+                except ValueError as e:
+                    await __reply__({"ota_error": str(e)})
+                    return
+                self.__logger__.info(f"Firmware Update: {len(names)} files staged, resetting")
+                await __reply__({"ota_done": {"files": len(names)}})
+                await asyncio.sleep(0.5)
+                machine.reset()
+            elif command["command"] == "ota_abort":
+                self.__ota__.abort()
+                await __reply__({"ota_aborted": True})
+            elif command["command"] == "ota_status":
+                await __reply__({"ota_status": self.__ota__.status})
+            elif command["command"] == "get_boot_report":
+                report = dict(self.robot.boot_report)
+                report["advertising_ms"] = self.__advertising_ms__
+                await __reply__({"boot": report})
+            elif command["command"] == "get_safety":
+                await __reply__({"safety": self.robot.safety.stats})
+            elif command["command"] == "set_safety_param":
+                value = self.robot.safety.set_param(command["name"], command["value"])
+                self.__logger__.info(f"Set Safety Param: {command['name']} to {value}")
+                await __reply__(
+                    {
+                        "safety_param_set": {
+                            "name": command["name"],
+                            "value": value,
+                        }
+                    }
+                )
+            elif command["command"] == "bench_sensor_math":
+                # Compare the samples per second of the interpreted and the compiled sensor math
+                await __reply__({"sensor_math": fastmath.benchmark(command.get("samples", 2000))})
+            elif command["command"] == "get_heading":
+                status = dict(self.robot.heading.status)
+                status["params"] = self.robot.heading.get_params()
+                await __reply__({"heading": status})
+            elif command["command"] == "set_heading_param":
+                value = self.robot.heading.set_param(command["name"], command["value"])
+                self.__logger__.info(f"Set Heading Param: {command['name']} to {value}")
+                await __reply__(
+                    {
+                        "heading_param_set": {
+                            "name": command["name"],
+                            "value": value,
+                        }
+                    }
+                )
+            elif command["command"] == "get_edge_stats":
+                await __reply__({"edge_stats": self.robot.get_edge_stats()})
+            elif command["command"] == "get_stall_stats":
+                stats = self.robot.get_stall_stats()
+                stats["params"] = self.robot.get_stall_params()
+                await __reply__({"stall": stats})
+            elif command["command"] == "set_stall_param":
+                value = self.robot.set_stall_param(command["name"], command["value"])
+                self.__logger__.info(f"Set Stall Param: {command['name']} to {value}")
+                await __reply__(
+                    {
+                        "stall_param_set": {
+                            "name": command["name"],
+                            "value": value,
+                        }
+                    }
+                )
+            elif command["command"] == "get_i2c_stats":
+                await __reply__({"i2c": self.robot.i2c_bus.stats})
+            elif command["command"] == "get_memory":
+                await __reply__({"memory": self.robot.memory.stats})
+            elif command["command"] == "set_memory_param":
+                value = self.robot.memory.set_param(command["name"], command["value"])
+                self.__logger__.info(f"Set Memory Param: {command['name']} to {value}")
+                await __reply__(
+                    {
+                        "memory_param_set": {
+                            "name": command["name"],
+                            "value": value,
+                        }
+                    }
+                )
+            elif command["command"] == "get_log":
+                # Send the buffered log records in multiple chunks
+                await __reply_chunked__(
+                    "log",
+                    {
+                        "lines": self.__logger__.dump(),
+                        "stats": self.__logger__.stats,
+                    },
+                )
             else:
-                print(f"Unknown Command: {command}")
+                self.__logger__.warning(f"Unknown Command: {command}")
         except Exception as e:
-            print(f"Error Handling Command: {e}")
+            self.__logger__.error(f"Error Handling Command: {e}")
+            if request_id is not None:
+                await __reply__({"error": str(e)})
+        finally:
+            # Acknowledge commands without a response of their own, so clients can match every request
+            if request_id is not None and not replied:
+                await self.write({"ack": command_name}, request_id)
 
     # Define the `__wait_connections__` coroutine
     async def __wait_connections__(self):
         while True:
             # Start the advertising and wait for the connection, if disconnected, restart the advertising
+            if self.__advertising_ms__ is None:
+                # The millisecond ticks start at reset, so this is the time until the robot is connectable
+                self.__advertising_ms__ = time.ticks_ms()  # type: ignore
+                self.__logger__.info(f"Advertising after {self.__advertising_ms__} ms")
             try:
                 async with await aioble.advertise(
                     self.__ADV_INTERVAL_US__,
@@ -169,9 +458,9 @@ class ConnectionManager:
                     appearance=self.__APPEARANCE__,
                 ) as connection:
                     await connection.disconnected(timeout_ms=None)
-                    print("Disconnected")
+                    self.__logger__.info("Disconnected")
             except Exception as e:
-                print(f"Error Connection Waiter: {e}")
+                self.__logger__.error(f"Error Connection Waiter: {e}")
 
     # Define the `__listener__` coroutine
     async def __listener__(self):
@@ -179,9 +468,15 @@ class ConnectionManager:
             # Listen for the incoming data and handle the commands
             try:
                 _, data = await self.__data_char__.written()
+                # Firmware update frames are handled without the pause, so a window of frames is not throttled
+                if data and data[0] == FirmwareUpdate.FRAME_MARKER:
+                    ack = self.__ota__.receive(data)
+                    if ack is not None:
+                        await self.write({"ota_ack": {"offset": ack[0], "resend": ack[1]}})
+                    continue
                 res = data.decode("utf-8")
                 await self.__handle_commands__(res)
                 await asyncio.sleep(0.01)
             except Exception as e:
-                print(f"Error Listener: {e}")
+                self.__logger__.error(f"Error Listener: {e}")
                 await asyncio.sleep(1)
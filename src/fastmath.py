@@ -0,0 +1,157 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import math
+import time
+
+try:
+    import micropython  # type:ignore
+except ImportError:
+    # Allow the functions to run on the host: the code emitters are MicroPython only,
+    # so the decorators leave the functions as they are
+    class micropython:
+        @staticmethod
+        def native(function):
+            return function
+
+        viper = native
+
+
+try:
+    __ticks_us__ = time.ticks_us  # type: ignore
+    __ticks_diff__ = time.ticks_diff  # type: ignore
+except AttributeError:
+    def __ticks_us__():
+        return int(time.perf_counter() * 1000000)
+
+    def __ticks_diff__(end, start):
+        return end - start
+
+
+# Define the `decode_le16` function
+@micropython.native
+def decode_le16(data, index: int):
+    # Decode the little-endian signed 16-bit value at `index` of the `data` buffer
+    value = data[index] | (data[index + 1] << 8)
+    return value - 65536 if value & 0x8000 else value
+
+
+# Define the `calibrate` function
+@micropython.viper
+def calibrate(raw: int, offset: int, scale_q10: int) -> int:
+    # Apply the hard-iron `offset` and the soft-iron scale (in 1/1024) to a raw magnetometer value
+    return ((raw - offset) * scale_q10) >> 10
+
+
+# Define the `calibration_q10` function
+def calibration_q10(calibration: dict) -> tuple:
+    # Convert the `calibration` of the magnetometer ("x"/"y"/"z" offsets in raw units and soft-iron scales)
+    # into integer (offset, scale) pairs for `calibrate`. The calibration writes scales of 2 / span (about 3e-4),
+    # which would round to 0 in 1/1024, so the scales are taken relative to the largest one: the heading
+    # only depends on their ratio, and the calibrated values stay in raw units
+    unit = max(abs(calibration[axis]["scale"]) for axis in ("x", "y", "z")) or 1
+    values = []
+    for axis in ("x", "y", "z"):
+        values.append(round(calibration[axis]["offset"]))
+        values.append(round(calibration[axis]["scale"] * 1024 / unit))
+    return tuple(values)
+
+
+# Define the `echo_to_mm` function
+@micropython.viper
+def echo_to_mm(pulse_us: int) -> int:
+    # Convert an echo time (in us) to the distance (in mm): 100 / 582 as a 16-bit fraction
+    # (within 1 mm of `pulse_us * 100 // 582` over the whole range of the sensor)
+    return (pulse_us * 11261) >> 16
+
+
+# Define the `atan2_cdeg` function
+@micropython.native
+def atan2_cdeg(y: int, x: int) -> int:
+    # Return atan2(y, x) in 0.01° (0 to 35999) using integers only. Within the first octant,
+    # atan(z) ≈ 45z + z(1 - z)(14.04 + 3.78z) degrees for z = min / max, which stays within 0.1°
+    if x == 0 and y == 0:
+        return 0
+    ax = x if x >= 0 else -x
+    ay = y if y >= 0 else -y
+    # Keep both magnitudes below 2^16, so the ratio fits a small integer in Q14
+    while ax > 0xFFFF or ay > 0xFFFF:
+        ax >>= 1
+        ay >>= 1
+    swapped = ay > ax
+    if swapped:
+        z = (ax << 14) // ay
+    else:
+        z = (ay << 14) // ax
+    angle = (4500 * z + ((z * (16384 - z)) >> 14) * (1404 + ((378 * z) >> 14))) >> 14
+    if swapped:
+        angle = 9000 - angle
+    if x < 0:
+        angle = 18000 - angle
+    if y < 0:
+        angle = 36000 - angle
+    return angle % 36000
+
+
+# Define the `heading_cdeg` function
+@micropython.native
+def heading_cdeg(x: int, y: int, declination_cdeg: int) -> int:
+    # Return the compass heading (in 0.01°, 0 to 35999) of the calibrated field `x`/`y`
+    return (atan2_cdeg(y, x) + declination_cdeg) % 36000
+
+
+# Define the `heading_float` function
+def heading_float(x: float, y: float, declination: float) -> float:
+    # The floating-point heading (in degrees), as computed before the fixed-point path
+    heading = math.degrees(math.atan2(y, x)) + declination
+    if heading < 0:
+        heading += 360
+    elif heading > 360:
+        heading -= 360
+    return heading
+
+
+# Define the `benchmark` function
+def benchmark(samples: int = 2000) -> dict:
+    # Measure the samples per second of the floating-point and the fixed-point heading and echo conversions,
+    # and the largest heading error (in 0.01°) of the fixed-point path over a full circle
+    fields = []
+    for index in range(64):
+        angle = index * 2 * math.pi / 64
+        fields.append((int(3000 * math.cos(angle)) + 120, int(3000 * math.sin(angle)) - 80))
+    count = len(fields)
+    results = {}
+
+    start = __ticks_us__()
+    for index in range(samples):
+        x, y = fields[index % count]
+        heading_float((x - 120) * 1.02, (y + 80) * 0.98, 3.6)
+    results["heading_float"] = samples * 1000000 // max(1, __ticks_diff__(__ticks_us__(), start))
+
+    start = __ticks_us__()
+    for index in range(samples):
+        x, y = fields[index % count]
+        heading_cdeg(calibrate(x, 120, 1044), calibrate(y, -80, 1004), 360)
+    results["heading_fixed"] = samples * 1000000 // max(1, __ticks_diff__(__ticks_us__(), start))
+
+    start = __ticks_us__()
+    for index in range(samples):
+        index * 100 // 582
+    results["echo_bytecode"] = samples * 1000000 // max(1, __ticks_diff__(__ticks_us__(), start))
+
+    start = __ticks_us__()
+    for index in range(samples):
+        echo_to_mm(index)
+    results["echo_fixed"] = samples * 1000000 // max(1, __ticks_diff__(__ticks_us__(), start))
+
+    error = 0
+    for index in range(3600):
+        angle = index * math.pi / 1800
+        x = int(4000 * math.cos(angle))
+        y = int(4000 * math.sin(angle))
+        difference = abs(atan2_cdeg(y, x) - heading_float(x, y, 0) * 100) % 36000
+        error = max(error, min(difference, 36000 - difference))
+    results["max_error_cdeg"] = round(error, 1)
+    return results
@@ -0,0 +1,138 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import asyncio
+import math
+import time
+
+from micropython import const  # type:ignore
+
+from src.config import ParameterStore
+
+
+# Define the `PoseEstimator` class
+class PoseEstimator:
+    # Define the class constants
+    WHEEL_BASE = const(230)
+
+    # Define the `__init__` method
+    def __init__(self, motor_left, motor_right, magnetometer, rate_hz: int = 50):
+        # Set the motors whose commands are integrated and the heading source (the magnetometer or
+        # the `HeadingFilter` fusing it with a gyro) used to correct the yaw
+        self.__motor_left__ = motor_left
+        self.__motor_right__ = motor_right
+        self.__magnetometer__ = magnetometer
+        self.__period_ms__ = 1000 // rate_hz
+        # Load the PWM-to-velocity model: v = gain * (duty - deadband) in mm/s,
+        # and the weight of the magnetometer heading in the yaw correction
+        self.__model__ = ParameterStore(
+            "odometry",
+            {
+                "gain": 7.0,
+                "deadband": 10.0,
+                "heading_weight": 0.1,
+            },
+            limits={
+                "gain": (0.1, 100.0),
+                "deadband": (0.0, 90.0),
+                "heading_weight": (0.0, 1.0),
+            },
+        )
+        self.__listeners__ = []
+        self.__pose__ = [0.0, 0.0, 0.0]
+        self.__last_ticks__ = time.ticks_us()  # type: ignore
+
+    # Define the `pose` property
+    @property
+    def pose(self):
+        # Return the estimated (x, y, theta), with x/y in mm relative to the start and theta as compass heading
+        return self.__pose__[0], self.__pose__[1], self.__pose__[2]
+
+    # Define the `model` property
+    @property
+    def model(self):
+        return self.__model__.get_params()
+
+    # Define the `subscribe` method
+    def subscribe(self, callback):
+        # Call `callback(x, y, theta)` after every update
+        self.__listeners__.append(callback)
+
+    # Define the `reset` method
+    def reset(self, x: float = 0.0, y: float = 0.0, theta: float | None = None):
+        # Reset the pose, taking the current magnetometer heading if no `theta` is given
+        if theta is None:
+            theta = self.__magnetometer__.read()["heading"]
+        self.__pose__[0] = x
+        self.__pose__[1] = y
+        self.__pose__[2] = theta
+        self.__last_ticks__ = time.ticks_us()  # type: ignore
+
+    # Define the `wheel_velocity` method
+    def wheel_velocity(self, motor) -> float:
+        # Convert the commanded duty and direction of the `motor` into a wheel velocity (in mm/s)
+        if motor.direction == 0:
+            return 0.0
+        duty = motor.speed - self.__model__["deadband"]
+        if duty <= 0:
+            return 0.0
+        return motor.direction * duty * self.__model__["gain"]
+
+    # Define the `update` method
+    def update(self):
+        # Integrate the wheel velocities over the time since the last update
+        now = time.ticks_us()  # type: ignore
+        dt = time.ticks_diff(now, self.__last_ticks__) / 1000000  # type: ignore
+        self.__last_ticks__ = now
+        v_left = self.wheel_velocity(self.__motor_left__)
+        v_right = self.wheel_velocity(self.__motor_right__)
+        velocity = (v_left + v_right) / 2
+        yaw_rate = math.degrees((v_left - v_right) / self.WHEEL_BASE)
+
+        # Predict the heading from the yaw rate and correct it towards the magnetometer heading
+        pose = self.__pose__
+        previous = pose[2]
+        theta = previous + yaw_rate * dt
+        error = (self.__magnetometer__.read()["heading"] - theta + 180) % 360 - 180
+        theta = (theta + self.__model__["heading_weight"] * error) % 360
+
+        # Advance the position along the mean heading of the interval
+        heading = math.radians(previous + ((theta - previous + 180) % 360 - 180) / 2)
+        pose[0] += velocity * dt * math.sin(heading)
+        pose[1] += velocity * dt * math.cos(heading)
+        pose[2] = theta
+        for callback in self.__listeners__:
+            callback(pose[0], pose[1], theta)
+
+    # Define the `run` method
+    async def run(self):
+        # Publish the pose at the fixed rate
+        self.__last_ticks__ = time.ticks_us()  # type: ignore
+        while True:
+            start = time.ticks_ms()  # type: ignore
+            self.update()
+            elapsed = time.ticks_diff(time.ticks_ms(), start)  # type: ignore
+            await asyncio.sleep_ms(max(0, self.__period_ms__ - elapsed))  # type: ignore
+
+    # Define the `fit` method
+    def fit(self, samples: list):
+        # Fit the velocity model to (duty, measured velocity in mm/s) samples by least squares and save it
+        n = len(samples)
+        if n < 2:
+            raise ValueError("At least two samples are needed to fit the velocity model")
+        sum_x = sum(s[0] for s in samples)
+        sum_y = sum(s[1] for s in samples)
+        sum_xx = sum(s[0] * s[0] for s in samples)
+        sum_xy = sum(s[0] * s[1] for s in samples)
+        denominator = n * sum_xx - sum_x * sum_x
+        if denominator == 0:
+            raise ValueError("The samples need at least two different duties")
+        gain = (n * sum_xy - sum_x * sum_y) / denominator
+        if gain <= 0:
+            raise ValueError("The measured velocities do not increase with the duty")
+        intercept = (sum_y - gain * sum_x) / n
+        self.__model__.set_param("gain", gain)
+        self.__model__.set_param("deadband", max(0.0, -intercept / gain))
+        return self.model
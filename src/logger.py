@@ -0,0 +1,200 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import asyncio
+import os
+import struct
+import time
+
+from micropython import const  # type:ignore
+from pyb import USB_VCP  # type: ignore
+
+from src.config import BoardConfigManager, Singleton
+
+# Define the log levels
+DEBUG = const(10)
+INFO = const(20)
+WARNING = const(30)
+ERROR = const(40)
+LEVEL_NAMES = {DEBUG: "DEBUG", INFO: "INFO", WARNING: "WARNING", ERROR: "ERROR"}
+
+
+# Define the `Logger` class
+@Singleton
+class Logger:
+    # Define the class constants: every slot holds the ticks (uint32), the level (uint8),
+    # the message length (uint16) and the UTF-8 encoded message (truncated to fit the slot)
+    SLOT_HEADER_FORMAT = "<IBH"
+    SLOT_HEADER_SIZE = const(7)
+    SLOT_SIZE = const(96)
+    SLOTS = const(32)
+    REPEAT_WINDOW_MS = const(1000)
+    MAX_FILE_SIZE = const(65536)
+
+    # Define the `__init__` method
+    def __init__(self):
+        # Load the log configuration and allocate the ring buffer once
+        self.__board_config_manager__ = BoardConfigManager()
+        config = self.__board_config_manager__.get("log", {})
+        self.__level__ = config.get("level", INFO)
+        self.__to_console__ = config.get("console", True)
+        self.__to_file__ = config.get("file", False)
+        self.__log_file__ = "../logs/system.log"
+        if self.__to_file__ and not self.__board_config_manager__.isdir("../logs"):
+            os.mkdir("../logs")
+        self.__buffer__ = bytearray(self.SLOTS * self.SLOT_SIZE)
+        self.__head__ = 0
+        self.__count__ = 0
+        self.__pending__ = 0
+        self.__dropped__ = 0
+        self.__suppressed__ = 0
+        # Remember the last message to rate-limit repeats of it
+        self.__last_message__ = None
+        self.__last_level__ = INFO
+        self.__last_ticks__ = 0
+        self.__repeats__ = 0
+        self.__vcp__ = USB_VCP()
+
+    # Define the `level` property
+    @property
+    def level(self):
+        return self.__level__
+
+    # Define the `level` setter
+    @level.setter
+    def level(self, level: int):
+        # Set the minimum level of the messages that are logged
+        if level not in LEVEL_NAMES:
+            raise ValueError("Invalid log level")
+        self.__level__ = level
+
+    # Define the `stats` property
+    @property
+    def stats(self):
+        return {
+            "buffered": self.__count__,
+            "pending": self.__pending__,
+            "dropped": self.__dropped__,
+            "suppressed": self.__suppressed__,
+        }
+
+    # Define the `log` method
+    def log(self, level: int, message: str):
+        # Write the `message` into the ring buffer, counting repeats of the last message
+        # within `REPEAT_WINDOW_MS` instead of writing them again
+        if level < self.__level__:
+            return
+        now = time.ticks_ms()  # type: ignore
+        if (
+            message == self.__last_message__
+            and time.ticks_diff(now, self.__last_ticks__) < self.REPEAT_WINDOW_MS  # type: ignore
+        ):
+            self.__repeats__ += 1
+            self.__suppressed__ += 1
+            return
+        self.__flush_repeats__()
+        self.__last_message__ = message
+        self.__last_level__ = level
+        self.__last_ticks__ = now
+        self.__write__(now, level, message)
+
+    # Define the `debug` method
+    def debug(self, message: str):
+        self.log(DEBUG, message)
+
+    # Define the `info` method
+    def info(self, message: str):
+        self.log(INFO, message)
+
+    # Define the `warning` method
+    def warning(self, message: str):
+        self.log(WARNING, message)
+
+    # Define the `error` method
+    def error(self, message: str):
+        self.log(ERROR, message)
+
+    # Define the `__flush_repeats__` method
+    def __flush_repeats__(self):
+        # Write a summary record for the suppressed repeats of the last message
+        if self.__repeats__:
+            self.__write__(
+                time.ticks_ms(),  # type: ignore
+                self.__last_level__,
+                f"(last message repeated {self.__repeats__} times)",
+            )
+            self.__repeats__ = 0
+
+    # Define the `__write__` method
+    def __write__(self, ticks: int, level: int, message: str):
+        # Pack the record into the next slot, overwriting the oldest record if the buffer is full
+        data = message.encode("utf-8")[: self.SLOT_SIZE - self.SLOT_HEADER_SIZE]
+        offset = self.__head__ * self.SLOT_SIZE
+        struct.pack_into(self.SLOT_HEADER_FORMAT, self.__buffer__, offset, ticks, level, len(data))
+        start = offset + self.SLOT_HEADER_SIZE
+        self.__buffer__[start : start + len(data)] = data
+        self.__head__ = (self.__head__ + 1) % self.SLOTS
+        if self.__count__ < self.SLOTS:
+            self.__count__ += 1
+        if self.__pending__ < self.SLOTS:
+            self.__pending__ += 1
+        else:
+            self.__dropped__ += 1
+
+    # Define the `__format_slot__` method
+    def __format_slot__(self, slot: int) -> str:
+        # Format the record in the `slot` as a line of text
+        offset = slot * self.SLOT_SIZE
+        ticks, level, length = struct.unpack_from(self.SLOT_HEADER_FORMAT, self.__buffer__, offset)
+        start = offset + self.SLOT_HEADER_SIZE
+        message = bytes(self.__buffer__[start : start + length]).decode("utf-8", "ignore")
+        return f"[{ticks}] {LEVEL_NAMES.get(level, level)}: {message}"
+
+    # Define the `dump` method
+    def dump(self) -> list:
+        # Return the buffered records (oldest first) as lines of text, e.g. to send them over the command channel
+        self.__flush_repeats__()
+        first = (self.__head__ - self.__count__) % self.SLOTS
+        return [self.__format_slot__((first + i) % self.SLOTS) for i in range(self.__count__)]
+
+    # Define the `drain` method
+    def drain(self, limit: int = 8):
+        # Write up to `limit` pending records to the console (if a host is connected) and the log file
+        self.__flush_repeats__()
+        count = min(limit, self.__pending__)
+        if not count:
+            return
+        to_console = self.__to_console__ and self.__vcp__.isconnected()
+        first = (self.__head__ - self.__pending__) % self.SLOTS
+        lines = [self.__format_slot__((first + i) % self.SLOTS) for i in range(count)]
+        self.__pending__ -= count
+        if to_console:
+            for line in lines:
+                print(line)
+        if self.__to_file__:
+            try:
+                try:
+                    if os.stat(self.__log_file__)[6] > self.MAX_FILE_SIZE:
+                        try:
+                            os.remove(self.__log_file__ + ".1")
+                        except OSError:
+                            pass
+                        os.rename(self.__log_file__, self.__log_file__ + ".1")
+                except OSError:
+                    pass
+                with open(self.__log_file__, "a") as f:
+                    for line in lines:
+                        f.write(line)
+                        f.write("\n")
+            except OSError:
+                # The log cannot log its own failure, so disable the file output
+                self.__to_file__ = False
+
+    # Define the `run` method
+    async def run(self, interval_ms: int = 200):
+        # Drain the pending records in the background
+        while True:
+            self.drain()
+            await asyncio.sleep_ms(interval_ms)  # type: ignore
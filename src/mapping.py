@@ -0,0 +1,264 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import math
+
+try:
+    from micropython import const  # type:ignore
+except ImportError:
+    # Allow the map to be used on the host (e.g. in `tools/simulation.py`)
+    def const(value):
+        return value
+
+
+# Define the `OccupancyGrid` class
+class OccupancyGrid:
+    # Define the class constants (log-odds are stored as unsigned bytes around `UNKNOWN`)
+    RAM_BUDGET = const(20480)
+    UNKNOWN = const(128)
+    LOG_ODDS_FREE = const(8)
+    LOG_ODDS_OCCUPIED = const(12)
+    LOG_ODDS_MIN = const(28)
+    LOG_ODDS_MAX = const(228)
+    FREE_THRESHOLD = const(124)
+    OCCUPIED_THRESHOLD = const(136)
+    MAX_RANGE = const(2000)
+    ROBOT_RADIUS = const(150)
+
+    # Define the `__init__` method
+    def __init__(self, width: int = 128, height: int = 128, cell_size: int = 100):
+        # Check that the log-odds cells and the coverage bitmap fit into the RAM budget
+        size = width * height
+        if size + (size + 7) // 8 > self.RAM_BUDGET:
+            raise ValueError(
+                f"A {width}x{height} grid exceeds the RAM budget of {self.RAM_BUDGET} bytes"
+            )
+
+        # Set the grid dimensions and allocate the cells once, with the robot starting in the center
+        self.__width__ = width
+        self.__height__ = height
+        self.__cell_size__ = cell_size
+        self.__origin__ = (height // 2, width // 2)
+        self.__cells__ = bytearray(size)
+        self.__covered__ = bytearray((size + 7) // 8)
+        # The bounds (min row, min col, max row, max col) of the cells that changed between unknown, free and
+        # occupied since the last `take_changes`, so the planner only re-scans the lanes near them
+        self.__changes__ = [0, 0, 0, 0]
+        self.reset()
+
+    # Define the `width` property
+    @property
+    def width(self):
+        return self.__width__
+
+    # Define the `height` property
+    @property
+    def height(self):
+        return self.__height__
+
+    # Define the `cell_size` property
+    @property
+    def cell_size(self):
+        return self.__cell_size__
+
+    # Define the `reset` method
+    def reset(self):
+        # Mark every cell as unknown and uncovered without reallocating the buffers
+        cells = self.__cells__
+        for i in range(len(cells)):
+            cells[i] = self.UNKNOWN
+        covered = self.__covered__
+        for i in range(len(covered)):
+            covered[i] = 0
+        changes = self.__changes__
+        changes[0], changes[1], changes[2], changes[3] = 0, 0, self.__height__ - 1, self.__width__ - 1
+
+    # Define the `world_to_cell` method
+    def world_to_cell(self, x: float, y: float):
+        # Convert a position (in mm, relative to the start position) into a (row, col) cell
+        return (
+            self.__origin__[0] + int(y // self.__cell_size__),
+            self.__origin__[1] + int(x // self.__cell_size__),
+        )
+
+    # Define the `cell_to_world` method
+    def cell_to_world(self, row: int, col: int):
+        # Convert a (row, col) cell into the position (in mm) of its center
+        return (
+            (col - self.__origin__[1] + 0.5) * self.__cell_size__,
+            (row - self.__origin__[0] + 0.5) * self.__cell_size__,
+        )
+
+    # Define the `in_bounds` method
+    def in_bounds(self, row: int, col: int) -> bool:
+        return 0 <= row < self.__height__ and 0 <= col < self.__width__
+
+    # Define the `log_odds` method
+    def log_odds(self, row: int, col: int) -> int:
+        # Return the log-odds of the cell relative to unknown (positive means occupied)
+        return self.__cells__[row * self.__width__ + col] - self.UNKNOWN
+
+    # Define the `is_free` method
+    def is_free(self, row: int, col: int) -> bool:
+        return self.__cells__[row * self.__width__ + col] < self.FREE_THRESHOLD
+
+    # Define the `is_occupied` method
+    def is_occupied(self, row: int, col: int) -> bool:
+        return self.__cells__[row * self.__width__ + col] > self.OCCUPIED_THRESHOLD
+
+    # Define the `is_covered` method
+    def is_covered(self, row: int, col: int) -> bool:
+        index = row * self.__width__ + col
+        return bool(self.__covered__[index >> 3] & (1 << (index & 7)))
+
+    # Define the `take_changes` method
+    def take_changes(self):
+        # Return the bounds (min row, min col, max row, max col) of the cells that changed their class since
+        # the last call, or `None` if none did, and start collecting the next changes
+        changes = self.__changes__
+        if changes[0] > changes[2]:
+            return None
+        bounds = tuple(changes)
+        changes[0], changes[1], changes[2], changes[3] = self.__height__, self.__width__, -1, -1
+        return bounds
+
+    # Define the `__mark_changed__` method
+    def __mark_changed__(self, row: int, col: int):
+        changes = self.__changes__
+        if row < changes[0]:
+            changes[0] = row
+        if col < changes[1]:
+            changes[1] = col
+        if row > changes[2]:
+            changes[2] = row
+        if col > changes[3]:
+            changes[3] = col
+
+    # Define the `update` method
+    def update(self, x: float, y: float, heading: float, distance: dict, ranges: dict | None = None):
+        # Integrate the `left`, `front` and `right` ranges (in mm) measured at the pose (x, y, heading),
+        # where `ranges` optionally holds the range of interest of each sensor
+        for name, offset in (("left", -90), ("front", 0), ("right", 90)):
+            # Skip the sensors that were not sampled
+            if name not in distance:
+                continue
+            distance_mm = distance[name]
+            max_range = self.MAX_RANGE if ranges is None else min(self.MAX_RANGE, ranges[name])
+            # Readings beyond the range (or failed readings) only clear the cells up to the range
+            hit = 0 < distance_mm < max_range
+            ray = (distance_mm if hit else max_range) + self.ROBOT_RADIUS
+            angle = math.radians(heading + offset)
+            self.__trace__(
+                self.world_to_cell(x, y),
+                self.world_to_cell(x + ray * math.sin(angle), y + ray * math.cos(angle)),
+                hit,
+            )
+
+    # Define the `__trace__` method
+    def __trace__(self, start: tuple, end: tuple, hit: bool):
+        # Walk the cells between `start` and `end` (Bresenham), lowering their log-odds,
+        # and raise the log-odds of the `end` cell if the ray hit an obstacle
+        cells = self.__cells__
+        width = self.__width__
+        height = self.__height__
+        free = self.LOG_ODDS_FREE
+        minimum = self.LOG_ODDS_MIN
+        free_threshold = self.FREE_THRESHOLD
+        occupied_threshold = self.OCCUPIED_THRESHOLD
+        row, col = start
+        end_row, end_col = end
+        d_row = abs(end_row - row)
+        d_col = abs(end_col - col)
+        s_row = 1 if end_row > row else -1
+        s_col = 1 if end_col > col else -1
+        err = d_col - d_row
+        while row != end_row or col != end_col:
+            if 0 <= row < height and 0 <= col < width:
+                index = row * width + col
+                old = cells[index]
+                value = old - free
+                if value < minimum:
+                    value = minimum
+                cells[index] = value
+                if value < free_threshold <= old or value <= occupied_threshold < old:
+                    self.__mark_changed__(row, col)
+            e2 = 2 * err
+            if e2 > -d_row:
+                err -= d_row
+                col += s_col
+            if e2 < d_col:
+                err += d_col
+                row += s_row
+
+        if hit and 0 <= row < height and 0 <= col < width:
+            index = row * width + col
+            old = cells[index]
+            value = old + self.LOG_ODDS_OCCUPIED
+            if value > self.LOG_ODDS_MAX:
+                value = self.LOG_ODDS_MAX
+            cells[index] = value
+            if old < free_threshold <= value or old <= occupied_threshold < value:
+                self.__mark_changed__(row, col)
+
+    # Define the `mark_covered` method
+    def mark_covered(self, x: float, y: float, radius: int):
+        # Mark the cells within `radius` (in mm) of the position (x, y) as cleaned
+        covered = self.__covered__
+        width = self.__width__
+        center_row, center_col = self.world_to_cell(x, y)
+        cells = radius // self.__cell_size__
+        for row in range(max(0, center_row - cells), min(self.__height__, center_row + cells + 1)):
+            d_row = row - center_row
+            for col in range(max(0, center_col - cells), min(width, center_col + cells + 1)):
+                d_col = col - center_col
+                if d_row * d_row + d_col * d_col <= cells * cells:
+                    index = row * width + col
+                    covered[index >> 3] |= 1 << (index & 7)
+
+    # Define the `uncovered_cells` method
+    def uncovered_cells(self):
+        # Yield the (row, col) of every cell that is known to be free but has not been cleaned yet
+        for row in range(self.__height__):
+            for col in range(self.__width__):
+                if self.is_free(row, col) and not self.is_covered(row, col):
+                    yield row, col
+
+    # Define the `rle_encode` method
+    @staticmethod
+    def rle_encode(data) -> bytes:
+        # Compress `data` into (run length, value) byte pairs
+        out = bytearray()
+        i = 0
+        n = len(data)
+        while i < n:
+            value = data[i]
+            run = 1
+            while i + run < n and run < 255 and data[i + run] == value:
+                run += 1
+            out.append(run)
+            out.append(value)
+            i += run
+        return bytes(out)
+
+    # Define the `rle_decode` method
+    @staticmethod
+    def rle_decode(data) -> bytes:
+        # Expand the (run length, value) byte pairs produced by `rle_encode`
+        out = bytearray()
+        for i in range(0, len(data), 2):
+            out.extend(bytes([data[i + 1]]) * data[i])
+        return bytes(out)
+
+    # Define the `export` method
+    def export(self) -> dict:
+        # Export the grid with run-length encoded log-odds cells and coverage bitmap
+        return {
+            "width": self.__width__,
+            "height": self.__height__,
+            "cell_size": self.__cell_size__,
+            "origin": list(self.__origin__),
+            "cells": self.rle_encode(self.__cells__),
+            "covered": self.rle_encode(self.__covered__),
+        }
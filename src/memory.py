@@ -0,0 +1,199 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import gc
+import time
+
+from micropython import const  # type:ignore
+
+from src.config import ParameterStore
+
+
+# Define the `MemorySection` class
+class MemorySection:
+    # Define the `__init__` method
+    def __init__(self, monitor, name: str):
+        # Measure the heap allocated by one pass through a loop section. A section must not span an `await`
+        # of another task using the same section, and its statistics are preallocated, so measuring does not allocate
+        self.name = name
+        self.__monitor__ = monitor
+        self.__alloc__ = 0
+        self.__ticks__ = 0
+        # Passes, bytes allocated, most bytes in one pass, collections inside the section, longest such pass (in us)
+        self.stats = [0, 0, 0, 0, 0]
+
+    # Define the `enter` method
+    def enter(self):
+        self.__ticks__ = time.ticks_us()  # type: ignore
+        self.__alloc__ = gc.mem_alloc()
+
+    # Define the `leave` method
+    def leave(self):
+        alloc = gc.mem_alloc()
+        stats = self.stats
+        stats[0] += 1
+        allocated = alloc - self.__alloc__
+        if allocated < 0:
+            # The heap shrank, so the collector ran inside the section: its pass bounds the pause
+            elapsed = time.ticks_diff(time.ticks_us(), self.__ticks__)  # type: ignore
+            stats[3] += 1
+            if elapsed > stats[4]:
+                stats[4] = elapsed
+        else:
+            stats[1] += allocated
+            if allocated > stats[2]:
+                stats[2] = allocated
+        self.__monitor__.__check__(alloc)
+
+
+# Define the `MemoryMonitor` class
+class MemoryMonitor:
+    # Define the class constants
+    MAX_SECTIONS = const(8)
+    MIN_THRESHOLD = const(1024)
+
+    # Define the `__init__` method
+    def __init__(self):
+        # Load the strict mode flag and the free heap (in bytes) below which strict mode collects anyway
+        self.__params__ = ParameterStore(
+            "memory",
+            {
+                "strict": 0,
+                "reserve": 16384,
+            },
+            limits={
+                "strict": (0, 1),
+                "reserve": (4096, 131072),
+            },
+        )
+        self.__sections__ = {}
+        self.__held__ = False
+        self.__threshold__ = -1
+        self.__peak_alloc__ = gc.mem_alloc()
+        self.__min_free__ = gc.mem_free()
+        # Collections: count, total and longest pause (in us), and the forced ones in strict mode
+        self.__collections__ = [0, 0, 0, 0]
+
+    # Define the `strict` property
+    @property
+    def strict(self):
+        return bool(self.__params__["strict"])
+
+    # Define the `section` method
+    def section(self, name: str):
+        # Return the (preallocated) section `name`, creating it on first use
+        if name not in self.__sections__:
+            if len(self.__sections__) >= self.MAX_SECTIONS:
+                raise ValueError(f"At most {self.MAX_SECTIONS} memory sections can be measured")
+            self.__sections__[name] = MemorySection(self, name)
+        return self.__sections__[name]
+
+    # Define the `get_params` method
+    def get_params(self):
+        return self.__params__.get_params()
+
+    # Define the `set_param` method
+    def set_param(self, name: str, value: int):
+        # Update a parameter (switching the strict mode takes effect with the next routine)
+        return self.__params__.set_param(name, value)
+
+    # Define the `hold` method
+    def hold(self):
+        # In strict mode, start the control loop on a freshly collected heap and let the automatic collection
+        # wait until all of the heap but the reserve was allocated, so the collector only runs where `collect`
+        # is called (at lane boundaries and idle points). The collector stays enabled (unlike `gc.disable()`),
+        # so an allocation of another task that finds the heap full still collects instead of raising a
+        # `MemoryError`
+        if not self.strict or self.__held__:
+            return
+        self.collect()
+        self.__threshold__ = gc.threshold()
+        self.__raise_threshold__()
+        self.__held__ = True
+
+    # Define the `__raise_threshold__` method
+    def __raise_threshold__(self):
+        # Let the next automatic collection wait until the free heap falls to the reserve
+        gc.threshold(max(self.MIN_THRESHOLD, gc.mem_free() - self.__params__["reserve"]))
+
+    # Define the `release` method
+    def release(self):
+        # Restore the allocation threshold of the automatic collection
+        if self.__held__:
+            gc.threshold(self.__threshold__)
+            self.__held__ = False
+
+    # Define the `boundary` method
+    def boundary(self):
+        # Collect at a point where a pause does no harm (e.g. a lane boundary), if the collector is held off,
+        # and let the automatic collection wait for the reserve of the freshly collected heap again
+        if self.__held__:
+            self.collect()
+            self.__raise_threshold__()
+
+    # Define the `collect` method
+    def collect(self, forced: bool = False):
+        # Run the collector and measure its pause
+        start = time.ticks_us()  # type: ignore
+        gc.collect()
+        pause = time.ticks_diff(time.ticks_us(), start)  # type: ignore
+        collections = self.__collections__
+        collections[0] += 1
+        collections[1] += pause
+        if pause > collections[2]:
+            collections[2] = pause
+        if forced:
+            collections[3] += 1
+        return pause
+
+    # Define the `__check__` method
+    def __check__(self, alloc: int):
+        # Track the peak heap use and, while the collector is held off, collect before the heap runs out
+        if alloc > self.__peak_alloc__:
+            self.__peak_alloc__ = alloc
+        free = gc.mem_free()
+        if free < self.__min_free__:
+            self.__min_free__ = free
+        if self.__held__ and free < self.__params__["reserve"]:
+            self.collect(forced=True)
+
+    # Define the `stats` property
+    @property
+    def stats(self):
+        count, total, worst, forced = self.__collections__
+        sections = {}
+        for name, section in self.__sections__.items():
+            passes, allocated, most, collected, longest = section.stats
+            sections[name] = {
+                "passes": passes,
+                "alloc_mean": allocated // passes if passes else 0,
+                "alloc_max": most,
+                "collections": collected,
+                "worst_pass_us": longest,
+            }
+        return {
+            "strict": self.strict,
+            "held": self.__held__,
+            "mem_free": gc.mem_free(),
+            "mem_alloc": gc.mem_alloc(),
+            "peak_alloc": self.__peak_alloc__,
+            "min_free": self.__min_free__,
+            "gc": {
+                "count": count,
+                "mean_us": total // count if count else 0,
+                "worst_us": worst,
+                "forced": forced,
+            },
+            "sections": sections,
+        }
+
+    # Define the `reset` method
+    def reset(self):
+        # Clear the statistics
+        self.__peak_alloc__ = gc.mem_alloc()
+        self.__min_free__ = gc.mem_free()
+        self.__collections__ = [0, 0, 0, 0]
+        for section in self.__sections__.values():
+            section.stats = [0, 0, 0, 0, 0]
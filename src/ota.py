@@ -0,0 +1,295 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import binascii
+import hashlib
+import io
+import json
+import os
+import struct
+
+try:
+    from micropython import const  # type:ignore
+except ImportError:
+    # Allow the updater to be used on the host (e.g. by the stand-in robot in `tools/client.py`)
+    def const(value):
+        return value
+
+
+try:
+    import deflate  # type:ignore
+except ImportError:
+    # Fall back to `zlib` on older MicroPython versions and on the host
+    import zlib
+
+    deflate = None
+
+
+# Define the `__isdir__` function
+def __isdir__(path: str):
+    try:
+        return (os.stat(path)[0] & 0x4000) != 0
+    except OSError:
+        return False
+
+
+# Define the `__makedirs__` function
+def __makedirs__(path: str):
+    # Create the directory `path` and its missing parents (MicroPython has no `os.makedirs`)
+    parts = path.split("/")
+    for index in range(1, len(parts) + 1):
+        current = "/".join(parts[:index])
+        if parts[index - 1] not in ("", ".", "..") and not __isdir__(current):
+            os.mkdir(current)
+
+
+# Define the `__remove_tree__` function
+def __remove_tree__(path: str):
+    if not __isdir__(path):
+        return
+    for name in os.listdir(path):
+        child = f"{path}/{name}"
+        if __isdir__(child):
+            __remove_tree__(child)
+        else:
+            os.remove(child)
+    os.rmdir(path)
+
+
+# Define the `apply_swap` function
+def apply_swap(root: str = ".."):
+    # Move the staged files listed in the swap journal over the firmware files and drop the journal.
+    # Every step can be repeated, so an update cut off by a reset is completed by the next call (see `boot.py`)
+    ota_dir = f"{root}/{FirmwareUpdate.OTA_DIR}"
+    try:
+        with open(f"{ota_dir}/swap.json") as f:
+            names = json.load(f)
+    except (OSError, ValueError):
+        return 0
+    for name in names:
+        staged = f"{ota_dir}/staged/{name}"
+        target = f"{root}/{name}"
+        try:
+            os.stat(staged)
+        except OSError:
+            # Already moved before the reset
+            continue
+        __makedirs__(target.rsplit("/", 1)[0])
+        try:
+            os.remove(target)
+        except OSError:
+            pass
+        os.rename(staged, target)
+    os.remove(f"{ota_dir}/swap.json")
+    __remove_tree__(f"{ota_dir}/staged")
+    return len(names)
+
+
+# Define the `FirmwareUpdate` class
+class FirmwareUpdate:
+    # Define the class constants: every data frame is the marker byte (never the start of a JSON command),
+    # the offset, length and CRC-32 of its payload, followed by the payload
+    OTA_DIR = "ota"
+    FRAME_MARKER = const(0xA5)
+    FRAME_FORMAT = "<BIHI"
+    FRAME_HEADER_SIZE = const(11)
+    CHUNK_SIZE = const(480)
+    WINDOW = const(8)
+
+    # Define the `__init__` method
+    def __init__(self, root: str = ".."):
+        # Stage the bundle below `root` (the firmware directory), resuming a transfer cut off by a disconnect
+        self.__root__ = root
+        self.__dir__ = f"{root}/{self.OTA_DIR}"
+        self.__part_file__ = f"{self.__dir__}/firmware.part"
+        self.__state_file__ = f"{self.__dir__}/state.json"
+        self.__file__ = None
+        self.__state__ = None
+        self.__window__ = self.WINDOW
+        self.__unacked__ = 0
+        # The offset of the last frame rejected since the last NACK (`None` while no NACK is outstanding)
+        self.__nacked__ = None
+        self.__stats__ = {"frames": 0, "rejected": 0}
+
+    # Define the `active` property
+    @property
+    def active(self):
+        return self.__file__ is not None
+
+    # Define the `status` property
+    @property
+    def status(self):
+        state = self.__state__ or self.__load_state__()
+        status = {
+            "active": self.active,
+            "offset": state["offset"] if state else 0,
+            "size": state["size"] if state else 0,
+        }
+        status.update(self.__stats__)
+        return status
+
+    # Define the `__load_state__` method
+    def __load_state__(self):
+        try:
+            with open(self.__state_file__) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    # Define the `__save_state__` method
+    def __save_state__(self):
+        # Persist the acknowledged offset after the data up to it reached the file
+        self.__file__.flush()
+        with open(self.__state_file__, "w") as f:
+            json.dump(self.__state__, f)
+
+    # Define the `begin` method
+    def begin(self, size: int, sha256: str, window: int | None = None):
+        # Start (or resume) receiving a bundle of `size` bytes, returning the offset to send from
+        self.__close__()
+        __makedirs__(self.__dir__)
+        state = self.__load_state__()
+        if state and state["size"] == size and state["sha256"] == sha256:
+            # Resume the same bundle from the last acknowledged offset
+            try:
+                self.__file__ = open(self.__part_file__, "r+b")
+                self.__file__.seek(state["offset"])
+            except OSError:
+                self.__file__ = None
+        if self.__file__ is None:
+            state = {"size": size, "sha256": sha256, "offset": 0}
+            self.__file__ = open(self.__part_file__, "wb")
+        self.__state__ = state
+        self.__window__ = max(1, min(window or self.WINDOW, 32))
+        self.__unacked__ = 0
+        self.__nacked__ = None
+        self.__stats__ = {"frames": 0, "rejected": 0}
+        self.__save_state__()
+        return {"offset": state["offset"], "chunk_size": self.CHUNK_SIZE, "window": self.__window__}
+
+    # Define the `receive` method
+    def receive(self, frame: bytes):
+        # Append a data frame, returning `(offset, resend)` when the sender has to be acknowledged: every half
+        # window (so the sender never stalls), at the end, and on a lost or corrupted frame, in which case the
+        # sender has to go back to the acknowledged offset. The frames still in flight behind a NACK are dropped
+        # silently, but a rejected frame at or before the last rejected one means that the sender went back and
+        # lost (part of) the resent frames again, so it is sent another NACK
+        if self.__file__ is None or len(frame) < self.FRAME_HEADER_SIZE:
+            return None
+        _, offset, length, crc = struct.unpack(self.FRAME_FORMAT, frame[: self.FRAME_HEADER_SIZE])
+        payload = memoryview(frame)[self.FRAME_HEADER_SIZE :]
+        state = self.__state__
+        if offset != state["offset"] or length != len(payload) or binascii.crc32(payload) != crc:
+            self.__stats__["rejected"] += 1
+            if offset < state["offset"]:
+                return None
+            nacked = self.__nacked__
+            self.__nacked__ = offset
+            if nacked is not None and offset > nacked:
+                return None
+            self.__flush_ack__()
+            return state["offset"], True
+        self.__file__.write(payload)
+        state["offset"] += length
+        self.__stats__["frames"] += 1
+        self.__unacked__ += 1
+        self.__nacked__ = None
+        if self.__unacked__ >= (self.__window__ + 1) // 2 or state["offset"] >= state["size"]:
+            self.__flush_ack__()
+            return state["offset"], False
+        return None
+
+    # Define the `__flush_ack__` method
+    def __flush_ack__(self):
+        self.__unacked__ = 0
+        self.__save_state__()
+
+    # Define the `finish` method
+    def finish(self):
+        # Verify the complete bundle, extract it into the staging directory and write the swap journal.
+        # Returns the staged file names; the swap itself is done by `apply_swap` (e.g. after a reset)
+        state = self.__state__
+        if state is None or state["offset"] != state["size"]:
+            raise ValueError("The firmware bundle is incomplete")
+        self.__close__()
+        digest = hashlib.sha256()
+        with open(self.__part_file__, "rb") as f:
+            while True:
+                block = f.read(1024)
+                if not block:
+                    break
+                digest.update(block)
+        if binascii.hexlify(digest.digest()).decode() != state["sha256"]:
+            self.abort()
+            raise ValueError("The firmware bundle does not match its hash")
+        names = self.__extract__(f"{self.__dir__}/staged")
+        with open(f"{self.__dir__}/swap.json", "w") as f:
+            json.dump(names, f)
+        os.remove(self.__part_file__)
+        os.remove(self.__state_file__)
+        self.__state__ = None
+        return names
+
+    # Define the `__extract__` method
+    def __extract__(self, target: str):
+        # Extract the zip entries written by `build.py build` (deflated or stored, with the sizes in the local
+        # headers), checking the CRC-32 of every file
+        __remove_tree__(target)
+        names = []
+        with open(self.__part_file__, "rb") as f:
+            while True:
+                header = f.read(30)
+                if len(header) < 30 or header[:4] != b"PK\x03\x04":
+                    break
+                _, _, flags, method, _, _, crc, compressed_size, size, name_length, extra_length = struct.unpack(
+                    "<IHHHHHIIIHH", header
+                )
+                if flags & 0x08:
+                    raise ValueError("Unsupported zip entry (sizes in a data descriptor)")
+                name = f.read(name_length).decode()
+                f.seek(extra_length, 1)
+                data = f.read(compressed_size)
+                if method == 8:
+                    data = self.__inflate__(data)
+                elif method != 0:
+                    raise ValueError(f"Unsupported compression method {method} for '{name}'")
+                if len(data) != size or binascii.crc32(data) != crc:
+                    raise ValueError(f"Corrupted file '{name}' in the firmware bundle")
+                # Skip directories, paths outside the firmware directory and the hash manifest for `build.py sync`
+                if name.endswith("/") or name.startswith("/") or ".." in name.split("/") or name == ".sync_manifest.json":
+                    continue
+                path = f"{target}/{name}"
+                __makedirs__(path.rsplit("/", 1)[0])
+                with open(path, "wb") as out:
+                    out.write(data)
+                names.append(name)
+        if not names:
+            raise ValueError("The firmware bundle is empty")
+        return names
+
+    # Define the `__inflate__` method
+    @staticmethod
+    def __inflate__(data: bytes):
+        if deflate is not None:
+            return deflate.DeflateIO(io.BytesIO(data), deflate.RAW).read()
+        return zlib.decompress(data, -15)
+
+    # Define the `abort` method
+    def abort(self):
+        # Drop the received data and the staged files
+        self.__close__()
+        for path in (self.__part_file__, self.__state_file__):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+        __remove_tree__(f"{self.__dir__}/staged")
+        self.__state__ = None
+
+    # Define the `__close__` method
+    def __close__(self):
+        if self.__file__ is not None:
+            self.__file__.close()
+            self.__file__ = None
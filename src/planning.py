@@ -0,0 +1,256 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import math
+
+try:
+    from micropython import const  # type:ignore
+except ImportError:
+    # Allow the planner to run on the host (e.g. in `tools/simulation.py`)
+    def const(value):
+        return value
+
+
+# Define the `BoustrophedonPlanner` class
+class BoustrophedonPlanner:
+    # Define the class constants
+    MIN_SEGMENT_CELLS = const(3)
+    DONE_RATIO = const(80)
+    MAX_ATTEMPTS = const(2)
+
+    # Define the `__init__` method
+    def __init__(self, grid, lane_spacing: int, clearance: int = 200):
+        # Plan on top of the given `OccupancyGrid`, with lanes `lane_spacing` mm apart that keep
+        # `clearance` mm (at least the robot radius) away from the obstacles at their ends
+        self.__grid__ = grid
+        self.__lane_spacing__ = lane_spacing
+        self.__clearance__ = clearance
+        self.reset(0, 0, 0)
+
+    # Define the `axis` property
+    @property
+    def axis(self):
+        # The heading of the lanes (in degrees), snapped to the grid axes
+        return self.__axis__
+
+    # Define the `reset` method
+    def reset(self, x: float, y: float, heading: float):
+        # Align the lanes with the grid axis closest to `heading` and let lane 0 pass through (x, y)
+        self.__axis__ = (round(heading / 90) * 90) % 360
+        self.__sin__ = math.sin(math.radians(self.__axis__))
+        self.__cos__ = math.cos(math.radians(self.__axis__))
+        self.__lane_offset__ = 0
+        self.__lane_offset__ = self.to_lane_frame(x, y)[1]
+        self.__attempts__ = {}
+        # The lanes moved, so re-scan all of them on the next `decompose`
+        self.__segments__ = {}
+        self.__decomposition__ = None
+        self.__sweep__ = 1
+        self.__lane__ = 0
+        self.__direction__ = 1
+        self.__lanes_done__ = 0
+
+    # Define the `to_lane_frame` method
+    def to_lane_frame(self, x: float, y: float):
+        # Convert a position into (along-lane, across-lane) coordinates
+        return (
+            x * self.__sin__ + y * self.__cos__,
+            x * self.__cos__ - y * self.__sin__ - self.__lane_offset__,
+        )
+
+    # Define the `from_lane_frame` method
+    def from_lane_frame(self, u: float, v: float):
+        # Convert (along-lane, across-lane) coordinates back into a position
+        v += self.__lane_offset__
+        return (
+            u * self.__sin__ + v * self.__cos__,
+            u * self.__cos__ - v * self.__sin__,
+        )
+
+    # Define the `lane_of` method
+    def lane_of(self, x: float, y: float) -> int:
+        return round(self.to_lane_frame(x, y)[1] / self.__lane_spacing__)
+
+    # Define the `segments` method
+    def segments(self, lane: int):
+        # Return the (start, end) along-lane intervals (in mm) of the lane that are known to be free
+        # and have no known obstacle within the clearance on either side, shortened by the clearance at both ends
+        grid = self.__grid__
+        step = grid.cell_size
+        clearance = self.__clearance__
+        offsets = [i * step for i in range(1, clearance // step + 1)]
+        offsets += [-offset for offset in offsets]
+        extent = max(grid.width, grid.height) * step * 3 // 4
+        v = lane * self.__lane_spacing__
+        segments = []
+        start = None
+        u = -extent
+        while u <= extent:
+            row, col = grid.world_to_cell(*self.from_lane_frame(u, v))
+            free = grid.in_bounds(row, col) and grid.is_free(row, col)
+            for offset in offsets:
+                if not free:
+                    break
+                row, col = grid.world_to_cell(*self.from_lane_frame(u, v + offset))
+                free = grid.in_bounds(row, col) and not grid.is_occupied(row, col)
+            if free and start is None:
+                start = u
+            elif not free and start is not None:
+                if u - step - start - 2 * clearance >= self.MIN_SEGMENT_CELLS * step:
+                    segments.append((start + clearance, u - step - clearance))
+                start = None
+            u += step
+        return segments
+
+    # Define the `__refresh__` method
+    def __refresh__(self, lanes: int):
+        # Re-scan the segments of the lanes that pass within the clearance of a cell that changed between
+        # unknown, free and occupied since the last refresh (all of them after a reset), and drop the
+        # decomposition if any lane was re-scanned
+        grid = self.__grid__
+        changes = grid.take_changes()
+        if not self.__segments__:
+            first, last = -lanes, lanes
+        elif changes is None:
+            return
+        else:
+            # Find the across-lane extent of the changed cells, widened by the probes of `segments`
+            min_row, min_col, max_row, max_col = changes
+            half = grid.cell_size / 2
+            x_min, y_min = grid.cell_to_world(min_row, min_col)
+            x_max, y_max = grid.cell_to_world(max_row, max_col)
+            across = [
+                self.to_lane_frame(x, y)[1]
+                for x in (x_min - half, x_max + half)
+                for y in (y_min - half, y_max + half)
+            ]
+            margin = self.__clearance__ + grid.cell_size
+            first = max(-lanes, math.floor((min(across) - margin) / self.__lane_spacing__))
+            last = min(lanes, math.ceil((max(across) + margin) / self.__lane_spacing__))
+        for lane in range(first, last + 1):
+            self.__segments__[lane] = self.segments(lane)
+        self.__decomposition__ = None
+
+    # Define the `decompose` method
+    def decompose(self):
+        # Decompose the free space seen so far into cells of consecutive, overlapping lane segments.
+        # A new cell starts whenever the connectivity between two neighbouring lanes changes (split or merge).
+        # The decomposition is cached until the map changes near a lane, so do not modify it
+        grid = self.__grid__
+        lanes = max(grid.width, grid.height) * grid.cell_size * 3 // 4 // self.__lane_spacing__
+        self.__refresh__(lanes)
+        if self.__decomposition__ is not None:
+            return self.__decomposition__
+        cells = []
+        previous = []
+        for lane in range(-lanes, lanes + 1):
+            segments = self.__segments__[lane]
+            current = []
+            for start, end in segments:
+                overlaps = [p for p in previous if p[0] < end and start < p[1]]
+                if len(overlaps) == 1 and (
+                    len([s for s in segments if s[0] < overlaps[0][1] and overlaps[0][0] < s[1]]) == 1
+                ):
+                    cell = overlaps[0][2]
+                else:
+                    cell = len(cells)
+                    cells.append([])
+                cells[cell].append((lane, start, end))
+                current.append((start, end, cell))
+            previous = current
+        self.__decomposition__ = cells
+        return cells
+
+    # Define the `is_done` method
+    def is_done(self, lane: int, start: float, end: float) -> bool:
+        # A lane segment is done once most of it is covered, or it was attempted too often
+        if self.__attempts__.get(lane, 0) >= self.MAX_ATTEMPTS:
+            return True
+        grid = self.__grid__
+        v = lane * self.__lane_spacing__
+        total = covered = 0
+        u = start
+        while u <= end:
+            row, col = grid.world_to_cell(*self.from_lane_frame(u, v))
+            if grid.in_bounds(row, col):
+                total += 1
+                covered += grid.is_covered(row, col)
+            u += grid.cell_size
+        return total == 0 or covered * 100 >= total * self.DONE_RATIO
+
+    # Define the `begin_lane` method
+    def begin_lane(self, x: float, y: float, heading: float):
+        # Record the lane and direction the robot starts sweeping
+        self.__lane__ = self.lane_of(x, y)
+        self.__direction__ = 1 if math.cos(math.radians(heading - self.__axis__)) >= 0 else -1
+        self.__attempts__[self.__lane__] = self.__attempts__.get(self.__lane__, 0) + 1
+
+    # Define the `end_lane` method
+    def end_lane(self):
+        self.__lanes_done__ += 1
+
+    # Define the `skip` method
+    def skip(self, step: dict):
+        # Give up on the lane of a step that the sensors contradicted
+        self.__attempts__[step["lane"]] = self.MAX_ATTEMPTS
+
+    # Define the `next_step` method
+    def next_step(self, x: float, y: float):
+        # Return how to reach the next lane, or `None` once every lane segment is done
+        u, _ = self.to_lane_frame(x, y)
+        lane = self.lane_of(x, y)
+        remaining = []
+        current_cell = None
+        for index, cell in enumerate(self.decompose()):
+            for segment in cell:
+                if segment[0] == lane and segment[1] - self.__lane_spacing__ <= u <= segment[2] + self.__lane_spacing__:
+                    current_cell = index
+                if not self.is_done(*segment):
+                    remaining.append((index, segment))
+        if not remaining:
+            return None
+
+        # Prefer the neighbouring lane of the same cell in the sweep direction, reachable with a U-turn
+        margin = self.__grid__.cell_size
+        for sweep in (self.__sweep__, -self.__sweep__):
+            for index, (seg_lane, start, end) in remaining:
+                if index == current_cell and seg_lane == lane + sweep and start - margin <= u <= end + margin:
+                    self.__sweep__ = sweep
+                    return {
+                        "kind": "shift",
+                        "lane": seg_lane,
+                        "turn": 90 * sweep * self.__direction__,
+                        "distance": self.__lane_spacing__,
+                    }
+
+        # Otherwise transit to the closest end of the nearest remaining segment
+        best = None
+        for index, (seg_lane, start, end) in remaining:
+            for end_u, heading in ((start, self.__axis__), (end, (self.__axis__ + 180) % 360)):
+                target = self.from_lane_frame(end_u, seg_lane * self.__lane_spacing__)
+                distance = math.sqrt((target[0] - x) ** 2 + (target[1] - y) ** 2)
+                if best is None or distance < best["distance"]:
+                    best = {
+                        "kind": "transit",
+                        "lane": seg_lane,
+                        "bearing": math.degrees(math.atan2(target[0] - x, target[1] - y)) % 360,
+                        "distance": distance,
+                        "heading": heading,
+                    }
+        return best
+
+    # Define the `progress` method
+    def progress(self) -> dict:
+        # Count the lane segments that are done in the current decomposition
+        total = done = 0
+        for cell in self.decompose():
+            for segment in cell:
+                total += 1
+                done += self.is_done(*segment)
+        return {
+            "lanes_swept": self.__lanes_done__,
+            "segments_done": done,
+            "segments_total": total,
+        }
@@ -0,0 +1,181 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import asyncio
+import os
+import struct
+import time
+
+from micropython import const  # type:ignore
+
+from src.config import BoardConfigManager
+from src.logger import Logger
+
+
+# Define the `FlightRecorder` class
+class FlightRecorder:
+    # Define the file header and the record layout (see `tools/flight_log.py` for the host-side loader):
+    # ticks_ms (uint32), kind (uint8), code (uint8) and seven int16 values
+    MAGIC = b"SSPFLT01"
+    HEADER_FORMAT = "<8sHHI"
+    HEADER_SIZE = const(16)
+    RECORD_FORMAT = "<IBBhhhhhhh"
+    RECORD_SIZE = const(20)
+    # Define the record kinds
+    KIND_SENSORS = const(1)
+    KIND_MOTORS = const(2)
+    KIND_STATE = const(3)
+    # Define the routine state codes
+    STATE_IDLE = const(0)
+    STATE_START = const(1)
+    STATE_STOP = const(2)
+    STATE_LANE = const(3)
+    STATE_TURN = const(4)
+    STATE_SURVEY = const(5)
+    STATE_SHIFT = const(6)
+    STATE_TRANSIT = const(7)
+    STATE_FALLBACK = const(8)
+    STATE_DONE = const(9)
+    STATE_FAULT = const(10)
+    STATE_EDGE = const(11)
+    STATE_CORNER = const(12)
+    STATE_STUCK = const(13)
+
+    # Define the `__init__` method
+    def __init__(
+        self,
+        capacity: int = 512,
+        block_size: int = 256,
+        max_file_size: int = 1048576,
+    ):
+        # Allocate the ring buffer once and set the log file next to the config directory
+        self.__capacity__ = capacity
+        self.__block_size__ = block_size
+        self.__max_file_size__ = max_file_size
+        self.__buffer__ = bytearray(capacity * self.RECORD_SIZE)
+        self.__head__ = 0
+        self.__pending__ = 0
+        self.__dropped__ = 0
+        self.__log_dir__ = "../logs"
+        self.__log_file__ = "../logs/flight.bin"
+        if not BoardConfigManager().isdir(self.__log_dir__):
+            os.mkdir(self.__log_dir__)
+
+    # Define the `stats` property
+    @property
+    def stats(self):
+        return {
+            "capacity": self.__capacity__,
+            "pending": self.__pending__,
+            "dropped": self.__dropped__,
+        }
+
+    # Define the `record` method
+    def record(self, kind: int, code: int = 0, *values):
+        # Pack a record into the next slot of the ring buffer, overwriting the oldest
+        # unflushed record if the buffer is full
+        values = values + (0,) * (7 - len(values))
+        struct.pack_into(
+            self.RECORD_FORMAT,
+            self.__buffer__,
+            self.__head__ * self.RECORD_SIZE,
+            time.ticks_ms(),  # type: ignore
+            kind,
+            code,
+            *values,
+        )
+        self.__head__ = (self.__head__ + 1) % self.__capacity__
+        if self.__pending__ < self.__capacity__:
+            self.__pending__ += 1
+        else:
+            self.__dropped__ += 1
+
+    # Define the `sensors` method
+    def sensors(self, distance: dict, heading: float, raw: tuple):
+        # Record the three distances (in mm), the heading (in 0.1°) and the raw magnetometer values
+        self.record(
+            self.KIND_SENSORS,
+            0,
+            distance["left"],
+            distance["front"],
+            distance["right"],
+            int(heading * 10),
+            raw[0],
+            raw[1],
+            raw[2],
+        )
+
+    # Define the `motors` method
+    def motors(self, left_direction: int, right_direction: int, left_speed: int, right_speed: int):
+        # Record a motor command (direction and duty of both motors)
+        self.record(
+            self.KIND_MOTORS,
+            0,
+            left_direction,
+            right_direction,
+            left_speed,
+            right_speed,
+        )
+
+    # Define the `state` method
+    def state(self, code: int, *values):
+        # Record a routine state transition
+        self.record(self.KIND_STATE, code, *values)
+
+    # Define the `flush_if_due` method
+    def flush_if_due(self):
+        # Flush only once a whole block is pending, so flash writes happen in large blocks
+        if self.__pending__ >= self.__block_size__:
+            self.flush()
+
+    # Define the `flush` method
+    def flush(self):
+        # Append the pending records to the log file (rotating it when it gets too large)
+        pending = self.__pending__
+        if not pending:
+            return
+        try:
+            try:
+                size = os.stat(self.__log_file__)[6]
+            except OSError:
+                size = 0
+            if size + pending * self.RECORD_SIZE > self.__max_file_size__:
+                try:
+                    os.remove(self.__log_file__ + ".1")
+                except OSError:
+                    pass
+                os.rename(self.__log_file__, self.__log_file__ + ".1")
+                size = 0
+            with open(self.__log_file__, "ab") as f:
+                if size == 0:
+                    f.write(
+                        struct.pack(
+                            self.HEADER_FORMAT,
+                            self.MAGIC,
+                            self.RECORD_SIZE,
+                            self.HEADER_SIZE,
+                            0,
+                        )
+                    )
+                # Write the pending records in at most two slices of the ring buffer
+                buffer = memoryview(self.__buffer__)
+                start = (self.__head__ - pending) % self.__capacity__
+                end = start + pending
+                if end <= self.__capacity__:
+                    f.write(buffer[start * self.RECORD_SIZE : end * self.RECORD_SIZE])
+                else:
+                    f.write(buffer[start * self.RECORD_SIZE :])
+                    f.write(buffer[: (end - self.__capacity__) * self.RECORD_SIZE])
+            self.__pending__ = 0
+        except OSError as e:
+            Logger().error(f"FLIGHT RECORDER ERROR: {e}")
+
+    # Define the `run` method
+    async def run(self, is_idle, interval_ms: int = 1000):
+        # Flush everything that is pending whenever `is_idle()` reports an idle loop
+        while True:
+            if is_idle():
+                self.flush()
+            await asyncio.sleep_ms(interval_ms)  # type: ignore
@@ -0,0 +1,155 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import time
+
+import micropython  # type: ignore
+from machine import disable_irq, enable_irq  # type: ignore
+from micropython import const  # type:ignore
+from pyb import Timer  # type: ignore
+
+from src.config import ParameterStore
+
+
+# Define the `SafetyMonitor` class
+class SafetyMonitor:
+    # Define the class constants (timer 6 is a basic timer without pins, so it does not collide with the PWM timers)
+    TIMER_ID = const(6)
+    FAULT_NONE = const(0)
+    FAULT_OBSTACLE = const(1)
+    FAULT_STALE = const(2)
+
+    # Define the `__init__` method
+    def __init__(self, drive, motor_left, motor_right, front_sensor, rate_hz: int = 100):
+        # Reserve memory for exceptions raised in the interrupt handler
+        micropython.alloc_emergency_exception_buf(100)
+        # Set the drive to cut, the motors whose direction tells whether the robot drives forward
+        # and the front sensor whose latest reading is checked
+        self.__drive__ = drive
+        self.__motor_left__ = motor_left
+        self.__motor_right__ = motor_right
+        self.__front_sensor__ = front_sensor
+        self.__rate_hz__ = rate_hz
+        # Load the hard minimum front distance (in mm) and the maximum age of the front reading (in ms).
+        # The age has to cover a full `get_distance` of all three sensors in open space
+        self.__limits__ = ParameterStore(
+            "safety",
+            {
+                "min_distance": 150,
+                "max_age_ms": 750,
+            },
+            limits={
+                "min_distance": (50, 1000),
+                "max_age_ms": (50, 5000),
+            },
+        )
+        self.__min_distance__ = self.__limits__["min_distance"]
+        self.__max_age_us__ = self.__limits__["max_age_ms"] * 1000
+        self.__armed__ = False
+        self.__fault__ = self.FAULT_NONE
+        self.__faults__ = 0
+        self.__latency_us__ = 0
+        self.__worst_latency_us__ = 0
+        self.__worst_isr_us__ = 0
+        # Bind the interrupt handler once, as the handler must not allocate
+        self.__handler__ = self.__check__
+        self.__timer__ = None
+
+    # Define the `fault` property
+    @property
+    def fault(self):
+        # Return the latched fault (`FAULT_NONE` if there is none)
+        return self.__fault__
+
+    # Define the `bound_ms` property
+    @property
+    def bound_ms(self):
+        # The worst-case time from the obstacle being measured to the motors being cut:
+        # the reading may be up to `max_age_ms` old before a stale fault, plus one timer period
+        return self.__max_age_us__ // 1000 + 1000 // self.__rate_hz__
+
+    # Define the `stats` property
+    @property
+    def stats(self):
+        return {
+            "armed": self.__armed__,
+            "fault": self.__fault__,
+            "faults": self.__faults__,
+            "latency_us": self.__latency_us__,
+            "worst_latency_us": self.__worst_latency_us__,
+            "worst_isr_us": self.__worst_isr_us__,
+            "bound_ms": self.bound_ms,
+        }
+
+    # Define the `get_params` method
+    def get_params(self):
+        return self.__limits__.get_params()
+
+    # Define the `set_param` method
+    def set_param(self, name: str, value: int):
+        # Update a safety limit, taking effect at the next timer tick
+        value = self.__limits__.set_param(name, value)
+        self.__min_distance__ = self.__limits__["min_distance"]
+        self.__max_age_us__ = self.__limits__["max_age_ms"] * 1000
+        return value
+
+    # Define the `start` method
+    def start(self):
+        # Start checking at the fixed rate (the checks only act while armed)
+        if self.__timer__ is None:
+            self.__timer__ = Timer(self.TIMER_ID, freq=self.__rate_hz__, callback=self.__handler__)
+
+    # Define the `arm` method
+    def arm(self):
+        self.__armed__ = True
+
+    # Define the `disarm` method
+    def disarm(self):
+        self.__armed__ = False
+
+    # Define the `acknowledge` method
+    def acknowledge(self):
+        # Clear the latched fault and release the drive, returning the fault that was acknowledged
+        state = disable_irq()
+        fault = self.__fault__
+        self.__fault__ = self.FAULT_NONE
+        self.__drive__.release()
+        enable_irq(state)
+        return fault
+
+    # Define the `__check__` method
+    def __check__(self, timer):
+        # Timer interrupt handler: while driving forward, cut the motors if the latest front reading
+        # is below the hard minimum or too old to be trusted. Runs in interrupt context, so it must not allocate
+        if not self.__armed__ or self.__fault__:
+            return
+        left = self.__motor_left__
+        right = self.__motor_right__
+        if left.direction != 1 or right.direction != 1:
+            return
+        start = time.ticks_us()  # type: ignore
+        # Read the attributes behind `UltrasonicSensor.latest` directly, as building its tuple would allocate
+        sensor = self.__front_sensor__
+        distance = sensor.__distance__
+        ticks = sensor.__ticks__
+        age = time.ticks_diff(start, ticks)  # type: ignore
+        if age > self.__max_age_us__:
+            fault = self.FAULT_STALE
+        elif distance < self.__min_distance__:
+            fault = self.FAULT_OBSTACLE
+        else:
+            return
+        self.__drive__.emergency_stop()
+        self.__fault__ = fault
+        self.__faults__ += 1
+        # Measure the time from the reading to the cut and the time spent in the handler
+        end = time.ticks_us()  # type: ignore
+        latency = time.ticks_diff(end, ticks)  # type: ignore
+        self.__latency_us__ = latency
+        if latency > self.__worst_latency_us__:
+            self.__worst_latency_us__ = latency
+        duration = time.ticks_diff(end, start)  # type: ignore
+        if duration > self.__worst_isr_us__:
+            self.__worst_isr_us__ = duration
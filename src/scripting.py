@@ -0,0 +1,100 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import asyncio
+
+from micropython import const  # type:ignore
+
+
+# Define the `is_speed` function
+def is_speed(speed) -> bool:
+    # Check that `speed` is what `CleaningRobot.set_speed` takes: the duty (in %) of both motors, or a dict
+    # with the duty of the "left" and of the "right" motor
+    if isinstance(speed, dict):
+        return all(type(speed.get(side)) in (int, float) for side in ("left", "right"))
+    return type(speed) is int
+
+
+# Define the `MotionScript` class
+class MotionScript:
+    # Define the class constants: the operations with their required fields and the limits of a script
+    OPS = {
+        "drive": ("direction", "duration_ms"),
+        "turn": ("degrees",),
+        "brush": ("brush", "value"),
+        "wait": ("duration_ms",),
+    }
+    DIRECTIONS = ("forward", "backward")
+    MAX_STEPS = const(64)
+    MAX_DURATION_MS = const(60000)
+    # Define the largest turn per call of `__turn__`, which wraps its target heading (a full turn would end at once)
+    MAX_TURN_STEP = const(180)
+
+    # Define the `__init__` method
+    def __init__(self, steps: list):
+        # Validate the whole script up front, so a broken script does not stop halfway
+        if not isinstance(steps, list) or not steps:
+            raise ValueError("A script needs at least one step")
+        if len(steps) > self.MAX_STEPS:
+            raise ValueError(f"A script can have at most {self.MAX_STEPS} steps")
+        for index, step in enumerate(steps):
+            self.validate(step, index)
+        self.__steps__ = steps
+
+    # Define the `steps` property
+    @property
+    def steps(self):
+        return self.__steps__
+
+    # Define the `validate` method
+    def validate(self, step: dict, index: int):
+        # Check that the `step` is a known operation with all of its fields
+        op = step.get("op")
+        if op not in self.OPS:
+            raise ValueError(f"Step {index}: unknown operation '{op}'")
+        for field in self.OPS[op]:
+            if field not in step:
+                raise ValueError(f"Step {index}: '{op}' needs '{field}'")
+        if op == "drive" and step["direction"] not in self.DIRECTIONS:
+            raise ValueError(f"Step {index}: invalid direction '{step['direction']}'")
+        if op == "brush" and step["brush"] not in ("main", "side"):
+            raise ValueError(f"Step {index}: invalid brush '{step['brush']}'")
+        if not 0 <= step.get("duration_ms", 0) <= self.MAX_DURATION_MS:
+            raise ValueError(f"Step {index}: the duration must be between 0 and {self.MAX_DURATION_MS} ms")
+        if not -360 <= step.get("degrees", 0) <= 360:
+            raise ValueError(f"Step {index}: the turn must be between -360° and 360°")
+        if step.get("speed") is not None and not is_speed(step["speed"]):
+            raise ValueError(f"Step {index}: the speed must be a duty or have a 'left' and a 'right' duty")
+
+    # Define the `run` method
+    async def run(self, robot, notify=None):
+        # Run the steps on the `robot`, awaiting `notify(index, count)` before every step
+        count = len(self.__steps__)
+        for index, step in enumerate(self.__steps__):
+            if notify is not None:
+                await notify(index, count)
+            op = step["op"]
+            if op == "drive":
+                completed = await robot.__drive_for__(
+                    1 if step["direction"] == "forward" else -1,
+                    step["duration_ms"],
+                    step.get("speed"),
+                )
+                if not completed:
+                    raise RuntimeError(f"Step {index}: stopped by the safety monitor")
+            elif op == "turn":
+                # Turn in steps of at most `MAX_TURN_STEP`, so a full turn is not cut short
+                degrees = step["degrees"]
+                while degrees:
+                    if robot.safety.fault:
+                        raise RuntimeError(f"Step {index}: stopped by the safety monitor")
+                    part = max(-self.MAX_TURN_STEP, min(self.MAX_TURN_STEP, degrees))
+                    await robot.__turn__(part, speed=step.get("speed"))
+                    degrees -= part
+            elif op == "brush":
+                robot.toggle_brush(step["brush"], step["value"])
+            else:
+                await asyncio.sleep_ms(step["duration_ms"])  # type: ignore
+        return count
@@ -3,25 +3,36 @@
 # It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
 
 # Import the necessary libraries
-import math
+import asyncio
 import time
 
-from machine import I2C, Pin, time_pulse_us  # type: ignore
+from machine import Pin, time_pulse_us  # type: ignore
 
-from src.config import BoardConfigManager
+from src.bus import I2CBus
+from src.config import BoardConfigManager, ParameterStore
+from src.fastmath import calibrate, calibration_q10, decode_le16, echo_to_mm, heading_cdeg
+from src.logger import Logger
 
 
 # Define the `UltrasonicSensor` class
 class UltrasonicSensor:
-    # Define the `MAX_RANGE_IN_CM` constant
+    # Define the class constants: the `MAX_RANGE_IN_CM` of the sensor, the result of a reading beyond the
+    # range of interest (larger than every distance, so range comparisons keep working) and the echo timing
     MAX_RANGE_IN_CM = const(500)  # type: ignore
+    BEYOND_RANGE = const(32767)  # type: ignore
+    ECHO_US_PER_MM = 5.82
+    RESPONSE_US = const(1000)  # type: ignore
+    RECOVERY_US = const(60000)  # type: ignore
 
     # Define the `__init__` method
-    def __init__(self, trigger_pin: str, echo_pin: str):
+    def __init__(self, trigger_pin: str, echo_pin: str, max_range_mm: int | None = None):
         # Set the `trigger_pin` and `echo_pin` attributes, and initialize the sensor
         self.__active__ = True
         self.__distance__ = 0
+        self.__ticks__ = time.ticks_us()  # type: ignore
+        self.__triggered__ = self.__ticks__
         self.__board_config_manager__ = BoardConfigManager()
+        self.__logger__ = Logger()
         self.__trigger_pin__ = Pin(
             self.__board_config_manager__.pin_map[trigger_pin],
             Pin.OUT,
@@ -33,41 +44,122 @@ class UltrasonicSensor:
             pull=None,
         )
         self.__trigger_pin__.off()
+        # Assume a typical response time until `characterize` measured the actual one
+        self.__response_us__ = self.RESPONSE_US
+        self.max_range_mm = max_range_mm if max_range_mm is not None else self.MAX_RANGE_IN_CM * 10
 
-    # Define the `__send_pulse__` method
-    def __send_pulse__(self):
-        # Send a pulse to the sensor and return the calculated pulse time
+    # Define the `max_range_mm` property
+    @property
+    def max_range_mm(self):
+        return self.__max_range_mm__
+
+    # Define the `max_range_mm` setter
+    @max_range_mm.setter
+    def max_range_mm(self, max_range_mm: int):
+        # Set the range of interest and derive the echo timeout from it: the echo has to start within
+        # the response time of the sensor and must not last longer than the round trip to `max_range_mm`
+        max_range_mm = min(max_range_mm, self.MAX_RANGE_IN_CM * 10)
+        self.__max_range_mm__ = max_range_mm
+        self.__timeout_us__ = max(
+            int(max_range_mm * self.ECHO_US_PER_MM),
+            2 * self.__response_us__,
+        )
+
+    # Define the `timing` property
+    @property
+    def timing(self):
+        # Return the measured response time, the echo timeout and the range of interest
+        return {
+            "response_us": self.__response_us__,
+            "timeout_us": self.__timeout_us__,
+            "max_range_mm": self.__max_range_mm__,
+        }
+
+    # Define the `characterize` method
+    async def characterize(self, samples: int = 5):
+        # Measure the time from the trigger to the start of the echo (the response time of the sensor)
+        # and derive the echo timeout from the slowest response
+        response_us = 0
+        for _ in range(samples):
+            # Wait (without blocking the event loop) until the echo of the previous pulse is over
+            await asyncio.sleep_ms(self.RECOVERY_US // 1000)  # type: ignore
+            self.__trigger__()
+            # Time how long the echo line stays low after the trigger
+            duration = time_pulse_us(self.__echo_pin__, 0, self.RECOVERY_US)
+            if duration > response_us:
+                response_us = duration
+        if response_us <= 0:
+            self.__logger__.error("US SENSOR ERROR: no response")
+            return self.timing
+        self.__response_us__ = response_us
+        self.max_range_mm = self.__max_range_mm__
+        await asyncio.sleep_ms(self.RECOVERY_US // 1000)  # type: ignore
+        return self.timing
+
+    # Define the `__trigger__` method
+    def __trigger__(self):
+        # Send the 10 µs trigger pulse
         self.__trigger_pin__.off()
         time.sleep_us(5)  # type: ignore
         self.__trigger_pin__.on()
         time.sleep_us(10)  # type: ignore
         self.__trigger_pin__.off()
+        self.__triggered__ = time.ticks_us()  # type: ignore
+
+    # Define the `__send_pulse__` method
+    def __send_pulse__(self):
+        # Send a pulse to the sensor and return the pulse time, `BEYOND_RANGE` if there was no echo
+        # within the range of interest, or -1 if the sensor did not respond
         try:
+            # If the echo line is still high, the sensor still waits for the echo of a previous pulse
+            # that went beyond the range of interest (unless it has been high for too long)
+            if self.__echo_pin__.value():
+                if time.ticks_diff(time.ticks_us(), self.__triggered__) < self.RECOVERY_US:  # type: ignore
+                    return self.BEYOND_RANGE
+                return -1
+            self.__trigger__()
             pulse_time = time_pulse_us(
                 self.__echo_pin__,
                 1,
-                30000,
+                self.__timeout_us__,
             )
-            if pulse_time < 0:
-                pulse_time = int(self.MAX_RANGE_IN_CM * 29.1)
+            if pulse_time == -2:
+                # The echo did not start within the response time
+                return -1
+            if pulse_time < 0 or pulse_time > self.__max_range_mm__ * self.ECHO_US_PER_MM:
+                return self.BEYOND_RANGE
             return pulse_time
         except Exception as e:
-            print(f"US SENSOR ERROR: {e}")
+            self.__logger__.error(f"US SENSOR ERROR: {e}")
             return -1
 
     # Define the `get_distance_mm` method
     def get_distance_mm(self, pulse_count: int = 5):
-        # Get the distance in millimeters
-        try:
-            # Get 5 distances and return the average
-            distances_mm = [
-                (self.__send_pulse__() * 100 // 582) for _ in range(pulse_count)
-            ]
-            # Remove the invalid distances (2499)
-            distances_mm = [x for x in distances_mm if x != 2499]
-            return int(sum(distances_mm) / len(distances_mm))
-        except:
+        # Get the average distance of `pulse_count` pulses in millimeters, `BEYOND_RANGE` if most
+        # pulses saw nothing within the range of interest, or -1 if the sensor did not respond
+        total = 0
+        count = 0
+        beyond = 0
+        for _ in range(pulse_count):
+            pulse_time = self.__send_pulse__()
+            if pulse_time == self.BEYOND_RANGE:
+                beyond += 1
+            elif pulse_time >= 0:
+                total += echo_to_mm(pulse_time)
+                count += 1
+        if count == 0 and beyond == 0:
             return -1
+        distance = total // count if count >= beyond else self.BEYOND_RANGE
+        # Publish the reading with its time for readers outside the control loop (e.g. `SafetyMonitor`)
+        self.__distance__ = distance
+        self.__ticks__ = time.ticks_us()  # type: ignore
+        return distance
+
+    # Define the `latest` property
+    @property
+    def latest(self):
+        # Return the last valid distance (in mm) and the `ticks_us` it was measured at
+        return self.__distance__, self.__ticks__
 
 
 # Define the `Magnetometer` class
@@ -99,15 +191,23 @@ class Magnetometer:
     # Define the `__init__` method
     def __init__(
         self,
-        i2c: I2C,
+        bus: I2CBus,
         address: int = 0x0D,
         indicator_pin: str | None = None,
         config: dict | None = None,
     ):
-        # Set the `i2c`, `address`, `indicator_pin`, and `config` attributes
-        self.__i2c__ = i2c
+        # Set the `bus`, `address`, `indicator_pin`, and `config` attributes
+        # (the `bus` retries failed transactions and recovers the bus, see `src/bus.py`)
+        self.__bus__ = bus
         self.__address__ = address
+        # Preallocate the register buffer, the raw values and the reading, so `read` does not build new containers
+        self.__buffer__ = bytearray(6)
+        self.__raw__ = [0, 0, 0]
+        self.__reading__ = {"x": 0.0, "y": 0.0, "z": 0.0, "heading": 0.0}
+        self.__calibration__ = (0, 1024, 0, 1024, 0, 1024)
+        self.__declination_cdeg__ = 0
         self.__board_config_manager__ = BoardConfigManager()
+        self.__logger__ = Logger()
 
         # For debugging purposes, set the `indicator_pin` attribute
         if indicator_pin is not None:
@@ -206,6 +306,10 @@ class Magnetometer:
             ),
         }
         self.__board_config_manager__.set("magnetometer", config)
+        # Keep the calibration (offsets in raw units, scales relative to the largest one in 1/1024) and the
+        # declination (in 0.01°) as integers for the fixed-point math in `read`
+        self.__calibration__ = calibration_q10(config["calibration"])
+        self.__declination_cdeg__ = config["declination"]["degrees"] * 100 + config["declination"]["minutes"] * 100 // 60
         # Set the configuration of the sensor by writing to the registers
         self.__write_Reg__(
             0x09,
@@ -339,52 +443,282 @@ class Magnetometer:
             heading -= 360
         return heading
 
+    # Define the `raw` property
+    @property
+    def raw(self):
+        # Return the uncalibrated x/y/z values of the last `read`
+        return self.__raw__
+
     # Define the `read` method
     def read(self) -> dict[str, float | int]:
-        # Read the magnetometer values and return the calibrated values
-        data = self.__read_Reg__(0x00, 6)
-
-        v_raw = [
-            self.__int_from_bytes__(data[0:2], "little", signed=True),
-            self.__int_from_bytes__(data[2:4], "little", signed=True),
-            self.__int_from_bytes__(data[4:6], "little", signed=True),
-        ]
-
-        # Calibrate the values
-        v = [
-            (v_raw[0] - self.config["calibration"]["x"]["offset"])
-            * self.config["calibration"]["x"]["scale"],
-            (v_raw[1] - self.config["calibration"]["y"]["offset"])
-            * self.config["calibration"]["y"]["scale"],
-            (v_raw[2] - self.config["calibration"]["z"]["offset"])
-            * self.config["calibration"]["z"]["scale"],
-        ]
-        # Calculate the heading
-        heading = self.__correct_heading__(
-            math.degrees(math.atan2(v[1], v[0])) + self.magnetic_declination_degrees
-        )
+        # Read the magnetometer values and return the calibrated values (in raw units, see `calibration_q10`)
+        # and the heading. The returned dictionary is reused by the next `read`, so copy it to keep it
+        data = self.__buffer__
+        try:
+            self.__bus__.read_into(self.__address__, 0x00, data)
+        except Exception as e:
+            self.__logger__.error(f"MAGNETOMETER ERROR: {e}")
 
-        # Return the calibrated values in a dictionary
-        return {
-            "x": v[0],
-            "y": v[1],
-            "z": v[2],
-            "heading": heading,
-        }
+        # Decode the little-endian signed values in place
+        raw = self.__raw__
+        raw[0] = decode_le16(data, 0)
+        raw[1] = decode_le16(data, 2)
+        raw[2] = decode_le16(data, 4)
+
+        # Calibrate the values and calculate the heading in fixed point (see `src/fastmath.py`)
+        x_offset, x_scale, y_offset, y_scale, z_offset, z_scale = self.__calibration__
+        reading = self.__reading__
+        x = reading["x"] = calibrate(raw[0], x_offset, x_scale)
+        y = reading["y"] = calibrate(raw[1], y_offset, y_scale)
+        reading["z"] = calibrate(raw[2], z_offset, z_scale)
+        reading["heading"] = heading_cdeg(x, y, self.__declination_cdeg__) / 100
+        return reading
 
     # Define the `__write_Reg__` method
     def __write_Reg__(self, reg: int, value: int):
         # Write the `value` to the register `reg` over the I2C bus
         try:
-            self.__i2c__.writeto_mem(self.__address__, reg, bytearray([value]))
+            self.__bus__.write(self.__address__, reg, bytearray([value]))
         except Exception as e:
-            print(f"MAGNETOMETER ERROR: {e}")
+            self.__logger__.error(f"MAGNETOMETER ERROR: {e}")
 
     # Define the `__read_Reg__` method
     def __read_Reg__(self, reg: int, length: int = 1):
         # Read the `length` bytes from the register `reg` over the I2C bus
         try:
-            return self.__i2c__.readfrom_mem(self.__address__, reg, length)
+            data = bytearray(length)
+            self.__bus__.read_into(self.__address__, reg, data)
+            return data
         except Exception as e:
-            print(f"MAGNETOMETER ERROR: {e}")
+            self.__logger__.error(f"MAGNETOMETER ERROR: {e}")
             return b"\x00"
+
+
+# Define the `Gyroscope` class
+class Gyroscope:
+    # Define the class constants: the registers of an MPU-6050-class IMU and the known `WHO_AM_I` values
+    # (the original part and its common successors and clones)
+    REG_SMPLRT_DIV = const(0x19)  # type: ignore
+    REG_CONFIG = const(0x1A)  # type: ignore
+    REG_GYRO_CONFIG = const(0x1B)  # type: ignore
+    REG_INT_ENABLE = const(0x38)  # type: ignore
+    REG_INT_STATUS = const(0x3A)  # type: ignore
+    REG_GYRO_ZOUT_H = const(0x47)  # type: ignore
+    REG_PWR_MGMT_1 = const(0x6B)  # type: ignore
+    REG_WHO_AM_I = const(0x75)  # type: ignore
+    DEVICE_IDS = (0x68, 0x70, 0x71, 0x72, 0x73, 0x98)
+    # Define the full-scale ranges (in °/s) and their register values, where the sensitivity is 32768 / range
+    RANGES = {250: 0x00, 500: 0x08, 1000: 0x10, 2000: 0x18}
+    # Define the `DATA_RDY_INT` bit of the interrupt status and the register gap between it and the z rate,
+    # bridged so that both are read in one burst (and so belong to the same sample)
+    DATA_READY = const(0x01)  # type: ignore
+    SAMPLE_GAP = const(12)  # type: ignore
+
+    # Define the `__init__` method
+    def __init__(self, bus: I2CBus, address: int = 0x68, range_dps: int = 500, sample_rate_hz: int = 500):
+        # Wake the IMU on the `bus`, clocked by the gyro, with the digital low-pass filter at 42 Hz
+        # (so the gyro samples at 1 kHz, divided down to `sample_rate_hz`)
+        if range_dps not in self.RANGES:
+            raise ValueError(f"range_dps must be one of {tuple(self.RANGES)}")
+        self.__bus__ = bus
+        self.__address__ = address
+        self.__buffer__ = bytearray(2)
+        self.__one__ = bytearray(1)
+        self.__bus__.read_into(address, self.REG_WHO_AM_I, self.__one__)
+        if self.__one__[0] not in self.DEVICE_IDS:
+            raise OSError(f"No MPU-6050-class IMU at 0x{address:02X} (WHO_AM_I 0x{self.__one__[0]:02X})")
+        self.__write_Reg__(self.REG_PWR_MGMT_1, 0x01)
+        self.__write_Reg__(self.REG_CONFIG, 0x03)
+        self.__write_Reg__(self.REG_SMPLRT_DIV, max(0, min(255, 1000 // sample_rate_hz - 1)))
+        self.__write_Reg__(self.REG_GYRO_CONFIG, self.RANGES[range_dps])
+        # Flag every new sample in the interrupt status (cleared by reading it)
+        self.__write_Reg__(self.REG_INT_ENABLE, self.DATA_READY)
+        self.__scale__ = range_dps / 32768
+        self.__bias__ = 0
+
+    # Define the `bias` property
+    @property
+    def bias(self):
+        # Return the zero-rate offset (in °/s) subtracted from the readings
+        return self.__bias__ * self.__scale__
+
+    # Define the `__write_Reg__` method
+    def __write_Reg__(self, reg: int, value: int):
+        self.__one__[0] = value
+        self.__bus__.write(self.__address__, reg, self.__one__)
+
+    # Define the `read_raw` method
+    def read_raw(self) -> int:
+        # Read the big-endian signed z rate in raw units
+        data = self.__buffer__
+        self.__bus__.read_into(self.__address__, self.REG_GYRO_ZOUT_H, data)
+        value = (data[0] << 8) | data[1]
+        return value - 65536 if value & 0x8000 else value
+
+    # Define the `read_sample` method
+    async def read_sample(self):
+        # Read the interrupt status and the z rate in one burst behind the bus lock, returning whether
+        # the sample is new since the last `read_sample` and the rate in raw units
+        status, data = await self.__bus__.read_many(
+            self.__address__,
+            [(self.REG_INT_STATUS, 1), (self.REG_GYRO_ZOUT_H, 2)],
+            self.SAMPLE_GAP,
+        )
+        value = (data[0] << 8) | data[1]
+        if value & 0x8000:
+            value -= 65536
+        return bool(status[0] & self.DATA_READY), value
+
+    # Define the `rate_z` method
+    def rate_z(self) -> float:
+        # Return the yaw rate (in °/s, counter-clockwise seen from above for an IMU mounted face up)
+        return (self.read_raw() - self.__bias__) * self.__scale__
+
+    # Define the `calibrate` method
+    async def calibrate(self, samples: int = 200, delay_ms: int = 2):
+        # Average the zero-rate offset over `samples` new samples while the robot stands still, yielding
+        # between the reads. An IMU that delivers no new samples (e.g. a stuck one) raises an `OSError`
+        total = count = 0
+        for _ in range(samples * 4):
+            ready, value = await self.read_sample()
+            if ready:
+                total += value
+                count += 1
+                if count == samples:
+                    break
+            await asyncio.sleep_ms(delay_ms)  # type: ignore
+        if not count:
+            raise OSError(f"No new samples from the IMU at 0x{self.__address__:02X}")
+        self.__bias__ = total // count
+        return self.bias
+
+
+# Define the `HeadingFilter` class
+class HeadingFilter:
+    # Define the class constants: the magnetometer is not read faster than its output data rate (200 Hz)
+    MAGNETOMETER_PERIOD_US = const(5000)  # type: ignore
+
+    # Define the `__init__` method
+    def __init__(self, magnetometer, gyroscope=None):
+        # Fuse the yaw rate of the `gyroscope` with the `magnetometer` heading: the gyro is integrated on every
+        # `read` (low latency, unaffected by metal and motor currents) and the estimate is pulled towards the
+        # magnetometer with a time constant (removing the drift). Without a (working) gyroscope, and until `start`
+        # probed it (it may be a `LazyDevice`) and measured its bias, the filter passes the magnetometer heading
+        # through, so it replaces the magnetometer wherever a heading is read
+        self.__magnetometer__ = magnetometer
+        self.__gyroscope__ = gyroscope
+        self.__logger__ = Logger()
+        # Load the time constant of the magnetometer correction and the gyro sign (-1 for an IMU mounted
+        # face up, as the compass heading grows clockwise, 0 to leave the gyro out)
+        self.__params__ = ParameterStore(
+            "heading",
+            {
+                "time_constant_ms": 500,
+                "gyro_sign": -1,
+            },
+            limits={
+                "time_constant_ms": (10, 10000),
+                "gyro_sign": (-1, 1),
+            },
+        )
+        self.__bias__ = None
+        self.__yaw__ = None
+        self.__ticks__ = 0
+        self.__corrected__ = 0
+        # Reuse the returned reading, like `Magnetometer.read`
+        self.__reading__ = {"heading": 0.0, "rate": 0.0, "magnetic": 0.0}
+
+    # Define the `fused` property
+    @property
+    def fused(self):
+        # The gyro is used once `start` measured its bias
+        return self.__bias__ is not None and self.__params__["gyro_sign"] != 0
+
+    # Define the `period_ms` property
+    @property
+    def period_ms(self):
+        # Return the polling period (in ms) that makes use of the sources: the gyro allows tighter loops
+        return 5 if self.fused else 10
+
+    # Define the `latest` property
+    @property
+    def latest(self):
+        # Return the last reading without taking a new one (the pose estimator keeps it current)
+        return self.__reading__
+
+    # Define the `status` property
+    @property
+    def status(self):
+        # Return a copy of the last reading with the state of the filter
+        status = dict(self.__reading__)
+        status["fused"] = self.fused
+        status["bias"] = self.__bias__
+        return status
+
+    # Define the `get_params` method
+    def get_params(self):
+        return self.__params__.get_params()
+
+    # Define the `set_param` method
+    def set_param(self, name: str, value):
+        return self.__params__.set_param(name, value)
+
+    # Define the `__correct_heading__` method
+    def __correct_heading__(self, heading: float):
+        return self.__magnetometer__.__correct_heading__(heading)
+
+    # Define the `start` method
+    async def start(self):
+        # Probe the gyroscope and measure its bias (the robot has to stand still), falling back to
+        # the magnetometer alone if there is no IMU on the bus (before any turn relies on the gyro)
+        if self.__gyroscope__ is None:
+            return None
+        try:
+            self.__bias__ = await self.__gyroscope__.calibrate()
+            return self.__bias__
+        except OSError as e:
+            self.__drop_gyroscope__(e)
+            return None
+
+    # Define the `__drop_gyroscope__` method
+    def __drop_gyroscope__(self, error: Exception):
+        self.__logger__.warning(f"GYROSCOPE UNAVAILABLE, USING THE MAGNETOMETER ONLY: {error}")
+        self.__gyroscope__ = None
+        self.__bias__ = None
+
+    # Define the `reset` method
+    def reset(self):
+        # Restart the estimate from the next magnetometer reading
+        self.__yaw__ = None
+
+    # Define the `read` method
+    def read(self) -> dict[str, float]:
+        # Update and return the fused heading (in degrees), the yaw rate (in °/s, clockwise) and the
+        # last magnetometer heading. The returned dictionary is reused by the next `read`
+        now = time.ticks_us()  # type: ignore
+        reading = self.__reading__
+        rate = 0.0
+        if self.fused:
+            try:
+                rate = self.__gyroscope__.rate_z() * self.__params__["gyro_sign"]
+            except OSError as e:
+                self.__drop_gyroscope__(e)
+        yaw = self.__yaw__
+        if yaw is None or not self.fused:
+            # Start from (or pass through) the magnetometer heading
+            yaw = reading["magnetic"] = self.__magnetometer__.read()["heading"]
+            self.__corrected__ = now
+        else:
+            # Predict with the gyro, then correct towards the magnetometer once it has a new sample
+            yaw += rate * time.ticks_diff(now, self.__ticks__) / 1000000  # type: ignore
+            elapsed = time.ticks_diff(now, self.__corrected__)  # type: ignore
+            if elapsed >= self.MAGNETOMETER_PERIOD_US:
+                magnetic = reading["magnetic"] = self.__magnetometer__.read()["heading"]
+                weight = elapsed / (elapsed + self.__params__["time_constant_ms"] * 1000)
+                yaw += weight * ((magnetic - yaw + 180) % 360 - 180)
+                self.__corrected__ = now
+        self.__yaw__ = yaw % 360
+        self.__ticks__ = now
+        reading["heading"] = self.__yaw__
+        reading["rate"] = rate
+        return reading
@@ -0,0 +1,201 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import time
+from array import array
+
+try:
+    from micropython import const  # type:ignore
+except ImportError:
+    # Allow the detector to be used on the host (e.g. in `tools/simulation.py`)
+    def const(value):
+        return value
+
+
+try:
+    __ticks_diff__ = time.ticks_diff  # type: ignore
+except AttributeError:
+    def __ticks_diff__(end, start):
+        return end - start
+
+
+# Define the `StallError` class
+class StallError(RuntimeError):
+    # Raised when the robot is still stuck after the allowed recovery attempts
+    pass
+
+
+# Define the `StallDetector` class
+class StallDetector:
+    # Define the class constants: the kinds of stall, the slots of the sliding window and the largest valid range
+    # (readings beyond the range of interest are larger, see `UltrasonicSensor.BEYOND_RANGE`)
+    NONE = const(0)
+    DRIVE = const(1)
+    TURN = const(2)
+    SLOTS = const(9)
+    VALID_RANGE = const(30000)
+    MIN_TURN_EXPECTED = const(45)
+    # Define the default parameters: the window (in ms), the share of the commanded travel (in %) the front range
+    # has to confirm, the commanded travel (in mm) it takes to judge the progress, the heading change (in degrees)
+    # that counts as turning, and the recovery attempts in a row before giving up
+    DEFAULTS = {
+        "window_ms": 1500,
+        "progress": 25,
+        "min_travel": 150,
+        "min_turn": 10,
+        "attempts": 3,
+    }
+
+    # Define the `__init__` method
+    def __init__(self, params: dict | None = None):
+        # Compare the commanded motion with the measured one over a sliding window: the commanded travel and yaw
+        # are integrated from the wheel velocities, the measured ones are the front range and the heading.
+        # The window is preallocated, so `update` does not grow the heap
+        self.__params__ = dict(self.DEFAULTS)
+        if params:
+            self.configure(params)
+        self.__ticks__ = array("i", [0] * self.SLOTS)
+        self.__range__ = array("i", [0] * self.SLOTS)
+        self.__heading__ = array("f", [0.0] * self.SLOTS)
+        self.__travel__ = array("f", [0.0] * self.SLOTS)
+        self.__yaw__ = array("f", [0.0] * self.SLOTS)
+        # Events, drive and turn stalls, recoveries, abandoned routines, total and longest recovery (in ms)
+        self.__stats__ = [0, 0, 0, 0, 0, 0, 0]
+        self.__consecutive__ = 0
+        self.reset()
+
+    # Define the `configure` method
+    def configure(self, params: dict):
+        for name in self.DEFAULTS:
+            if name in params:
+                self.__params__[name] = params[name]
+
+    # Define the `attempts` property
+    @property
+    def attempts(self):
+        return self.__params__["attempts"]
+
+    # Define the `consecutive` property
+    @property
+    def consecutive(self):
+        # Return the stalls detected since the robot last moved freely for a whole window
+        return self.__consecutive__
+
+    # Define the `reset` method
+    def reset(self):
+        # Start a new window, e.g. after a recovery manoeuvre
+        self.__count__ = 0
+        self.__head__ = 0
+        self.__last_ticks__ = None
+        self.__last_heading__ = 0.0
+        self.__heading_sum__ = 0.0
+        self.__travel_sum__ = 0.0
+        self.__yaw_sum__ = 0.0
+
+    # Define the `__store__` method
+    def __store__(self, ticks: int, front: int):
+        head = self.__head__
+        self.__ticks__[head] = ticks
+        self.__range__[head] = front
+        self.__heading__[head] = self.__heading_sum__
+        self.__travel__[head] = self.__travel_sum__
+        self.__yaw__[head] = self.__yaw_sum__
+        self.__head__ = (head + 1) % self.SLOTS
+        if self.__count__ < self.SLOTS:
+            self.__count__ += 1
+
+    # Define the `update` method
+    def update(self, ticks: int, front: int, heading: float, velocity: float, yaw_rate: float) -> int:
+        # Add a sample (the front range in mm, the heading in degrees, the commanded velocity in mm/s and yaw
+        # rate in °/s) and return the kind of stall once the window shows one
+        if self.__last_ticks__ is None:
+            self.__last_ticks__ = ticks
+            self.__last_heading__ = heading
+            self.__store__(ticks, front)
+            return self.NONE
+        params = self.__params__
+        window_ms = params["window_ms"]
+        period_ms = window_ms // (self.SLOTS - 1)
+        # Integrate the commanded motion, at most over one slot, so a gap between two motions (the robot stood
+        # still or moved without being watched, e.g. backing off from a fault) barely counts and the window
+        # carries over short retries
+        dt = min(__ticks_diff__(ticks, self.__last_ticks__), period_ms) / 1000
+        self.__last_ticks__ = ticks
+        self.__travel_sum__ += velocity * dt
+        self.__yaw_sum__ += yaw_rate * dt
+        self.__heading_sum__ += (heading - self.__last_heading__ + 180) % 360 - 180
+        self.__last_heading__ = heading
+        newest = (self.__head__ - 1) % self.SLOTS
+        if __ticks_diff__(ticks, self.__ticks__[newest]) >= period_ms:
+            self.__store__(ticks, front)
+
+        # Judge the motion over the window once it is full
+        oldest = self.__head__ if self.__count__ == self.SLOTS else 0
+        if __ticks_diff__(ticks, self.__ticks__[oldest]) < window_ms:
+            return self.NONE
+        travel = self.__travel_sum__ - self.__travel__[oldest]
+        yaw = self.__yaw_sum__ - self.__yaw__[oldest]
+        turned = abs(self.__heading_sum__ - self.__heading__[oldest])
+        start = self.__range__[oldest]
+        kind = self.NONE
+        if abs(yaw) >= self.MIN_TURN_EXPECTED and turned < params["min_turn"]:
+            # The wheels are told to turn, but the heading does not follow
+            kind = self.TURN
+        elif abs(travel) >= params["min_travel"] and turned < params["min_turn"]:
+            # The wheels are told to drive, but the front range stays flat: every sample of the window is
+            # within the share of the travel (a moving robot sees the range shrink, or jump as the ray sweeps
+            # over other obstacles)
+            band = abs(travel) * params["progress"] // 100
+            moved = abs(front - start) if front < self.VALID_RANGE else band
+            ranges = self.__range__
+            for slot in range(self.__count__):
+                if moved >= band:
+                    break
+                value = ranges[slot]
+                moved = abs(value - start) if value < self.VALID_RANGE else band
+            if moved < band:
+                kind = self.DRIVE
+        if kind == self.NONE:
+            self.__consecutive__ = 0
+            return kind
+        stats = self.__stats__
+        stats[0] += 1
+        stats[kind] += 1
+        self.__consecutive__ += 1
+        self.reset()
+        return kind
+
+    # Define the `recovered` method
+    def recovered(self, duration_ms: int, success: bool):
+        # Count a recovery manoeuvre and its duration (in ms), or the routine given up on
+        stats = self.__stats__
+        if success:
+            stats[3] += 1
+        else:
+            stats[4] += 1
+        stats[5] += duration_ms
+        if duration_ms > stats[6]:
+            stats[6] = duration_ms
+
+    # Define the `clear` method
+    def clear(self):
+        # Clear the statistics (e.g. when a routine starts)
+        self.__stats__ = [0, 0, 0, 0, 0, 0, 0]
+        self.__consecutive__ = 0
+        self.reset()
+
+    # Define the `stats` property
+    @property
+    def stats(self):
+        events, drive, turn, recoveries, abandoned, total_ms, worst_ms = self.__stats__
+        return {
+            "events": events,
+            "drive": drive,
+            "turn": turn,
+            "recoveries": recoveries,
+            "abandoned": abandoned,
+            "recovery_ms": total_ms,
+            "worst_recovery_ms": worst_ms,
+        }
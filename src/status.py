@@ -0,0 +1,55 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import json
+
+
+# Define the `StatusSnapshot` class
+class StatusSnapshot:
+    # Define the `__init__` method
+    def __init__(self, values: dict):
+        # Start at version 0 with the given field values
+        self.__values__ = dict(values)
+        self.__changed__ = {key: 0 for key in values}
+        self.__version__ = 0
+        self.__encoded__ = None
+
+    # Define the `version` property
+    @property
+    def version(self):
+        return self.__version__
+
+    # Define the `get` method
+    def get(self, key: str):
+        return self.__values__[key]
+
+    # Define the `set` method
+    def set(self, key: str, value):
+        # Update a field, bumping the version only if its value actually changes
+        if key in self.__values__ and self.__values__[key] == value:
+            return self.__version__
+        self.__version__ += 1
+        self.__values__[key] = value
+        self.__changed__[key] = self.__version__
+        self.__encoded__ = None
+        return self.__version__
+
+    # Define the `encoded` method
+    def encoded(self) -> bytes:
+        # Return the JSON-encoded full snapshot, encoding it only once per version
+        if self.__encoded__ is None:
+            snapshot = dict(self.__values__)
+            snapshot["version"] = self.__version__
+            self.__encoded__ = json.dumps(snapshot).encode("utf-8")
+        return self.__encoded__
+
+    # Define the `changes_since` method
+    def changes_since(self, version: int) -> dict:
+        # Return the fields changed after `version` (every field if the version is unknown)
+        if version < 0 or version > self.__version__:
+            version = -1
+        changes = {key: self.__values__[key] for key, changed in self.__changed__.items() if changed > version}
+        changes["version"] = self.__version__
+        return changes
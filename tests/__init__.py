@@ -0,0 +1,92 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Host tests for the firmware modules (never synced to the board), run with `python -m unittest`
+
+# Import the necessary libraries
+import asyncio
+import atexit
+import builtins
+import os
+import shutil
+import sys
+import tempfile
+import time
+import types
+import unittest
+from unittest import mock
+
+# Stand in for the MicroPython modules the drivers import, like the decorator stubs of `src/fastmath.py`
+# (the drivers only get fake buses here, so the hardware classes are never used)
+if "micropython" not in sys.modules:
+    micropython = types.ModuleType("micropython")
+    micropython.const = lambda value: value
+    micropython.native = micropython.viper = lambda function: function
+    sys.modules["micropython"] = micropython
+if "machine" not in sys.modules:
+    machine = types.ModuleType("machine")
+    machine.Pin = machine.I2C = object
+    machine.time_pulse_us = lambda *args: -1
+    sys.modules["machine"] = machine
+if "pyb" not in sys.modules:
+    pyb = types.ModuleType("pyb")
+    pyb.USB_VCP = lambda: types.SimpleNamespace(isconnected=lambda: False)
+    sys.modules["pyb"] = pyb
+if not hasattr(builtins, "const"):
+    builtins.const = sys.modules["micropython"].const
+
+# Define the scratch tree of the board config (created by the first test module that needs it)
+SCRATCH_DIR = None
+
+
+# Define the `use_scratch_board_config` function
+def use_scratch_board_config():
+    # The board config lives at "../config" relative to the working directory (the board's `src`), so create
+    # the config manager in a scratch tree and keep it writing there until the tests are done
+    global SCRATCH_DIR
+    if SCRATCH_DIR is not None:
+        return
+    from src.config import BoardConfigManager
+
+    SCRATCH_DIR = tempfile.mkdtemp(prefix="ssp_tests_")
+    atexit.register(shutil.rmtree, SCRATCH_DIR, True)
+    os.mkdir(os.path.join(SCRATCH_DIR, "src"))
+    cwd = os.getcwd()
+    os.chdir(os.path.join(SCRATCH_DIR, "src"))
+    try:
+        board_config_manager = BoardConfigManager()
+    finally:
+        os.chdir(cwd)
+    board_config_manager.__config_file__ = os.path.join(SCRATCH_DIR, "config", "board_config.json")
+    board_config_manager.__info_file__ = os.path.join(SCRATCH_DIR, "info.json")
+
+
+# Define the `ClockTestCase` class
+class ClockTestCase(unittest.TestCase):
+    # Define the `setUp` method
+    def setUp(self):
+        # Drive the MicroPython clock of the drivers by hand: every loop step and every sleep advances it
+        self.now_us = 0
+        for name, value in (
+            ("ticks_us", lambda: self.now_us),
+            ("ticks_ms", lambda: self.now_us // 1000),
+            ("ticks_diff", lambda end, start: end - start),
+            ("sleep_ms", self.advance_ms),
+        ):
+            patcher = mock.patch.object(time, name, value, create=True)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        patcher = mock.patch.object(asyncio, "sleep_ms", self.sleep_ms, create=True)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    # Define the `advance_ms` method
+    def advance_ms(self, ms: int):
+        self.now_us += ms * 1000
+
+    # Define the `sleep_ms` method
+    async def sleep_ms(self, ms: int):
+        # Advance the clock and yield to the other tasks, like `asyncio.sleep_ms`
+        self.advance_ms(ms)
+        await asyncio.sleep(0)
@@ -0,0 +1,109 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import asyncio
+from unittest import mock
+
+from src import bus
+from src.bus import I2CBus
+from tests import ClockTestCase, use_scratch_board_config
+
+
+# Define the `setUpModule` function
+def setUpModule():
+    use_scratch_board_config()
+
+
+# Define the `FakeDevice` class
+class FakeDevice:
+    # Define the `__init__` method
+    def __init__(self):
+        # Emulate 256 registers holding their own address, NACKing the next `failures` transactions
+        self.registers = bytearray(range(256))
+        self.failures = 0
+
+
+# Define the `FakeI2C` class
+class FakeI2C:
+    # Define the `__init__` method
+    def __init__(self, devices: dict, transactions: list):
+        # Stand in for `machine.I2C`, logging every (address, register, length) transaction that reaches a device
+        self.devices = devices
+        self.transactions = transactions
+
+    # Define the `readfrom_mem_into` method
+    def readfrom_mem_into(self, address: int, reg: int, buffer):
+        device = self.devices[address]
+        if device.failures:
+            device.failures -= 1
+            raise OSError(19)
+        self.transactions.append((address, reg, len(buffer)))
+        buffer[:] = device.registers[reg : reg + len(buffer)]
+
+
+# Define the `I2CBusTest` class
+class I2CBusTest(ClockTestCase):
+    # Define the `setUp` method
+    def setUp(self):
+        super().setUp()
+        self.devices = {0x68: FakeDevice(), 0x0D: FakeDevice()}
+        self.transactions = []
+        patcher = mock.patch.object(bus, "I2C", lambda bus_id, freq: FakeI2C(self.devices, self.transactions))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bus = I2CBus(2)
+
+    # Define the `test_read_many_merges_close_registers` method
+    def test_read_many_merges_close_registers(self):
+        # Registers at most `MAX_GAP` apart share a burst, farther ones get their own transaction
+        results = asyncio.run(self.bus.read_many(0x68, [(0x49, 1), (0x3B, 6), (0x43, 2), (0x75, 1)]))
+        self.assertEqual(self.transactions, [(0x68, 0x3B, 10), (0x68, 0x49, 1), (0x68, 0x75, 1)])
+        self.assertEqual([bytes(result) for result in results], [b"\x49", bytes(range(0x3B, 0x41)), b"\x43\x44", b"\x75"])
+
+        # A larger gap can be bridged on request
+        self.transactions.clear()
+        asyncio.run(self.bus.read_many(0x68, [(0x3A, 1), (0x47, 2)], 12))
+        self.assertEqual(self.transactions, [(0x68, 0x3A, 15)])
+
+    # Define the `test_failed_transaction_is_retried` method
+    def test_failed_transaction_is_retried(self):
+        # A NACK recovers the bus and backs off before the next attempt
+        self.devices[0x68].failures = 1
+        buffer = bytearray(2)
+        self.bus.read_into(0x68, 0x47, buffer)
+        self.assertEqual(bytes(buffer), b"\x47\x48")
+        self.assertEqual(self.now_us, 1000)
+        self.assertEqual(self.bus.stats["recoveries"], 1)
+        self.assertEqual(self.bus.stats["devices"]["0x68"]["retries"], 1)
+
+    # Define the `test_last_attempt_neither_recovers_nor_waits` method
+    def test_last_attempt_neither_recovers_nor_waits(self):
+        # After the last attempt the error is raised right away: 2 recoveries and 1 + 2 ms of backoff for 3 attempts
+        self.devices[0x68].failures = I2CBus.RETRIES
+        with self.assertRaises(OSError):
+            self.bus.read_into(0x68, 0x47, bytearray(2))
+        self.assertEqual(self.bus.stats["recoveries"], I2CBus.RETRIES - 1)
+        self.assertEqual(self.now_us, 3000)
+        self.assertEqual(self.bus.stats["devices"]["0x68"]["errors"], 1)
+
+        self.devices[0x68].failures = I2CBus.RETRIES
+        with self.assertRaises(OSError):
+            asyncio.run(self.bus.read_into_async(0x68, 0x47, bytearray(2)))
+        self.assertEqual(self.bus.stats["recoveries"], 2 * (I2CBus.RETRIES - 1))
+        self.assertEqual(self.now_us, 6000)
+
+    # Define the `test_async_transactions_hold_the_lock` method
+    def test_async_transactions_hold_the_lock(self):
+        # A transaction backing off after a NACK yields, but the next async transaction waits for it
+        self.devices[0x68].failures = 1
+
+        async def __run__():
+            await asyncio.gather(
+                self.bus.read_into_async(0x68, 0x47, bytearray(2)),
+                self.bus.read_into_async(0x0D, 0x00, bytearray(6)),
+            )
+
+        asyncio.run(__run__())
+        self.assertEqual(self.transactions, [(0x68, 0x47, 2), (0x0D, 0x00, 6)])
@@ -0,0 +1,80 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import json
+import math
+import os
+import unittest
+
+from src.fastmath import atan2_cdeg, calibrate, calibration_q10, heading_cdeg, heading_float
+
+# Define the path of the shipped board config
+CONFIG_PATH = os.path.join(os.path.dirname(__file__), "..", "config", "board_config.json")
+
+
+# Define the `CalibrationTest` class
+class CalibrationTest(unittest.TestCase):
+    # Define the `setUp` method
+    def setUp(self):
+        # Use the calibration and declination shipped in the board config (scales of 2 / span, about 3e-4)
+        with open(CONFIG_PATH) as f:
+            magnetometer = json.load(f)["magnetometer"]
+        self.calibration = magnetometer["calibration"]
+        declination = magnetometer["declination"]
+        self.declination_cdeg = declination["degrees"] * 100 + declination["minutes"] * 100 // 60
+
+    # Define the `heading` method
+    def heading(self, x: int, y: int) -> float:
+        # Return the fixed-point heading (in degrees) of the raw field x/y, like `Magnetometer.read`
+        x_offset, x_scale, y_offset, y_scale, _, _ = calibration_q10(self.calibration)
+        return heading_cdeg(
+            calibrate(x, x_offset, x_scale),
+            calibrate(y, y_offset, y_scale),
+            self.declination_cdeg,
+        ) / 100
+
+    # Define the `test_scales_do_not_vanish` method
+    def test_scales_do_not_vanish(self):
+        offsets_and_scales = calibration_q10(self.calibration)
+        self.assertEqual(max(offsets_and_scales[1::2]), 1024)
+        self.assertGreater(min(offsets_and_scales[1::2]), 512)
+
+    # Define the `test_heading_follows_the_field` method
+    def test_heading_follows_the_field(self):
+        # Fields pointing in different directions must not collapse onto the declination
+        headings = {self.heading(x, y) for x, y in ((5000, 100), (100, 5000), (-5000, 0))}
+        self.assertEqual(len(headings), 3)
+
+    # Define the `test_heading_matches_the_float_path` method
+    def test_heading_matches_the_float_path(self):
+        # Sweep the calibrated field around a full circle and compare with the floating-point heading
+        x_axis = self.calibration["x"]
+        y_axis = self.calibration["y"]
+        declination = self.declination_cdeg / 100
+        for index in range(72):
+            angle = index * 2 * math.pi / 72
+            x = round(x_axis["offset"] + math.cos(angle) / x_axis["scale"])
+            y = round(y_axis["offset"] + math.sin(angle) / y_axis["scale"])
+            expected = heading_float(
+                (x - x_axis["offset"]) * x_axis["scale"],
+                (y - y_axis["offset"]) * y_axis["scale"],
+                declination,
+            )
+            difference = abs(self.heading(x, y) - expected) % 360
+            self.assertLess(min(difference, 360 - difference), 0.5, f"at {math.degrees(angle):.0f}°")
+
+    # Define the `test_atan2_error` method
+    def test_atan2_error(self):
+        # The polynomial atan2 stays within 0.1° over a full circle
+        for index in range(360):
+            angle = index * math.pi / 180
+            x = int(4000 * math.cos(angle))
+            y = int(4000 * math.sin(angle))
+            difference = abs(atan2_cdeg(y, x) - heading_float(x, y, 0) * 100) % 36000
+            self.assertLessEqual(min(difference, 36000 - difference), 11)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,237 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import asyncio
+import gc
+import math
+from unittest import mock
+
+from src import bus
+from src.bus import I2CBus
+from src.config import LazyDevice
+from src.sensors import Gyroscope, HeadingFilter, Magnetometer
+from tests import ClockTestCase, use_scratch_board_config
+
+# Define the sensitivity of the fake IMU (in LSB per °/s) at the 500 °/s range the `Gyroscope` selects
+GYRO_LSB_PER_DPS = 32768 / 500
+# Define the period (in us) of the fake robot loop, the tightest `HeadingFilter.period_ms`
+STEP_US = 5000
+
+
+# Define the `setUpModule` function
+def setUpModule():
+    use_scratch_board_config()
+
+
+# Define the `angle_error` function
+def angle_error(a: float, b: float) -> float:
+    # Return the absolute difference (in degrees) of two headings, across the 0/360 wrap
+    return abs((a - b + 180) % 360 - 180)
+
+
+# Define the `FakeImu` class
+class FakeImu:
+    # Define the `__init__` method
+    def __init__(self, who_am_i: int = 0x68, bias_raw: int = 0):
+        # Emulate the registers of an MPU-6050 that `Gyroscope` uses, with a zero-rate offset of `bias_raw`.
+        # Every read finds a new sample, unless the IMU is `stuck`
+        self.who_am_i = who_am_i
+        self.bias_raw = bias_raw
+        self.rate_dps = 0.0
+        self.failing = False
+        self.stuck = False
+        self.reads = []
+        self.registers = {}
+
+    # Define the `read` method
+    def read(self, reg: int, buffer):
+        # Big-endian signed z rate (counter-clockwise seen from above), the other registers read as 0
+        value = (round(self.rate_dps * GYRO_LSB_PER_DPS) + self.bias_raw) & 0xFFFF
+        registers = {
+            Gyroscope.REG_INT_STATUS: 0 if self.stuck else Gyroscope.DATA_READY,
+            Gyroscope.REG_GYRO_ZOUT_H: value >> 8,
+            Gyroscope.REG_GYRO_ZOUT_H + 1: value & 0xFF,
+            Gyroscope.REG_WHO_AM_I: self.who_am_i,
+        }
+        self.reads.append((reg, len(buffer)))
+        for index in range(len(buffer)):
+            buffer[index] = registers.get(reg + index, 0)
+
+    # Define the `write` method
+    def write(self, reg: int, data):
+        self.registers[reg] = data[0]
+
+
+# Define the `FakeMagnetometer` class
+class FakeMagnetometer:
+    # Define the `__init__` method
+    def __init__(self, strength: int = 3000):
+        # Emulate the data registers of the QMC5883L: the field points along the compass `heading`
+        # (plus the `disturbance` of nearby metal), which an uncalibrated `Magnetometer` reads back as is
+        self.strength = strength
+        self.heading = 0.0
+        self.disturbance = 0.0
+
+    # Define the `read` method
+    def read(self, reg: int, buffer):
+        angle = math.radians(self.heading + self.disturbance)
+        values = (round(self.strength * math.cos(angle)), round(self.strength * math.sin(angle)), -400)
+        for index, value in enumerate(values):
+            buffer[reg + 2 * index : reg + 2 * index + 2] = (value & 0xFFFF).to_bytes(2, "little")
+
+    # Define the `write` method
+    def write(self, reg: int, data):
+        pass
+
+
+# Define the `FakeI2C` class
+class FakeI2C:
+    # Define the `__init__` method
+    def __init__(self, devices: dict):
+        # Stand in for `machine.I2C` below the real `I2CBus`: a failing or missing device NACKs (`OSError`)
+        self.devices = devices
+
+    # Define the `__device__` method
+    def __device__(self, address: int):
+        device = self.devices.get(address)
+        if device is None or getattr(device, "failing", False):
+            raise OSError(19)
+        return device
+
+    # Define the `readfrom_mem_into` method
+    def readfrom_mem_into(self, address: int, reg: int, buffer):
+        self.__device__(address).read(reg, buffer)
+
+    # Define the `writeto_mem` method
+    def writeto_mem(self, address: int, reg: int, data):
+        self.__device__(address).write(reg, data)
+
+
+# Define the `HeadingTest` class
+class HeadingTest(ClockTestCase):
+    # Define the `setUp` method
+    def setUp(self):
+        super().setUp()
+        self.imu = FakeImu(bias_raw=40)
+        self.field = FakeMagnetometer()
+        devices = {0x68: self.imu, 0x0D: self.field}
+        patcher = mock.patch.object(bus, "I2C", lambda bus_id, freq: FakeI2C(devices))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.bus = I2CBus(2)
+        # Let the drivers of the test go (`Magnetometer.__del__` writes to the bus) while the clock is faked
+        self.addCleanup(gc.collect)
+
+    # Define the `heading_filter` method
+    def heading_filter(self) -> HeadingFilter:
+        # Build the filter on the fake bus and measure the gyro bias, like `CleaningRobot` does at start-up
+        # (which creates the devices on first use, so a missing IMU only shows up in `start`)
+        timings = {}
+        heading_filter = HeadingFilter(
+            LazyDevice("magnetometer", lambda: Magnetometer(self.bus), timings),
+            LazyDevice("gyroscope", lambda: Gyroscope(self.bus), timings),
+        )
+        asyncio.run(heading_filter.start())
+        return heading_filter
+
+    # Define the `drive` method
+    def drive(self, heading_filter: HeadingFilter, seconds: float, rate_dps: float = 0.0) -> list:
+        # Turn the robot at `rate_dps` (clockwise) for `seconds`, reading the filter every loop step,
+        # and return the heading error of every reading
+        errors = []
+        for _ in range(round(seconds * 1000000 / STEP_US)):
+            self.now_us += STEP_US
+            self.field.heading = (self.field.heading + rate_dps * STEP_US / 1000000) % 360
+            self.imu.rate_dps = -rate_dps
+            errors.append(angle_error(heading_filter.read()["heading"], self.field.heading))
+        return errors
+
+    # Define the `test_who_am_i_is_checked` method
+    def test_who_am_i_is_checked(self):
+        # A device that is not an MPU-6050-class IMU is rejected before anything is written to it
+        self.imu.who_am_i = 0x12
+        with self.assertRaises(OSError):
+            Gyroscope(self.bus)
+        self.assertEqual(self.imu.registers, {})
+
+        # A known successor is woken up and set to the 500 °/s range
+        self.imu.who_am_i = 0x70
+        Gyroscope(self.bus)
+        self.assertEqual(self.imu.registers[Gyroscope.REG_PWR_MGMT_1], 0x01)
+        self.assertEqual(self.imu.registers[Gyroscope.REG_GYRO_CONFIG], Gyroscope.RANGES[500])
+
+    # Define the `test_bias_is_calibrated` method
+    def test_bias_is_calibrated(self):
+        heading_filter = self.heading_filter()
+        self.assertTrue(heading_filter.fused)
+        self.assertAlmostEqual(heading_filter.status["bias"], 40 / GYRO_LSB_PER_DPS)
+
+        # Every sample is read with its data-ready flag in one burst through the bus lock
+        burst = (Gyroscope.REG_INT_STATUS, Gyroscope.REG_GYRO_ZOUT_H + 2 - Gyroscope.REG_INT_STATUS)
+        self.assertEqual(self.imu.reads.count(burst), 200)
+
+        # Standing still, the bias does not turn into drift, and a turn is followed without lag
+        self.assertLess(max(self.drive(heading_filter, 2.0)), 0.01)
+        self.assertLess(max(self.drive(heading_filter, 1.0, rate_dps=90)), 0.5)
+
+    # Define the `test_gyroscope_is_probed_at_start` method
+    def test_gyroscope_is_probed_at_start(self):
+        # Before `start`, the lazily created gyroscope is neither created nor trusted, even without an IMU
+        self.imu.failing = True
+        timings = {}
+        gyroscope = LazyDevice("gyroscope", lambda: Gyroscope(self.bus), timings)
+        heading_filter = HeadingFilter(LazyDevice("magnetometer", lambda: Magnetometer(self.bus), timings), gyroscope)
+        self.assertFalse(heading_filter.fused)
+        self.assertEqual(heading_filter.period_ms, 10)
+        self.assertLess(max(self.drive(heading_filter, 0.5, rate_dps=90)), 0.2)
+        self.assertFalse(gyroscope.ready)
+
+        # With the IMU back, `start` probes it and the filter fuses its rate from then on
+        self.imu.failing = False
+        asyncio.run(heading_filter.start())
+        self.assertTrue(gyroscope.ready)
+        self.assertTrue(heading_filter.fused)
+        self.assertEqual(heading_filter.period_ms, 5)
+
+    # Define the `test_falls_back_to_the_magnetometer` method
+    def test_falls_back_to_the_magnetometer(self):
+        # Without an IMU on the bus, the filter passes the magnetometer heading through from the start
+        self.imu.failing = True
+        heading_filter = self.heading_filter()
+        self.assertFalse(heading_filter.fused)
+        self.assertEqual(heading_filter.period_ms, 10)
+        self.assertLess(max(self.drive(heading_filter, 0.5, rate_dps=90)), 0.2)
+
+        # An IMU that fails while the robot runs is dropped at the next reading
+        self.imu.failing = False
+        heading_filter = self.heading_filter()
+        self.drive(heading_filter, 0.5, rate_dps=90)
+        self.imu.failing = True
+        errors = self.drive(heading_filter, 0.5, rate_dps=90)
+        self.assertFalse(heading_filter.fused)
+        self.assertLess(max(errors), 0.2)
+        self.assertEqual(heading_filter.latest["rate"], 0.0)
+
+    # Define the `test_stuck_imu_is_dropped` method
+    def test_stuck_imu_is_dropped(self):
+        # An IMU that answers but never flags a new sample has no bias to measure, so it is left out
+        self.imu.stuck = True
+        heading_filter = self.heading_filter()
+        self.assertFalse(heading_filter.fused)
+        self.assertIsNone(heading_filter.status["bias"])
+
+    # Define the `test_rides_out_a_magnetic_disturbance` method
+    def test_rides_out_a_magnetic_disturbance(self):
+        # Drive past metal that bends the field by 25° for 200 ms: the magnetometer alone follows it,
+        # the fused heading only takes a fraction of it (time constant of 500 ms) and recovers afterwards
+        heading_filter = self.heading_filter()
+        self.field.heading = 90.0
+        self.drive(heading_filter, 1.0)
+        self.field.disturbance = 25.0
+        errors = self.drive(heading_filter, 0.2)
+        self.assertGreater(angle_error(heading_filter.latest["magnetic"], self.field.heading), 24.5)
+        self.assertLess(max(errors), 10.0)
+        self.field.disturbance = 0.0
+        self.assertLess(self.drive(heading_filter, 2.0)[-1], 0.5)
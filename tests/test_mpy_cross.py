@@ -0,0 +1,47 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import glob
+import importlib.util
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+# Define the root of the repository and the firmware files that are synced to the board
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+FIRMWARE_FILES = ["boot.py", "main.py"] + sorted(
+    os.path.relpath(path, ROOT) for path in glob.glob(os.path.join(ROOT, "src", "*.py"))
+)
+# Define the architecture of the native and viper code emitters (the Cortex-M7 of the GIGA R1)
+MARCH = "armv7emdp"
+
+
+# Define the `MpyCrossTest` class
+@unittest.skipUnless(importlib.util.find_spec("mpy_cross"), "mpy-cross is not installed")
+class MpyCrossTest(unittest.TestCase):
+    # Define the `test_firmware_compiles` method
+    def test_firmware_compiles(self):
+        # The host tests run the firmware on CPython, which accepts syntax that MicroPython does not
+        # (e.g. dict unpacking in a literal), so compile every firmware file with the MicroPython compiler
+        with tempfile.TemporaryDirectory() as output_dir:
+            for index, name in enumerate(FIRMWARE_FILES):
+                with self.subTest(name=name):
+                    result = subprocess.run(
+                        [
+                            sys.executable,
+                            "-m",
+                            "mpy_cross",
+                            f"-march={MARCH}",
+                            "-o",
+                            os.path.join(output_dir, f"{index}.mpy"),
+                            name,
+                        ],
+                        cwd=ROOT,
+                        capture_output=True,
+                        text=True,
+                    )
+                    self.assertEqual(result.returncode, 0, result.stderr)
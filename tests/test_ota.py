@@ -0,0 +1,72 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import hashlib
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+
+from src.ota import FirmwareUpdate
+
+# Define the payload size of the test frames
+CHUNK = 16
+
+
+# Define the `FirmwareUpdateTest` class
+class FirmwareUpdateTest(unittest.TestCase):
+    # Define the `setUp` method
+    def setUp(self):
+        # Receive a bundle of 16 frames in a scratch firmware directory
+        self.root = tempfile.mkdtemp(prefix="ssp_ota_")
+        self.addCleanup(shutil.rmtree, self.root, True)
+        self.data = bytes(range(256))
+        self.update = FirmwareUpdate(root=self.root)
+        self.update.begin(len(self.data), hashlib.sha256(self.data).hexdigest(), window=8)
+
+    # Define the `frame` method
+    def frame(self, offset: int) -> bytes:
+        # Build the data frame at `offset`, like `tools/ota.py`
+        payload = self.data[offset : offset + CHUNK]
+        header = struct.pack(FirmwareUpdate.FRAME_FORMAT, FirmwareUpdate.FRAME_MARKER, offset, len(payload), zlib.crc32(payload))
+        return header + payload
+
+    # Define the `test_stale_frames_are_nacked_once` method
+    def test_stale_frames_are_nacked_once(self):
+        # The frame at 32 is lost: the frames in flight behind it get a single NACK back to 32
+        self.update.receive(self.frame(0))
+        self.update.receive(self.frame(16))
+        acks = [self.update.receive(self.frame(offset)) for offset in range(48, 112, CHUNK)]
+        self.assertEqual(acks, [(32, True), None, None, None])
+
+        # The resent frames are taken from 32 on
+        self.assertIsNone(self.update.receive(self.frame(32)))
+        self.assertEqual(self.update.status["offset"], 48)
+        self.assertEqual(self.update.status["rejected"], 4)
+
+    # Define the `test_lost_resend_is_nacked_again` method
+    def test_lost_resend_is_nacked_again(self):
+        # The frame at 32 is lost, and so is its resend: the resent frames that follow it get another NACK
+        self.update.receive(self.frame(0))
+        self.update.receive(self.frame(16))
+        self.assertEqual(self.update.receive(self.frame(48)), (32, True))
+        self.assertIsNone(self.update.receive(self.frame(64)))
+        self.assertEqual(self.update.receive(self.frame(48)), (32, True))
+        self.assertIsNone(self.update.receive(self.frame(64)))
+
+        # The second resend gets through and the bundle completes
+        for offset in range(32, len(self.data), CHUNK):
+            ack = self.update.receive(self.frame(offset))
+        self.assertEqual(ack, (len(self.data), False))
+
+    # Define the `test_corrupted_resend_is_nacked_again` method
+    def test_corrupted_resend_is_nacked_again(self):
+        corrupted = bytearray(self.frame(0))
+        corrupted[-1] ^= 0xFF
+        self.assertEqual(self.update.receive(bytes(corrupted)), (0, True))
+        self.assertEqual(self.update.receive(bytes(corrupted)), (0, True))
+        self.assertIsNone(self.update.receive(self.frame(0)))
+        self.assertEqual(self.update.status["offset"], CHUNK)
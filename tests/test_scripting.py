@@ -0,0 +1,59 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary libraries
+import asyncio
+import types
+import unittest
+
+from src.scripting import MotionScript, is_speed
+
+
+# Define the `FakeRobot` class
+class FakeRobot:
+    # Define the `__init__` method
+    def __init__(self):
+        # Record the turns a script asks for
+        self.safety = types.SimpleNamespace(fault=False)
+        self.turns = []
+
+    # Define the `__turn__` method
+    async def __turn__(self, degrees: int, speed=None):
+        self.turns.append(degrees)
+
+
+# Define the `MotionScriptTest` class
+class MotionScriptTest(unittest.TestCase):
+    # Define the `test_full_turns_are_split` method
+    def test_full_turns_are_split(self):
+        # `__turn__` wraps its target heading, so a full turn has to be driven in parts
+        robot = FakeRobot()
+        script = MotionScript(
+            [
+                {"op": "turn", "degrees": 360},
+                {"op": "turn", "degrees": -270},
+                {"op": "turn", "degrees": 90},
+            ]
+        )
+        asyncio.run(script.run(robot))
+        self.assertEqual(robot.turns, [180, 180, -180, -90, 90])
+
+    # Define the `test_turn_stops_on_a_fault` method
+    def test_turn_stops_on_a_fault(self):
+        robot = FakeRobot()
+        robot.safety.fault = True
+        with self.assertRaises(RuntimeError):
+            asyncio.run(MotionScript([{"op": "turn", "degrees": 360}]).run(robot))
+        self.assertEqual(robot.turns, [])
+
+    # Define the `test_speed_is_validated` method
+    def test_speed_is_validated(self):
+        # A malformed speed is rejected before the script starts, not when its step is reached
+        for speed in (50, {"left": 40, "right": 60.5}):
+            self.assertTrue(is_speed(speed))
+            MotionScript([{"op": "turn", "degrees": 90, "speed": speed}])
+        for speed in ({"left": 40}, {"left": 40, "right": "fast"}, 50.5, True, [40, 60]):
+            self.assertFalse(is_speed(speed))
+            with self.assertRaises(ValueError):
+                MotionScript([{"op": "wait", "duration_ms": 10}, {"op": "turn", "degrees": 90, "speed": speed}])
@@ -0,0 +1,107 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary modules
+import json
+import os
+import struct
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+
+# Define the zip records written by `write_zip` (see the PKWARE APPNOTE): every entry is deflated,
+# stamped with 1980-01-01 00:00 and stored in path order, so identical trees give byte-identical zips
+LOCAL_HEADER_FORMAT = "<IHHHHHIIIHH"
+CENTRAL_HEADER_FORMAT = "<IHHHHHHIIIHHHHHII"
+END_RECORD_FORMAT = "<IHHHHIIH"
+DOS_TIME = 0
+DOS_DATE = (0 << 9) | (1 << 5) | 1
+EXTERNAL_ATTRIBUTES = 0o100644 << 16
+CACHE_VERSION = 1
+KEEP_ARTIFACTS = 5
+
+
+# Define the `build_key` function
+def build_key(files: dict, options: dict) -> str:
+    # Return the cache key of a build: the hash of every included file (path and content) and the build options
+    key = {"version": CACHE_VERSION, "options": options, "files": {path: entry["sha256"] for path, entry in files.items()}}
+    return sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+# Define the `compress` function
+def compress(data: bytes, digest: str, cache_dir: str, level: int = 9) -> str:
+    # Return the path of the raw-deflated `data` in the blob cache, compressing it only if it is not there yet
+    path = os.path.join(cache_dir, "blobs", f"{digest}-{level}.deflate")
+    if not os.path.exists(path):
+        compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS)
+        blob = compressor.compress(data) + compressor.flush()
+        with open(path + f".{os.getpid()}.tmp", "wb") as f:
+            f.write(blob)
+        os.replace(path + f".{os.getpid()}.tmp", path)
+    return path
+
+
+# Define the `write_zip` function
+def write_zip(output, entries: list):
+    # Write the (name, crc, size, blob path) `entries` as a zip into the binary `output` stream
+    central = bytearray()
+    offset = 0
+    for name, crc, size, blob_path in entries:
+        encoded = name.encode("utf-8")
+        compressed_size = os.path.getsize(blob_path)
+        header = struct.pack(
+            LOCAL_HEADER_FORMAT,
+            0x04034B50, 20, 0x0800, 8, DOS_TIME, DOS_DATE, crc, compressed_size, size, len(encoded), 0,
+        )
+        output.write(header + encoded)
+        with open(blob_path, "rb") as f:
+            output.write(f.read())
+        central += struct.pack(
+            CENTRAL_HEADER_FORMAT,
+            0x02014B50, 20, 20, 0x0800, 8, DOS_TIME, DOS_DATE, crc, compressed_size, size,
+            len(encoded), 0, 0, 0, 0, EXTERNAL_ATTRIBUTES, offset,
+        ) + encoded
+        offset += len(header) + len(encoded) + compressed_size
+    output.write(central)
+    output.write(struct.pack(END_RECORD_FORMAT, 0x06054B50, 0, 0, len(entries), len(entries), len(central), offset, 0))
+
+
+# Define the `build` function
+def build(root: str, files: dict, extra: dict, cache_dir: str, options: dict, level: int = 9, workers: int | None = None) -> tuple:
+    # Build the zip of the `files` under `root` (see `tools.sync.scan_directory`) plus the in-memory `extra`
+    # entries ({name: bytes}), reusing the cached artifact of an identical build or the cached blobs of
+    # unchanged files, and compressing the others in parallel. Returns the artifact path and whether it was cached
+    os.makedirs(os.path.join(cache_dir, "blobs"), exist_ok=True)
+    os.makedirs(os.path.join(cache_dir, "artifacts"), exist_ok=True)
+    key = build_key(files, {**options, "level": level, "extra": sorted(extra)})
+    artifact = os.path.join(cache_dir, "artifacts", f"{key}.zip")
+    if os.path.exists(artifact):
+        os.utime(artifact)
+        return artifact, True
+
+    # Compress the files (zlib releases the GIL, so the threads run in parallel)
+    def __compress__(name: str):
+        if name in extra:
+            data = extra[name]
+            digest = sha256(data).hexdigest()
+        else:
+            with open(os.path.join(root, name), "rb") as f:
+                data = f.read()
+            digest = files[name]["sha256"]
+        return name, zlib.crc32(data), len(data), compress(data, digest, cache_dir, level)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        entries = list(executor.map(__compress__, sorted([*files, *extra])))
+
+    # Write the artifact next to its final name and swap it in, then drop the oldest artifacts
+    with open(artifact + ".tmp", "wb") as f:
+        write_zip(f, entries)
+    os.replace(artifact + ".tmp", artifact)
+    artifacts = sorted(
+        (os.path.join(cache_dir, "artifacts", name) for name in os.listdir(os.path.join(cache_dir, "artifacts"))),
+        key=os.path.getmtime,
+    )
+    for path in artifacts[:-KEEP_ARTIFACTS]:
+        os.remove(path)
+    return artifact, False
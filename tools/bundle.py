@@ -0,0 +1,224 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary modules
+import base64
+import io
+import os
+import struct
+import time
+from hashlib import sha256
+
+from cryptography.fernet import Fernet
+from cryptography.hazmat.primitives.ciphers.aead import AESGCM
+from cryptography.hazmat.primitives.kdf.scrypt import Scrypt
+
+# Define the container layout: a header (magic, key salt, nonce prefix, chunk size) followed by
+# AES-GCM encrypted chunks of `chunk_size` bytes (the last one may be shorter), each with a 16 byte tag
+MAGIC = b"SSPENC01"
+HEADER_FORMAT = "<8s16s8sI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TAG_SIZE = 16
+CHUNK_SIZE = 1 << 16
+SCRYPT_N = 1 << 15
+
+
+# Define the `derive_key` function
+def derive_key(password: str, salt: bytes) -> bytes:
+    # Stretch the `password` into a 256-bit key, so every guess costs real work
+    return Scrypt(salt=salt, length=32, n=SCRYPT_N, r=8, p=1).derive(password.encode())
+
+
+# Define the `is_encrypted` function
+def is_encrypted(path: str) -> bool:
+    # Check whether the file at `path` is an encrypted container
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+# Define the `__chunk_aad__` function
+def __chunk_aad__(header: bytes, index: int, final: bool) -> bytes:
+    # Bind every chunk to its header, position and whether it is the last one, so chunks can be
+    # neither swapped between files, reordered nor cut off
+    return header + struct.pack("<I?", index, final)
+
+
+# Define the `EncryptedWriter` class
+class EncryptedWriter(io.RawIOBase):
+    # Define the `__init__` method
+    def __init__(self, fileobj, password: str, chunk_size: int = CHUNK_SIZE):
+        # Encrypt everything written into `fileobj`, holding at most one chunk in memory
+        self.__file__ = fileobj
+        salt = os.urandom(16)
+        self.__header__ = struct.pack(HEADER_FORMAT, MAGIC, salt, os.urandom(8), chunk_size)
+        self.__aesgcm__ = AESGCM(derive_key(password, salt))
+        self.__chunk_size__ = chunk_size
+        self.__buffer__ = bytearray()
+        self.__index__ = 0
+        self.__file__.write(self.__header__)
+
+    # Define the `writable` method
+    def writable(self):
+        return True
+
+    # Define the `write` method
+    def write(self, data) -> int:
+        # Buffer the `data` and encrypt every full chunk, except the last one: it is only known to be
+        # the final chunk once the writer is closed
+        buffer = self.__buffer__
+        buffer += data
+        chunk_size = self.__chunk_size__
+        if len(buffer) > chunk_size:
+            end = (len(buffer) - 1) // chunk_size * chunk_size
+            with memoryview(buffer) as view:
+                for offset in range(0, end, chunk_size):
+                    self.__write_chunk__(view[offset : offset + chunk_size], False)
+            del buffer[:end]
+        return len(data)
+
+    # Define the `__write_chunk__` method
+    def __write_chunk__(self, chunk: bytes, final: bool):
+        nonce = self.__header__[24:32] + struct.pack(">I", self.__index__)
+        aad = __chunk_aad__(self.__header__, self.__index__, final)
+        self.__file__.write(self.__aesgcm__.encrypt(nonce, chunk, aad))
+        self.__index__ += 1
+
+    # Define the `close` method
+    def close(self):
+        # Encrypt the remaining data as the final chunk (empty if nothing was written)
+        if not self.closed:
+            self.__write_chunk__(bytes(self.__buffer__), True)
+            self.__buffer__ = bytearray()
+            self.__file__.close()
+        super().close()
+
+
+# Define the `EncryptedReader` class
+class EncryptedReader(io.RawIOBase):
+    # Define the `__init__` method
+    def __init__(self, fileobj, password: str):
+        # Decrypt `fileobj` on demand: every chunk sits at a fixed offset, so any position can be read
+        # (e.g. a zip's central directory) while only one chunk is held in memory
+        self.__file__ = fileobj
+        self.__header__ = fileobj.read(HEADER_SIZE)
+        if len(self.__header__) != HEADER_SIZE:
+            raise ValueError("Not an encrypted firmware file")
+        magic, salt, _, chunk_size = struct.unpack(HEADER_FORMAT, self.__header__)
+        if magic != MAGIC:
+            raise ValueError("Not an encrypted firmware file")
+        self.__aesgcm__ = AESGCM(derive_key(password, salt))
+        self.__chunk_size__ = chunk_size
+        # Derive the number of chunks and the plaintext size from the file size
+        size = fileobj.seek(0, io.SEEK_END) - HEADER_SIZE
+        record_size = chunk_size + TAG_SIZE
+        self.__chunks__ = max(1, -(-size // record_size))
+        self.__size__ = size - self.__chunks__ * TAG_SIZE
+        if self.__size__ < 0:
+            raise ValueError("The encrypted firmware file is truncated")
+        self.__position__ = 0
+        self.__cached__ = (-1, b"")
+
+    # Define the `readable` method
+    def readable(self):
+        return True
+
+    # Define the `seekable` method
+    def seekable(self):
+        return True
+
+    # Define the `tell` method
+    def tell(self):
+        return self.__position__
+
+    # Define the `seek` method
+    def seek(self, offset: int, whence: int = io.SEEK_SET):
+        base = {io.SEEK_SET: 0, io.SEEK_CUR: self.__position__, io.SEEK_END: self.__size__}[whence]
+        self.__position__ = max(0, base + offset)
+        return self.__position__
+
+    # Define the `__chunk__` method
+    def __chunk__(self, index: int) -> bytes:
+        # Decrypt and authenticate the chunk at `index` (raises `InvalidTag` if it was tampered with)
+        if self.__cached__[0] != index:
+            record_size = self.__chunk_size__ + TAG_SIZE
+            self.__file__.seek(HEADER_SIZE + index * record_size)
+            record = self.__file__.read(record_size)
+            nonce = self.__header__[24:32] + struct.pack(">I", index)
+            aad = __chunk_aad__(self.__header__, index, index == self.__chunks__ - 1)
+            self.__cached__ = (index, self.__aesgcm__.decrypt(nonce, record, aad))
+        return self.__cached__[1]
+
+    # Define the `readinto` method
+    def readinto(self, buffer) -> int:
+        # Fill the `buffer` from the current position, decrypting the chunks it spans
+        view = memoryview(buffer).cast("B")
+        count = 0
+        while count < len(view) and self.__position__ < self.__size__:
+            index, offset = divmod(self.__position__, self.__chunk_size__)
+            data = self.__chunk__(index)[offset : offset + len(view) - count]
+            view[count : count + len(data)] = data
+            count += len(data)
+            self.__position__ += len(data)
+        return count
+
+    # Define the `close` method
+    def close(self):
+        if not self.closed:
+            self.__file__.close()
+        super().close()
+
+
+# Define the `open_firmware` function
+def open_firmware(path: str, password: str | None = None):
+    # Open the firmware file at `path` for reading without ever rewriting it: encrypted containers are
+    # decrypted on the fly, files encrypted by older builds (a single Fernet token) are decrypted in memory
+    if is_encrypted(path):
+        if password is None:
+            raise ValueError("The firmware file is encrypted, use the '--password' option to decrypt it")
+        return EncryptedReader(open(path, "rb"), password)
+    if password:
+        with open(path, "rb") as f:
+            return io.BytesIO(__legacy_fernet__(password).decrypt(f.read()))
+    return open(path, "rb")
+
+
+# Define the `__legacy_fernet__` function
+def __legacy_fernet__(password: str) -> Fernet:
+    # Return the single-token cipher of older builds (the key is the plain SHA-256 of the password)
+    return Fernet(base64.urlsafe_b64encode(sha256(password.encode()).digest()[:32]))
+
+
+# Define the `benchmark` function
+def benchmark(size_mb: int = 64, chunk_size: int = CHUNK_SIZE) -> dict:
+    # Measure the throughput (in MB/s) of encrypting and decrypting a bundle of `size_mb` MB in chunks,
+    # excluding the key derivation, next to the single-token encryption of older builds
+    data = os.urandom(1 << 20) * size_mb
+    results = {}
+    password = "benchmark"
+
+    target = io.BytesIO()
+    writer = EncryptedWriter(target, password, chunk_size)
+    start = time.perf_counter()
+    for offset in range(0, len(data), 1 << 20):
+        writer.write(data[offset : offset + (1 << 20)])
+    writer.__write_chunk__(bytes(writer.__buffer__), True)
+    results["encrypt"] = size_mb / (time.perf_counter() - start)
+    encrypted = target.getvalue()
+    results["overhead"] = (len(encrypted) - len(data)) / len(data)
+
+    reader = EncryptedReader(io.BytesIO(encrypted), password)
+    buffer = bytearray(1 << 20)
+    start = time.perf_counter()
+    while reader.readinto(buffer):
+        pass
+    results["decrypt"] = size_mb / (time.perf_counter() - start)
+
+    fernet = __legacy_fernet__(password)
+    start = time.perf_counter()
+    token = fernet.encrypt(data)
+    results["legacy_encrypt"] = size_mb / (time.perf_counter() - start)
+    start = time.perf_counter()
+    fernet.decrypt(token)
+    results["legacy_decrypt"] = size_mb / (time.perf_counter() - start)
+    return results
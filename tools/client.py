@@ -0,0 +1,281 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary modules
+import asyncio
+import itertools
+import json
+import random
+import statistics
+import tempfile
+import time
+
+# Define the UUIDs of the microcontroller service and its data characteristic (see `src/connections.py`)
+SERVICE_UUID = "57b83ac1-34d0-418a-bf25-bfacd5d9ac3a"
+DATA_CHAR_UUID = "57b83ac2-34d0-418a-bf25-bfacd5d9ac3a"
+
+
+# Define the `BleTransport` class
+class BleTransport:
+    # Define the `__init__` method
+    def __init__(self, address: str):
+        # Connect to the robot with the given BLE `address` (requires `bleak`)
+        self.address = address
+        self.handler = None
+        self.__client__ = None
+
+    # Define the `connect` method
+    async def connect(self):
+        from bleak import BleakClient
+
+        self.__client__ = BleakClient(self.address)
+        await self.__client__.connect()
+        await self.__client__.start_notify(
+            DATA_CHAR_UUID,
+            lambda _, data: self.handler(bytes(data)),
+        )
+
+    # Define the `send` method
+    async def send(self, payload: bytes, response: bool = True):
+        # Write the `payload`, waiting for the write response unless `response` is false
+        await self.__client__.write_gatt_char(DATA_CHAR_UUID, payload, response=response)
+
+    # Define the `close` method
+    async def close(self):
+        if self.__client__ is not None:
+            await self.__client__.disconnect()
+
+
+# Define the `LoopbackTransport` class
+class LoopbackTransport:
+    # Define the `__init__` method
+    def __init__(self, robot):
+        # Talk to a local stand-in of the robot's command handler (e.g. `StandInRobot`)
+        self.robot = robot
+        self.handler = None
+
+    # Define the `connect` method
+    async def connect(self):
+        await self.robot.start(lambda data: self.handler(data))
+
+    # Define the `send` method
+    async def send(self, payload: bytes, response: bool = True):
+        await self.robot.receive(payload)
+
+    # Define the `close` method
+    async def close(self):
+        await self.robot.stop()
+
+
+# Define the `StandInRobot` class
+class StandInRobot:
+    # Define the `__init__` method
+    def __init__(self, latency: float = 0.005, processing: float = 0.002, loss: float = 0.0):
+        # Emulate the command handler of `ConnectionManager`: commands are handled one at a time,
+        # every response takes `latency` seconds over the air and every command `processing` seconds.
+        # Firmware updates are staged by the real `FirmwareUpdate` in a temporary directory,
+        # losing a `loss` fraction of the data frames
+        self.latency = latency
+        self.processing = processing
+        self.loss = loss
+        self.firmware_dir = tempfile.mkdtemp(prefix="ssp_ota_")
+        self.state = {
+            "is_cleaning": False,
+            "firmware_version": "stand-in",
+            "brush_set": {"brush": "both", "value": [False, False]},
+            "speed_set": 45,
+            "mode": "reactive",
+            "version": 0,
+        }
+        self.__queue__ = asyncio.Queue()
+        self.__task__ = None
+        self.__notify__ = None
+
+    # Define the `start` method
+    async def start(self, notify):
+        from src.ota import FirmwareUpdate
+
+        self.__ota__ = FirmwareUpdate(root=self.firmware_dir)
+        self.__notify__ = notify
+        self.__task__ = asyncio.create_task(self.__listener__())
+
+    # Define the `stop` method
+    async def stop(self):
+        if self.__task__ is not None:
+            self.__task__.cancel()
+
+    # Define the `receive` method
+    async def receive(self, payload: bytes):
+        # The write reaches the robot after the radio latency (unless a data frame gets lost)
+        if payload[:1] == b"\xa5" and random.random() < self.loss:
+            return
+        await asyncio.sleep(self.latency)
+        await self.__queue__.put(payload)
+
+    # Define the `__write__` method
+    async def __write__(self, data: dict, request_id=None):
+        if request_id is not None:
+            data["id"] = request_id
+        payload = json.dumps(data).encode("utf-8")
+        asyncio.get_running_loop().call_later(self.latency, self.__notify__, payload)
+
+    # Define the `__listener__` method
+    async def __listener__(self):
+        while True:
+            payload = await self.__queue__.get()
+            await asyncio.sleep(self.processing)
+            if payload[:1] == b"\xa5":
+                ack = self.__ota__.receive(payload)
+                if ack is not None:
+                    await self.__write__({"ota_ack": {"offset": ack[0], "resend": ack[1]}})
+                continue
+            await self.__handle__(json.loads(payload))
+
+    # Define the `__handle__` method
+    async def __handle__(self, command: dict):
+        # Answer the commands like the firmware does, echoing the optional "id"
+        request_id = command.get("id")
+        name = command.get("command")
+        state = self.state
+        if name in ("request_initial_info", "start_cleaning", "stop_cleaning"):
+            if name != "request_initial_info":
+                state["is_cleaning"] = name == "start_cleaning"
+                state["version"] += 1
+            await self.__write__(dict(state), request_id)
+        elif name == "stop":
+            await self.__write__({"stopped": True}, request_id)
+        elif name == "set_speed":
+            state["speed_set"] = command["speed"]
+            state["version"] += 1
+            await self.__write__({"speed_set": command["speed"]}, request_id)
+        elif name == "set_brush":
+            await self.__write__({"brush_set": {"brush": command["brush"], "value": bool(command["value"])}}, request_id)
+        elif name == "get_log":
+            # Send a larger response in chunks, like `write_chunked`
+            payload = json.dumps({"lines": [f"[{i}] INFO: stand-in" for i in range(40)], "stats": {}})
+            count = (len(payload) + 359) // 360
+            for index in range(count):
+                await self.__write__(
+                    {"log": {"index": index, "count": count, "data": payload[index * 360 : (index + 1) * 360]}},
+                    request_id,
+                )
+        elif name == "ota_begin":
+            await self.__write__(
+                {"ota_ready": self.__ota__.begin(command["size"], command["sha256"], command.get("window"))},
+                request_id,
+            )
+        elif name == "ota_finish":
+            try:
+                names = self.__ota__.finish()
+            except ValueError as e:
+                await self.__write__({"ota_error": str(e)}, request_id)
+                return
+            await self.__write__({"ota_done": {"files": len(names)}}, request_id)
+        elif request_id is not None:
+            await self.__write__({"ack": name}, request_id)
+
+
+# Define the `RobotClient` class
+class RobotClient:
+    # Define the `__init__` method
+    def __init__(self, transport, timeout: float = 5.0, max_in_flight: int = 8):
+        # Send commands over the `transport`, with at most `max_in_flight` unanswered requests
+        self.transport = transport
+        self.timeout = timeout
+        self.latencies = {}
+        self.notifications = asyncio.Queue()
+        self.__ids__ = itertools.count(1)
+        self.__pending__ = {}
+        self.__chunks__ = {}
+        self.__in_flight__ = asyncio.Semaphore(max_in_flight)
+        transport.handler = self.__on_message__
+
+    # Define the `__aenter__` method
+    async def __aenter__(self):
+        await self.transport.connect()
+        return self
+
+    # Define the `__aexit__` method
+    async def __aexit__(self, *exc):
+        await self.transport.close()
+
+    # Define the `set_max_in_flight` method
+    def set_max_in_flight(self, max_in_flight: int):
+        # Change the number of unanswered requests allowed (only while no request is in flight)
+        self.__in_flight__ = asyncio.Semaphore(max_in_flight)
+
+    # Define the `request` method
+    async def request(self, command: str, **fields) -> dict:
+        # Send the `command` with a fresh correlation ID and wait for the response carrying it
+        async with self.__in_flight__:
+            request_id = next(self.__ids__)
+            future = asyncio.get_running_loop().create_future()
+            self.__pending__[request_id] = (future, time.perf_counter(), command)
+            try:
+                await self.transport.send(json.dumps({"command": command, "id": request_id, **fields}).encode("utf-8"))
+                return await asyncio.wait_for(future, self.timeout)
+            finally:
+                self.__pending__.pop(request_id, None)
+
+    # Define the `pipeline` method
+    async def pipeline(self, requests: list) -> list:
+        # Send many (command, fields) requests without waiting for each response in turn
+        return await asyncio.gather(*(self.request(command, **fields) for command, fields in requests))
+
+    # Define the `__on_message__` method
+    def __on_message__(self, payload: bytes):
+        # Match a notification to its request by ID, reassembling chunked responses first
+        message = json.loads(payload)
+        request_id = message.get("id")
+        if request_id not in self.__pending__:
+            # Keep the ID, so notifications that follow a response (e.g. `script_progress`) can be matched
+            # to the request that started them
+            self.notifications.put_nowait(message)
+            return
+        del message["id"]
+        if len(message) == 1:
+            key, value = next(iter(message.items()))
+            if isinstance(value, dict) and value.keys() == {"index", "count", "data"}:
+                chunks = self.__chunks__.setdefault(request_id, {})
+                chunks[value["index"]] = value["data"]
+                if len(chunks) < value["count"]:
+                    return
+                del self.__chunks__[request_id]
+                message = {key: json.loads("".join(chunks[i] for i in range(value["count"])))}
+        future, start, command = self.__pending__[request_id]
+        if not future.done():
+            self.latencies.setdefault(command, []).append(time.perf_counter() - start)
+            future.set_result(message)
+
+    # Define the `latency_report` method
+    def latency_report(self) -> dict:
+        # Return the count, mean, median and worst latency (in ms) per command
+        report = {}
+        for command, latencies in self.latencies.items():
+            ms = sorted(latency * 1000 for latency in latencies)
+            report[command] = {
+                "count": len(ms),
+                "mean": statistics.fmean(ms),
+                "p50": ms[len(ms) // 2],
+                "max": ms[-1],
+            }
+        return report
+
+
+# Define the `benchmark` function
+async def benchmark(transport, count: int = 200, max_in_flight: int = 8) -> dict:
+    # Send `count` commands one at a time and then pipelined, and compare the throughput
+    results = {}
+    async with RobotClient(transport, max_in_flight=max_in_flight) as client:
+        for name, in_flight in (("sequential", 1), ("pipelined", max_in_flight)):
+            client.latencies.clear()
+            client.set_max_in_flight(in_flight)
+            start = time.perf_counter()
+            await client.pipeline([("set_speed", {"speed": 40 + i % 20}) for i in range(count)])
+            elapsed = time.perf_counter() - start
+            results[name] = {
+                "requests_per_second": count / elapsed,
+                **client.latency_report()["set_speed"],
+            }
+    return results
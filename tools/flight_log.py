@@ -0,0 +1,89 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary modules
+import struct
+
+import numpy as np
+
+# Define the file header and the record layout written by `src/recorder.py`
+MAGIC = b"SSPFLT01"
+HEADER_FORMAT = "<8sHHI"
+HEADER_SIZE = struct.calcsize(HEADER_FORMAT)
+TICKS_PERIOD = 1 << 30
+RECORD_DTYPE = np.dtype(
+    [
+        ("ticks_ms", "<u4"),
+        ("kind", "u1"),
+        ("code", "u1"),
+        ("values", "<i2", (7,)),
+    ]
+)
+
+# Define the record kinds and the routine state codes
+KINDS = {1: "sensors", 2: "motors", 3: "state"}
+STATES = {
+    0: "idle",
+    1: "start",
+    2: "stop",
+    3: "lane",
+    4: "turn",
+    5: "survey",
+    6: "shift",
+    7: "transit",
+    8: "fallback",
+    9: "done",
+    10: "fault",
+    11: "edge",
+    12: "corner",
+    13: "stuck",
+}
+
+
+# Define the `load` function
+def load(path: str) -> np.ndarray:
+    # Memory-map a pulled flight log as a structured array of records (without reading it into memory)
+    with open(path, "rb") as f:
+        header = f.read(HEADER_SIZE)
+    if len(header) < HEADER_SIZE:
+        raise ValueError(f"'{path}' is not a flight log")
+    magic, record_size, data_offset, _ = struct.unpack(HEADER_FORMAT, header)
+    if magic != MAGIC or record_size != RECORD_DTYPE.itemsize:
+        raise ValueError(f"'{path}' is not a flight log of this firmware version")
+    return np.memmap(path, dtype=RECORD_DTYPE, mode="r", offset=data_offset)
+
+
+# Define the `sensors` function
+def sensors(records: np.ndarray) -> dict:
+    # Return the sensor samples as columns (distances in mm, heading in degrees, raw magnetometer values)
+    samples = records[records["kind"] == 1]
+    values = samples["values"]
+    return {
+        "ticks_ms": samples["ticks_ms"],
+        "left": values[:, 0],
+        "front": values[:, 1],
+        "right": values[:, 2],
+        "heading": values[:, 3] / 10,
+        "x": values[:, 4],
+        "y": values[:, 5],
+        "z": values[:, 6],
+    }
+
+
+# Define the `summary` function
+def summary(records: np.ndarray) -> dict:
+    # Summarize a flight log: duration, record counts per kind and state and the closest front range
+    if len(records) == 0:
+        return {"records": 0}
+    # `ticks_ms` wraps around after `TICKS_PERIOD`, so accumulate the wrapped differences
+    duration = int(np.sum(np.diff(records["ticks_ms"].astype(np.int64)) % TICKS_PERIOD))
+    states = records["code"][records["kind"] == 3]
+    front = sensors(records)["front"]
+    return {
+        "records": len(records),
+        "duration": duration / 1000,
+        "kinds": {name: int(np.sum(records["kind"] == kind)) for kind, name in KINDS.items()},
+        "states": {STATES.get(int(code), str(code)): int(count) for code, count in zip(*np.unique(states, return_counts=True))},
+        "min_front": int(front[front > 0].min()) if np.any(front > 0) else None,
+    }
@@ -0,0 +1,79 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary modules
+import asyncio
+import struct
+import time
+import zlib
+from hashlib import sha256
+
+from src.ota import FirmwareUpdate
+
+
+# Define the `__next_ack__` function
+async def __next_ack__(client) -> dict:
+    # Wait for the next firmware update acknowledgement, skipping the other notifications
+    while True:
+        message = await client.notifications.get()
+        if "ota_ack" in message:
+            return message["ota_ack"]
+
+
+# Define the `send_firmware` function
+async def send_firmware(client, data: bytes, window: int | None = None, ack_timeout: float = 1.0, retries: int = 5) -> dict:
+    # Send the firmware bundle `data` over the connected `client` (see `tools/client.py`): the robot resumes from
+    # the offset it acknowledged last, up to a window of frames is in flight, and the sender goes back to the
+    # acknowledged offset when a frame is lost or no acknowledgement arrives in time
+    fields = {"size": len(data), "sha256": sha256(data).hexdigest()}
+    if window is not None:
+        fields["window"] = window
+    response = await client.request("ota_begin", **fields)
+    if "ota_error" in response:
+        raise RuntimeError(response["ota_error"])
+    ready = response["ota_ready"]
+    chunk_size = ready["chunk_size"]
+    in_flight = ready["window"] * chunk_size
+    acked = sent = resumed = ready["offset"]
+    frames = resends = timeouts = stalls = 0
+
+    start = time.perf_counter()
+    while acked < len(data):
+        # Fill the window, then wait for the next acknowledgement
+        while sent < len(data) and sent - acked < in_flight:
+            payload = data[sent : sent + chunk_size]
+            header = struct.pack(FirmwareUpdate.FRAME_FORMAT, FirmwareUpdate.FRAME_MARKER, sent, len(payload), zlib.crc32(payload))
+            await client.transport.send(header + payload, response=False)
+            sent += len(payload)
+            frames += 1
+        try:
+            ack = await asyncio.wait_for(__next_ack__(client), ack_timeout)
+        except asyncio.TimeoutError:
+            stalls += 1
+            timeouts += 1
+            if stalls > retries:
+                raise RuntimeError(f"No acknowledgement after {retries} retries (acknowledged {acked} of {len(data)} bytes)")
+            sent = acked
+            continue
+        stalls = 0
+        if ack["resend"]:
+            resends += 1
+            acked = sent = ack["offset"]
+        else:
+            acked = max(acked, ack["offset"])
+    elapsed = time.perf_counter() - start
+
+    response = await client.request("ota_finish")
+    if "ota_error" in response:
+        raise RuntimeError(response["ota_error"])
+    return {
+        "bytes": len(data) - resumed,
+        "resumed_from": resumed,
+        "seconds": elapsed,
+        "kb_per_second": (len(data) - resumed) / 1024 / elapsed if elapsed else 0.0,
+        "frames": frames,
+        "resends": resends,
+        "timeouts": timeouts,
+        "files": response["ota_done"]["files"],
+    }
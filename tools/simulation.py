@@ -0,0 +1,595 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary modules
+import itertools
+import math
+import random
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from src.stall import StallDetector, StallError
+
+# Define the robot geometry (in mm) and the PWM-to-velocity model of the motors
+ROBOT_RADIUS = 150
+WHEEL_BASE = 230
+BRUSH_WIDTH = 260
+LANE_OVERLAP = 20
+MOTOR_DEADBAND = 10
+MOTOR_GAIN = 7.0
+
+# Define the ultrasonic sensor model (see `UltrasonicSensor` in `src/sensors.py`)
+PULSE_COUNT = 5
+ECHO_TIMEOUT_US = 30000
+ECHO_US_PER_MM = 5.82
+TIMEOUT_DISTANCE_MM = 2500
+SENSOR_NOISE_MM = 5.0
+
+# Define the wall following defaults of the edge mode (see `CleaningRobot.__follow_perimeter__`)
+EDGE_DISTANCE = 100
+EDGE_KP = 0.2
+EDGE_KD = 0.1
+EDGE_LOST_READINGS = 3
+EDGE_D_FILTER = 0.6
+EDGE_MAX_STEER = 0.15
+
+# Define the stall recovery manoeuvre (in seconds, see `CleaningRobot.__recover_stall__`)
+STALL_BACK_OFF = 0.4
+STALL_PIVOT = 0.3
+
+# Define the control loop timing (in seconds) and the heading tolerance of `__turn__`
+LOOP_SLEEP = 0.01
+MAGNETOMETER_READ_TIME = 0.0005
+HEADING_TOLERANCE = 3
+
+# Define the grid resolution of the simulated rooms (in mm)
+CELL_SIZE = 50
+
+# Define the parameter names and the default search space of the autotuner
+PARAMETERS = (
+    "drive_speed",
+    "turn_speed",
+    "front_distance",
+    "side_distance",
+    "turn_distance",
+)
+PARAMETER_SPACE = {
+    "drive_speed": (35, 45, 55, 65),
+    "turn_speed": (45, 60, 75),
+    "front_distance": (250, 400, 550),
+    "side_distance": (150, 200, 300),
+    "turn_distance": (350, 450, 600),
+}
+
+
+# Define the `Room` class
+class Room:
+    # Define the `__init__` method
+    def __init__(self, width: int, height: int, obstacles: list[tuple[int, int, int, int]]):
+        # Rasterize the walls and the rectangular obstacles (x, y, w, h in mm) into an occupancy grid
+        self.width = width
+        self.height = height
+        self.obstacles = obstacles
+        self.grid = np.zeros(
+            (math.ceil(height / CELL_SIZE), math.ceil(width / CELL_SIZE)),
+            dtype=bool,
+        )
+        self.grid[0, :] = self.grid[-1, :] = True
+        self.grid[:, 0] = self.grid[:, -1] = True
+        for x, y, w, h in obstacles:
+            self.grid[
+                y // CELL_SIZE : math.ceil((y + h) / CELL_SIZE),
+                x // CELL_SIZE : math.ceil((x + w) / CELL_SIZE),
+            ] = True
+
+    # Define the `generate` class method
+    @classmethod
+    def generate(cls, seed: int):
+        # Generate a random room layout from the given `seed`
+        rng = random.Random(seed)
+        width = rng.randrange(3000, 6001, CELL_SIZE)
+        height = rng.randrange(3000, 6001, CELL_SIZE)
+        obstacles = []
+        for _ in range(rng.randint(0, 4)):
+            w = rng.randrange(300, 901, CELL_SIZE)
+            h = rng.randrange(300, 901, CELL_SIZE)
+            obstacles.append(
+                (
+                    rng.randrange(CELL_SIZE, width - w, CELL_SIZE),
+                    rng.randrange(CELL_SIZE, height - h, CELL_SIZE),
+                    w,
+                    h,
+                )
+            )
+        return cls(width, height, obstacles)
+
+    # Define the `is_blocked` method
+    def is_blocked(self, x: float, y: float) -> bool:
+        # Check if the point (x, y) lies inside a wall or an obstacle
+        row, col = int(y // CELL_SIZE), int(x // CELL_SIZE)
+        if row < 0 or col < 0 or row >= self.grid.shape[0] or col >= self.grid.shape[1]:
+            return True
+        return bool(self.grid[row, col])
+
+    # Define the `raycast` method
+    def raycast(self, x: float, y: float, heading: float, max_range: float) -> float:
+        # Walk along the ray in half-cell steps and return the distance to the first blocked cell
+        dx = math.sin(math.radians(heading)) * CELL_SIZE / 2
+        dy = math.cos(math.radians(heading)) * CELL_SIZE / 2
+        distance = 0.0
+        while distance < max_range:
+            x += dx
+            y += dy
+            distance += CELL_SIZE / 2
+            if self.is_blocked(x, y):
+                return distance
+        return max_range
+
+
+# Define the `SimulatedRobot` class
+class SimulatedRobot:
+    # Define the `__init__` method
+    def __init__(self, room: Room, params: dict, seed: int):
+        # Place the robot on a random free spot and set up the coverage and statistics counters
+        self.room = room
+        self.params = params
+        self.rng = random.Random(seed)
+        self.time = 0.0
+        self.collisions = 0
+        self.stalled_time = 0.0
+        self.left_speed = self.right_speed = 0.0
+        self.travelled = 0.0
+        self.covered = np.zeros(room.grid.shape, dtype=bool)
+        self.__in_contact__ = False
+        self.deadline = math.inf
+        self.grid = None
+        self.start = (0.0, 0.0)
+        self.edge = None
+        self.stall = StallDetector(params)
+        self.__body_offsets__ = self.__disc_offsets__(ROBOT_RADIUS)
+        self.__brush_offsets__ = self.__disc_offsets__(BRUSH_WIDTH / 2)
+        while True:
+            self.x = self.rng.uniform(ROBOT_RADIUS, room.width - ROBOT_RADIUS)
+            self.y = self.rng.uniform(ROBOT_RADIUS, room.height - ROBOT_RADIUS)
+            if not self.__collides__(self.x, self.y):
+                break
+        self.heading = self.rng.uniform(0, 360)
+        self.__mark_coverage__()
+
+    # Define the `__disc_offsets__` method
+    @staticmethod
+    def __disc_offsets__(radius: float):
+        # Return the (row, col) cell offsets of a disc with the given `radius`
+        cells = math.ceil(radius / CELL_SIZE)
+        rows, cols = np.mgrid[-cells : cells + 1, -cells : cells + 1]
+        mask = (rows**2 + cols**2) * CELL_SIZE**2 <= radius**2
+        return rows[mask], cols[mask]
+
+    # Define the `__collides__` method
+    def __collides__(self, x: float, y: float) -> bool:
+        # Check if the robot body at (x, y) overlaps a wall or an obstacle
+        rows = self.__body_offsets__[0] + int(y // CELL_SIZE)
+        cols = self.__body_offsets__[1] + int(x // CELL_SIZE)
+        grid = self.room.grid
+        if rows.min() < 0 or cols.min() < 0:
+            return True
+        if rows.max() >= grid.shape[0] or cols.max() >= grid.shape[1]:
+            return True
+        return bool(grid[rows, cols].any())
+
+    # Define the `__mark_coverage__` method
+    def __mark_coverage__(self):
+        # Mark the cells below the brush as cleaned
+        rows = self.__brush_offsets__[0] + int(self.y // CELL_SIZE)
+        cols = self.__brush_offsets__[1] + int(self.x // CELL_SIZE)
+        valid = (rows >= 0) & (cols >= 0) & (rows < self.covered.shape[0]) & (cols < self.covered.shape[1])
+        self.covered[rows[valid], cols[valid]] = True
+
+    # Define the `wheel_velocity` method
+    @staticmethod
+    def wheel_velocity(speed: float) -> float:
+        # Convert a signed PWM duty (in %) into a wheel velocity (in mm/s)
+        magnitude = max(0.0, abs(speed) - MOTOR_DEADBAND) * MOTOR_GAIN
+        return magnitude if speed >= 0 else -magnitude
+
+    # Define the `advance` method
+    def advance(self, dt: float):
+        # Integrate the differential drive kinematics over `dt` seconds in small sub-steps
+        v_left = self.wheel_velocity(self.left_speed)
+        v_right = self.wheel_velocity(self.right_speed)
+        velocity = (v_left + v_right) / 2
+        yaw_rate = math.degrees((v_left - v_right) / WHEEL_BASE)
+        travel = max(abs(velocity) * dt, math.radians(abs(yaw_rate) * dt) * WHEEL_BASE / 2)
+        steps = max(1, math.ceil(travel / (CELL_SIZE / 2)))
+        step_dt = dt / steps
+        for _ in range(steps):
+            heading = self.heading + yaw_rate * step_dt / 2
+            x = self.x + velocity * math.sin(math.radians(heading)) * step_dt
+            y = self.y + velocity * math.cos(math.radians(heading)) * step_dt
+            if self.__collides__(x, y):
+                # Count a new collision only when the robot was not touching anything before
+                if not self.__in_contact__:
+                    self.collisions += 1
+                self.__in_contact__ = True
+                self.stalled_time += step_dt
+            else:
+                self.__in_contact__ = False
+                self.travelled += abs(velocity) * step_dt
+                self.x, self.y = x, y
+                self.heading = (self.heading + yaw_rate * step_dt) % 360
+                if velocity != 0 or yaw_rate != 0:
+                    self.__mark_coverage__()
+        self.time += dt
+
+    # Define the `get_distance` method
+    def get_distance(self, pulses: dict | None = None) -> dict[str, int]:
+        # Emulate `CleaningRobot.get_distance` (or a sampling policy with the given `pulses` per sensor)
+        # and advance the clock by the time spent waiting for the echoes
+        distance = {}
+        elapsed = 0.0
+        for name, offset in (("left", -90), ("front", 0), ("right", 90)):
+            true_distance = self.room.raycast(self.x, self.y, self.heading + offset, 6000) - ROBOT_RADIUS
+            samples = []
+            for _ in range(pulses[name] if pulses else PULSE_COUNT):
+                echo_us = max(0.0, true_distance + self.rng.gauss(0, SENSOR_NOISE_MM)) * ECHO_US_PER_MM
+                if echo_us > ECHO_TIMEOUT_US:
+                    elapsed += ECHO_TIMEOUT_US / 1e6
+                    samples.append(TIMEOUT_DISTANCE_MM)
+                else:
+                    elapsed += echo_us / 1e6
+                    samples.append(int(echo_us) * 100 // 582)
+            distance[name] = int(sum(samples) / len(samples))
+        self.advance(elapsed)
+        return distance
+
+    # Define the `check_stall` method
+    def check_stall(self, front: int):
+        # Emulate `CleaningRobot.__check_stall__` and `__recover_stall__`: back off and pivot away from a stall,
+        # raising a `StallError` once the robot stays stuck after the allowed attempts
+        v_left = self.wheel_velocity(self.left_speed)
+        v_right = self.wheel_velocity(self.right_speed)
+        kind = self.stall.update(
+            int(self.time * 1000),
+            # A timed out echo reads as beyond the range in the firmware, which the detector does not judge
+            front if front != TIMEOUT_DISTANCE_MM else StallDetector.VALID_RANGE,
+            self.heading,
+            (v_left + v_right) / 2,
+            math.degrees((v_left - v_right) / WHEEL_BASE),
+        )
+        if not kind:
+            return False
+        attempt = self.stall.consecutive
+        if attempt > self.stall.attempts:
+            self.left_speed = self.right_speed = 0.0
+            self.stall.recovered(0, False)
+            raise StallError(f"Still stuck after {self.stall.attempts} recovery attempts")
+        left_speed, right_speed = self.left_speed, self.right_speed
+        start = self.time
+        speed = self.params["drive_speed"]
+        self.left_speed = self.right_speed = -speed
+        self.advance(STALL_BACK_OFF)
+        self.left_speed, self.right_speed = (-speed, speed) if attempt % 2 else (speed, -speed)
+        self.advance(STALL_PIVOT)
+        self.left_speed, self.right_speed = left_speed, right_speed
+        self.stall.reset()
+        self.stall.recovered(round((self.time - start) * 1000), True)
+        return True
+
+    # Define the `turn` method
+    def turn(self, degrees: float, speed: int, smooth: bool = False):
+        # Emulate `CleaningRobot.__turn__`
+        target_heading = (self.heading + degrees) % 360
+        if degrees < 0:
+            self.left_speed, self.right_speed = (0 if smooth else -speed), speed
+        else:
+            self.left_speed, self.right_speed = speed, (0 if smooth else -speed)
+        while self.time < self.deadline:
+            self.advance(MAGNETOMETER_READ_TIME)
+            if abs((target_heading - self.heading + 180) % 360 - 180) < HEADING_TOLERANCE:
+                break
+            if self.check_stall(TIMEOUT_DISTANCE_MM) and smooth:
+                # Resume the turn on the spot
+                self.left_speed, self.right_speed = (-speed, speed) if degrees < 0 else (speed, -speed)
+            self.advance(LOOP_SLEEP)
+        self.left_speed = self.right_speed = 0.0
+
+    # Define the `turn_to` method
+    def turn_to(self, heading: float, speed: int):
+        # Emulate `CleaningRobot.__turn_to__`
+        diff = (heading - self.heading + 180) % 360 - 180
+        if abs(diff) >= HEADING_TOLERANCE:
+            self.turn(diff, speed)
+
+    # Define the `drive_lane` method
+    def drive_lane(self, speed: int, front_distance: int, max_distance: float | None = None):
+        # Emulate `CleaningRobot.__drive_lane__`, feeding the robot's map if there is one
+        limit = max_distance if max_distance is not None else math.inf
+        travelled = 0.0
+        distance = self.get_distance()
+        self.observe(distance)
+        self.left_speed = self.right_speed = speed
+        while distance["front"] > front_distance and travelled < limit and self.time < self.deadline:
+            x, y = self.x, self.y
+            distance = self.get_distance()
+            self.check_stall(distance["front"])
+            self.advance(LOOP_SLEEP)
+            travelled += math.hypot(self.x - x, self.y - y)
+            self.observe(distance)
+        return distance, travelled
+
+    # Define the `observe` method
+    def observe(self, distance: dict):
+        # Feed a distance reading into the robot's map (if it keeps one), like `CleaningRobot.__track__`
+        if self.grid is not None:
+            # The simulated robot knows its true pose relative to the start position
+            position = (self.x - self.start[0], self.y - self.start[1])
+            self.grid.update(position[0], position[1], self.heading, distance)
+            self.grid.mark_covered(position[0], position[1], BRUSH_WIDTH // 2)
+
+    # Define the `survey` method
+    def survey(self, speed: int):
+        # Emulate `CleaningRobot.__survey__`
+        for _ in range(4):
+            self.observe(self.get_distance())
+            self.turn(90, speed)
+
+    # Define the `reactive_turn` method
+    def reactive_turn(self, distance: dict, last_direction: str) -> str:
+        # Emulate `CleaningRobot.__reactive_turn__`
+        p = self.params
+        if last_direction == "left" and distance["right"] >= p["side_distance"]:
+            smooth = distance["right"] > p["turn_distance"]
+            self.turn(180, p["turn_speed"] if smooth else p["drive_speed"], smooth)
+            return "right"
+        elif last_direction == "right" and distance["left"] >= p["side_distance"]:
+            smooth = distance["left"] > p["turn_distance"]
+            self.turn(-180, p["turn_speed"] if smooth else p["drive_speed"], smooth)
+            return "left"
+        return last_direction
+
+    # Define the `run` method
+    def run(self, duration: float, mode: str = "reactive"):
+        # Emulate `CleaningRobot.__routine__` in the given `mode` for at most `duration` seconds
+        self.deadline = duration
+        self.grid = None
+        try:
+            if mode == "boustrophedon":
+                self.run_boustrophedon()
+            elif mode == "edge":
+                self.run_edge()
+            else:
+                self.run_reactive()
+        except StallError:
+            # The firmware abandons the routine, so the rest of the run cleans nothing
+            self.left_speed = self.right_speed = 0.0
+
+    # Define the `run_reactive` method
+    def run_reactive(self):
+        # Emulate the reactive loop of `CleaningRobot.__routine__`
+        last_direction = "left"
+        while self.time < self.deadline:
+            distance, _ = self.drive_lane(self.params["drive_speed"], self.params["front_distance"])
+            self.left_speed = self.right_speed = 0.0
+            last_direction = self.reactive_turn(distance, last_direction)
+            self.advance(LOOP_SLEEP)
+
+    # Define the `run_boustrophedon` method
+    def run_boustrophedon(self):
+        # Emulate `CleaningRobot.__boustrophedon_routine__` with the firmware's map and planner
+        from src.mapping import OccupancyGrid
+        from src.planning import BoustrophedonPlanner
+
+        p = self.params
+        self.grid = OccupancyGrid()
+        self.start = (self.x, self.y)
+        planner = BoustrophedonPlanner(self.grid, BRUSH_WIDTH - LANE_OVERLAP)
+        last_direction = "left"
+        self.survey(p["drive_speed"])
+        planner.reset(0, 0, self.heading)
+        self.turn_to(planner.axis, p["drive_speed"])
+        while self.time < self.deadline:
+            planner.begin_lane(self.x - self.start[0], self.y - self.start[1], self.heading)
+            distance, _ = self.drive_lane(p["drive_speed"], p["front_distance"])
+            self.left_speed = self.right_speed = 0.0
+            planner.end_lane()
+
+            step = planner.next_step(self.x - self.start[0], self.y - self.start[1])
+            if step is None:
+                break
+            if step["kind"] == "shift":
+                self.turn(step["turn"], p["drive_speed"])
+                distance = self.get_distance()
+                if distance["front"] < step["distance"] + p["side_distance"]:
+                    planner.skip(step)
+                    self.turn(-step["turn"], p["drive_speed"])
+                    last_direction = self.reactive_turn(self.get_distance(), last_direction)
+                    continue
+                self.drive_lane(p["drive_speed"], p["front_distance"], step["distance"])
+                self.left_speed = self.right_speed = 0.0
+                self.turn(step["turn"], p["drive_speed"])
+            else:
+                self.turn_to(step["bearing"], p["drive_speed"])
+                distance, travelled = self.drive_lane(p["drive_speed"], p["front_distance"], step["distance"])
+                self.left_speed = self.right_speed = 0.0
+                if travelled < step["distance"] - BRUSH_WIDTH:
+                    planner.skip(step)
+                    last_direction = self.reactive_turn(distance, last_direction)
+                    continue
+                self.turn_to(step["heading"], p["drive_speed"])
+
+    # Define the `run_edge` method
+    def run_edge(self):
+        # Emulate `CleaningRobot.__edge_routine__`: find a wall, put it on the side with less room and follow it
+        p = self.params
+        corner = p.get("edge_distance", EDGE_DISTANCE) + BRUSH_WIDTH // 2
+        distance, _ = self.drive_lane(p["drive_speed"], corner)
+        self.left_speed = self.right_speed = 0.0
+        side = "right" if distance["left"] >= distance["right"] else "left"
+        self.turn(-90 if side == "right" else 90, p["drive_speed"])
+        self.follow_perimeter(side)
+
+    # Define the `follow_perimeter` method
+    def follow_perimeter(self, side: str):
+        # Emulate `CleaningRobot.__follow_perimeter__` and keep its statistics in `self.edge`
+        p = self.params
+        speed = p["drive_speed"]
+        edge_distance = p.get("edge_distance", EDGE_DISTANCE)
+        kp = p.get("edge_kp", EDGE_KP)
+        kd = p.get("edge_kd", EDGE_KD)
+        sign = 1 if side == "right" else -1
+        corner = edge_distance + BRUSH_WIDTH // 2
+        clearance = edge_distance + BRUSH_WIDTH
+        start_x, start_y, start_time = self.x, self.y, self.time
+        last_x, last_y, last_heading = self.x, self.y, self.heading
+        perimeter = turned = 0.0
+        inside = outside = 0
+        closed = False
+        last_error = None
+        last_time = self.time
+        derivative = 0.0
+        lost = 0
+        # Sample like the `following` policy of the firmware (fewer pulses, so the loop runs faster)
+        pulses = {"left": 2, "front": 1, "right": 2}
+        while self.time < self.deadline:
+            distance = self.get_distance(pulses)
+            perimeter += math.hypot(self.x - last_x, self.y - last_y)
+            turned += (self.heading - last_heading + 180) % 360 - 180
+            last_x, last_y, last_heading = self.x, self.y, self.heading
+            if abs(turned) >= 330 and perimeter > 4 * BRUSH_WIDTH and math.hypot(self.x - start_x, self.y - start_y) < BRUSH_WIDTH:
+                closed = True
+                break
+            if abs(turned) >= 450:
+                break
+            if self.check_stall(distance["front"]):
+                last_error = None
+                lost = 0
+                continue
+            if distance["front"] <= corner:
+                self.left_speed = self.right_speed = 0.0
+                self.turn(-90 * sign, speed)
+                inside += 1
+                last_error = None
+                continue
+            lost = lost + 1 if distance[side] > clearance else 0
+            if lost >= EDGE_LOST_READINGS:
+                lost = 0
+                self.drive_lane(speed, corner, clearance)
+                self.left_speed = self.right_speed = 0.0
+                self.turn(90 * sign, speed)
+                self.drive_lane(speed, corner, clearance)
+                outside += 1
+                last_error = None
+                continue
+            if lost:
+                # Keep the course until the wall is confirmed lost
+                self.advance(LOOP_SLEEP)
+                continue
+            error = distance[side] - edge_distance
+            if last_error is None:
+                derivative = 0.0
+            else:
+                rate = (error - last_error) / max(1e-3, self.time - last_time)
+                derivative += EDGE_D_FILTER * (rate - derivative)
+            last_error, last_time = error, self.time
+            steer = max(-speed * EDGE_MAX_STEER, min(speed * EDGE_MAX_STEER, kp * error))
+            correction = max(-speed, min(speed, steer + kd * derivative))
+            self.left_speed = speed + sign * correction
+            self.right_speed = speed - sign * correction
+            self.advance(LOOP_SLEEP)
+        self.left_speed = self.right_speed = 0.0
+        self.edge = {
+            "perimeter_mm": perimeter,
+            "duration": self.time - start_time,
+            "inside_corners": inside,
+            "outside_corners": outside,
+            "closed": closed,
+        }
+
+    # Define the `statistics` method
+    def statistics(self) -> dict[str, float]:
+        # Compute the coverage, redundancy and collision statistics of the run
+        # (redundancy is the area swept by the brush divided by the distinct area it cleaned)
+        free = ~self.room.grid
+        covered = self.covered & free
+        covered_area = covered.sum() * CELL_SIZE**2 / 1e6
+        swept_area = self.travelled * BRUSH_WIDTH / 1e6
+        return {
+            "coverage": float(covered.sum() / free.sum()),
+            "coverage_rate": float(covered_area / (self.time / 60)),
+            "cleaning_time": float(self.time),
+            "redundancy": float(swept_area / covered_area) if covered_area else 0.0,
+            "collisions": float(self.collisions),
+            "stalled_time": float(self.stalled_time),
+            "stalls": float(self.stall.stats["events"]),
+        }
+
+
+# Define the `simulate` function
+def simulate(
+    params: dict,
+    room_seed: int,
+    duration: float = 300.0,
+    mode: str = "reactive",
+) -> dict[str, float]:
+    # Run the cleaning routine in `mode` with `params` in the room generated from `room_seed`
+    robot = SimulatedRobot(Room.generate(room_seed), params, seed=room_seed)
+    robot.run(duration, mode)
+    return robot.statistics()
+
+
+# Define the `__simulate_job__` helper (top-level, so that it can be pickled by the process pool)
+def __simulate_job__(job: tuple[dict, int, float, str]) -> dict[str, float]:
+    return simulate(*job)
+
+
+# Define the `parameter_grid` function
+def parameter_grid(space: dict | None = None) -> list[dict]:
+    # Expand the search `space` into all valid parameter combinations
+    space = space or PARAMETER_SPACE
+    combos = [dict(zip(PARAMETERS, values)) for values in itertools.product(*(space[p] for p in PARAMETERS))]
+    # A smooth turn needs more room than a pivot turn, so `turn_distance` must not be below `side_distance`
+    return [c for c in combos if c["turn_distance"] >= c["side_distance"]]
+
+
+# Define the `pareto_front` function
+def pareto_front(coverage: np.ndarray, collisions: np.ndarray) -> np.ndarray:
+    # Return the indices of the combinations not dominated in (max coverage, min collisions)
+    better_or_equal = (coverage[None, :] >= coverage[:, None]) & (collisions[None, :] <= collisions[:, None])
+    strictly_better = (coverage[None, :] > coverage[:, None]) | (collisions[None, :] < collisions[:, None])
+    dominated = (better_or_equal & strictly_better).any(axis=1)
+    return np.flatnonzero(~dominated)
+
+
+# Define the `sweep` function
+def sweep(
+    combos: list[dict],
+    room_seeds: list[int],
+    duration: float = 300.0,
+    workers: int | None = None,
+    mode: str = "reactive",
+) -> dict[str, np.ndarray]:
+    # Simulate every combination in every room in a process pool and stack the results per metric
+    jobs = [(params, seed, duration, mode) for params in combos for seed in room_seeds]
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        results = list(executor.map(__simulate_job__, jobs, chunksize=max(1, len(jobs) // 256)))
+    return {
+        metric: np.array([r[metric] for r in results]).reshape(len(combos), len(room_seeds))
+        for metric in results[0]
+    }
+
+
+# Define the `select_best` function
+def select_best(stats: dict[str, np.ndarray]) -> tuple[int, np.ndarray]:
+    # Pick the Pareto-optimal combination closest to the utopia point (full coverage, no collisions)
+    coverage = stats["coverage"].mean(axis=1)
+    collisions = stats["collisions"].mean(axis=1)
+    front = pareto_front(coverage, collisions)
+    span_coverage = np.ptp(coverage[front]) or 1.0
+    span_collisions = np.ptp(collisions[front]) or 1.0
+    distance = np.hypot(
+        (coverage[front].max() - coverage[front]) / span_coverage,
+        (collisions[front] - collisions[front].min()) / span_collisions,
+    )
+    return int(front[np.argmin(distance)]), front
@@ -0,0 +1,174 @@
+# Copyright (c) 2024 Kaan Gönüldinc
+# This file is part of SmartSweep Precision.
+# It is subject to the terms and conditions of the CC BY-NC-ND 4.0 license.
+
+# Import the necessary modules
+import json
+import os
+import shutil
+from concurrent.futures import ThreadPoolExecutor
+from hashlib import sha256
+
+# Define the name of the manifest kept in the root of the board drive and the hashing block size
+MANIFEST_NAME = ".sync_manifest.json"
+MANIFEST_VERSION = 1
+BLOCK_SIZE = 1 << 16
+
+
+# Define the `hash_file` function
+def hash_file(path: str) -> str:
+    # Return the SHA-256 hex digest of the file at `path`
+    digest = sha256()
+    with open(path, "rb") as f:
+        while block := f.read(BLOCK_SIZE):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# Define the `hash_files` function
+def hash_files(root: str, paths: list, workers: int | None = None) -> dict:
+    # Hash the files (relative to `root`) in parallel, returning {path: digest}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        digests = executor.map(hash_file, (os.path.join(root, path) for path in paths))
+        return dict(zip(paths, digests))
+
+
+# Define the `walk` function
+def walk(root: str, exclude_files: list, exclude_dirs: list) -> dict:
+    # Return {relative path (with '/' separators): size} of the files under `root`, skipping the excluded ones
+    files = {}
+    for current, dirs, names in os.walk(root):
+        dirs[:] = [d for d in dirs if d not in exclude_dirs]
+        for name in names:
+            if name in exclude_files or name == MANIFEST_NAME:
+                continue
+            path = os.path.join(current, name)
+            files[os.path.relpath(path, root).replace(os.sep, "/")] = os.path.getsize(path)
+    return files
+
+
+# Define the `scan_directory` function
+def scan_directory(root: str, exclude_files: list, exclude_dirs: list, workers: int | None = None) -> dict:
+    # Return {path: {"sha256", "size"}} of the files under `root`, hashed in parallel
+    sizes = walk(root, exclude_files, exclude_dirs)
+    hashes = hash_files(root, list(sizes), workers)
+    return {path: {"sha256": hashes[path], "size": size} for path, size in sizes.items()}
+
+
+# Define the `scan_zip` function
+def scan_zip(zipf) -> dict:
+    # Return {path: {"sha256", "size"}} of the files in the `zipf` archive, taken from the manifest
+    # written by `build` (so no member has to be read) or hashed member by member for older archives
+    names = [info.filename for info in zipf.infolist() if not info.is_dir() and info.filename != MANIFEST_NAME]
+    if MANIFEST_NAME in zipf.namelist():
+        manifest = json.loads(zipf.read(MANIFEST_NAME))
+        if all(name in manifest for name in names):
+            return {name: manifest[name] for name in names}
+    files = {}
+    for name in names:
+        digest = sha256()
+        with zipf.open(name) as f:
+            while block := f.read(BLOCK_SIZE):
+                digest.update(block)
+        files[name] = {"sha256": digest.hexdigest(), "size": zipf.getinfo(name).file_size}
+    return files
+
+
+# Define the `load_manifest` function
+def load_manifest(device_dir: str) -> dict | None:
+    # Return the {path: {"sha256", "size", "mtime"}} manifest of the drive, `None` if it is missing or unreadable
+    try:
+        with open(os.path.join(device_dir, MANIFEST_NAME)) as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+    if manifest.get("version") != MANIFEST_VERSION:
+        return None
+    return manifest.get("files", {})
+
+
+# Define the `write_manifest` function
+def write_manifest(device_dir: str, files: dict):
+    # Write the manifest next to the old one and swap it in, so an unplugged drive never holds half a manifest
+    path = os.path.join(device_dir, MANIFEST_NAME)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"version": MANIFEST_VERSION, "files": files}, f, separators=(",", ":"))
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(path + ".tmp", path)
+
+
+# Define the `plan` function
+def plan(source: dict, device_dir: str, exclude_files: list, exclude_dirs: list, verify: bool = False, workers: int | None = None) -> dict:
+    # Compare the `source` files (see `scan_directory` and `scan_zip`) with the drive and return the files
+    # to copy, delete and keep. Without `verify`, a drive file is trusted to match the manifest while its size
+    # and modification time do; with it (or without a manifest) the drive files are hashed as well
+    local = {path: entry["size"] for path, entry in source.items()}
+    local_hashes = {path: entry["sha256"] for path, entry in source.items()}
+    manifest = load_manifest(device_dir)
+    device = walk(device_dir, exclude_files, exclude_dirs)
+
+    # Find the drive files whose content is known without reading them
+    known = {}
+    if manifest is not None and not verify:
+        for path, entry in manifest.items():
+            if path not in device:
+                continue
+            stat = os.stat(os.path.join(device_dir, path))
+            if stat.st_size == entry["size"] and int(stat.st_mtime) == entry["mtime"]:
+                known[path] = entry["sha256"]
+    unknown = [path for path in device if path in local and path not in known]
+    known.update(hash_files(device_dir, unknown, workers))
+
+    copy = sorted(path for path in local if known.get(path) != local_hashes[path])
+    keep = sorted(path for path in local if known.get(path) == local_hashes[path])
+    delete = sorted(path for path in device if path not in local)
+    return {
+        "copy": copy,
+        "delete": delete,
+        "keep": keep,
+        "hashes": local_hashes,
+        "sizes": local,
+        "verified": manifest is None or verify,
+    }
+
+
+# Define the `apply` function
+def apply(open_source, device_dir: str, changes: dict, exclude_dirs: list, verify: bool = False) -> dict:
+    # Copy the changed files (opened in binary mode with `open_source(path)`), delete the removed ones
+    # (and the directories they leave empty), then write the new manifest.
+    # Returns a summary of the work done and the bytes saved
+    for path in changes["delete"]:
+        os.remove(os.path.join(device_dir, path))
+    for current, dirs, names in os.walk(device_dir, topdown=False):
+        if current == device_dir or set(os.path.relpath(current, device_dir).split(os.sep)) & set(exclude_dirs):
+            continue
+        if not os.listdir(current):
+            os.rmdir(current)
+
+    written = 0
+    for path in changes["copy"]:
+        target = os.path.join(device_dir, path)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        with open_source(path) as src, open(target, "wb") as dst:
+            shutil.copyfileobj(src, dst, BLOCK_SIZE)
+        written += changes["sizes"][path]
+        if verify and hash_file(target) != changes["hashes"][path]:
+            raise OSError(f"Verification failed for '{path}'")
+
+    # Record the size and modification time as written by the drive, so the next sync can trust them
+    files = {}
+    for path, digest in changes["hashes"].items():
+        stat = os.stat(os.path.join(device_dir, path))
+        files[path] = {"sha256": digest, "size": stat.st_size, "mtime": int(stat.st_mtime)}
+    write_manifest(device_dir, files)
+
+    total = sum(changes["sizes"].values())
+    return {
+        "copied": len(changes["copy"]),
+        "deleted": len(changes["delete"]),
+        "unchanged": len(changes["keep"]),
+        "bytes_written": written,
+        "bytes_total": total,
+        "bytes_saved": total - written,
+    }